@@ -0,0 +1,72 @@
+"""
+Compares the buoy detection backends on this machine (run on the Pi from the sailbot folder)
+    python3 CV/detection_benchmark.py [image] [--frames N] [--backends ultralytics onnx]
+
+Each backend runs in its own process so the peak memory (RSS) reported is only that backend's
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import statistics
+import sys
+import time
+
+sys.path.append(os.getcwd())  # run from the sailbot folder so constants can find config.ini
+
+
+def run_backend(backend, weights, image_path, frames, results):
+    import cv2
+    import objectDetection
+
+    image = cv2.imread(image_path)
+    start = time.perf_counter()
+    model = objectDetection.load_model(weights, warmup=True, backend=backend)
+    load_time = time.perf_counter() - start
+
+    conf = float(objectDetection.c.config["OBJECTDETECTION"]["conf_thresh"])
+    latencies = []
+    for _ in range(frames):
+        start = time.perf_counter()
+        detections = model.detect(image, conf)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    latencies.sort()
+    results[backend] = {
+        "load": load_time,
+        "mean": statistics.mean(latencies),
+        "p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+        "rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,  # KiB on linux
+        "detections": [(d.x, d.y, d.w, d.h, d.conf) for d in sorted(detections, key=lambda d: d.conf, reverse=True)],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark buoy detection backends")
+    parser.add_argument("image", nargs="?", default="CV/test_buoy.jpg")
+    parser.add_argument("--frames", type=int, default=50)
+    parser.add_argument("--backends", nargs="+", default=["ultralytics", "onnx"])
+    parser.add_argument("--onnx-weights", default=None, help="defaults to [OBJECTDETECTION] onnx_weights")
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Manager().dict()
+    for backend in args.backends:
+        weights = args.onnx_weights if backend == "onnx" else None
+        process = ctx.Process(target=run_backend, args=(backend, weights, args.image, args.frames, results))
+        process.start()
+        process.join()
+        if process.exitcode != 0:
+            print(f"{backend}: failed (exit code {process.exitcode})")
+
+    print(f"{'backend':<12}{'load s':>8}{'mean ms':>10}{'p95 ms':>10}{'peak RSS MB':>13}  detections")
+    for backend, result in results.items():
+        print(f"{backend:<12}{result['load']:>8.2f}{result['mean']:>10.1f}{result['p95']:>10.1f}{result['rss']:>13.0f}  {result['detections']}")
+
+    if len(results) > 1:
+        outputs = [result["detections"] for result in results.values()]
+        print("Detections match" if all(output == outputs[0] for output in outputs) else "Detections differ (small box/confidence changes are expected from int8 weights)")
+
+
+if __name__ == "__main__":
+    main()
@@ -19,9 +19,13 @@ from time import sleep
 from inputs import get_gamepad
 
 import math
+import os
 
 import serial
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # telemetryFrame.py is shared with the boat
+from telemetryFrame import TelemetryStream, TelemetryData
+
 #TODO:
 #add mode section along with fields for needed inputted variables (ex buoy coords for search)
 #add subsections
@@ -127,36 +131,28 @@ class MyServer(Server):
 
 def server_update():
     global RUN_THREAD, DATA_REFRESH, BOAT_DATA, ARDUINO  # global boolean var to stop the tread from anywhere
+    stream = TelemetryStream()  # splits the serial bytes into binary telemetry frames and text messages
     while RUN_THREAD:  # repeatedly pumps the server
 
         if ARDUINO:
-            message = str(ARDUINO.read())[2:-5]
-            if message.split(' ', 1)[0] == 'cfg':
-                BOAT_DATA.config.append(message.split(' ', 1)[1])
-                BOAT_DATA.configChanged = True
-                if DATA_REFRESH:
-                    DATA_REFRESH()
-            
-            elif message.split(' ', 1)[0] == 'DATA:':
-                datalist = message.split(' ', 1)[1].split(', ')
-                for i in range(8):
-                    if datalist[i] == "N/a":
-                        datalist[i] = None
-
-                BOAT_DATA.gps = ( int(datalist[0]), int(datalist[1]) )  #should this be a float?
-                BOAT_DATA.rudder_pos = datalist[2]
-                BOAT_DATA.sail_pos = datalist[3]
-                BOAT_DATA.boat_orient = datalist[4]
-                BOAT_DATA.wind_speed = datalist[5]
-                BOAT_DATA.wind_dir = datalist[6]
-                BOAT_DATA.battery = datalist[7]
-
-                if DATA_REFRESH:
-                    DATA_REFRESH()
-
-            elif message:
-                print(message.split(' ', 1)[0])
-                BOAT_DATA.message = message
+            for message in stream.feed(ARDUINO.read_available()):
+                if isinstance(message, TelemetryData):
+                    if message.lat is not None and message.lon is not None:
+                        BOAT_DATA.gps = (message.lat, message.lon)
+                    BOAT_DATA.rudder_pos = message.rudder
+                    BOAT_DATA.sail_pos = message.sail
+                    BOAT_DATA.boat_orient = message.heading
+                    BOAT_DATA.wind_speed = message.wind_speed
+                    BOAT_DATA.wind_dir = message.wind_dir
+                    BOAT_DATA.battery = message.battery
+
+                elif message.split(' ', 1)[0] == 'cfg':
+                    BOAT_DATA.config.append(message.split(' ', 1)[1])
+                    BOAT_DATA.configChanged = True
+
+                else:
+                    print(message.split(' ', 1)[0])
+                    BOAT_DATA.message = message
 
                 if DATA_REFRESH:
                     DATA_REFRESH()
@@ -919,6 +915,10 @@ class arduino:
         print(message)
         return message
 
+    def read_available(self):
+        # every byte waiting on the port, binary telemetry frames can contain newlines so readline() can't be used
+        return self.ser1.read(self.ser1.in_waiting)
+
 
 def close_app():
     app.quit()
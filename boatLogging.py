@@ -0,0 +1,206 @@
+"""
+Logging backend that keeps file writes out of the control loop, set up by constants.py from [LOGGING] in config.ini
+    - A logging call only puts the record on a queue (QueueHandler), a background QueueListener thread formats it and
+      writes it to the log file, so a slow SD card delays the log file and not the control loop
+    - If the writer falls behind and the queue fills up, records are dropped and counted instead of blocking
+    - Per module levels (module_levels) match the file that made the call, so the existing logging.info() calls on the
+      root logger can be quietened file by file
+    - The last ring_size records (also ones below the file's level) are kept in memory and dumped as JSON lines when an
+      exception goes unhandled, or when dump_ring() is called
+    - Messages are formatted on the writer thread: hot paths should pass arguments instead of building f-strings
+      (logging.debug('rudder %.1f', angle)) so nothing is formatted unless the record is written, and the arguments
+      should be values that won't change afterwards (numbers, strings, tuples)
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from collections import deque
+
+FORMAT = '%(asctime)s,%(msecs)d %(name)s %(levelname)s %(message)s'
+DATE_FORMAT = '%H:%M:%S'
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Puts records on a bounded queue without waiting, counting the ones that don't fit
+
+    Attributes:
+        - dropped (int): records lost because the queue was full
+    """
+    def __init__(self, record_queue):
+        super().__init__(record_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # the default formats the message here, in the caller's thread, leave it to the listener
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class ModuleLevelFilter(logging.Filter):
+    """
+    Passes records at or above the level set for the module (file name without .py) or logger that made them
+
+    Attributes:
+        - level (int): level for modules that aren't listed
+        - levels (dict): module or logger name -> level
+    """
+    def __init__(self, level=logging.DEBUG, levels=None):
+        super().__init__()
+        self.level = level
+        self.levels = levels or {}
+
+    def filter(self, record):
+        level = self.levels.get(record.module, self.levels.get(record.name, self.level))
+        return record.levelno >= level
+
+
+class RingBuffer(logging.Handler):
+    """
+    Keeps the latest records in memory
+
+    Functions:
+        - records() - the buffered records as dicts
+        - dump() - writes them to a JSON lines file
+    """
+    def __init__(self, capacity=2000, level=logging.DEBUG):
+        super().__init__(level)
+        self.buffer = deque(maxlen=capacity)
+
+    def emit(self, record):
+        self.buffer.append(record)
+
+    def records(self):
+        entries = []
+        for record in list(self.buffer):
+            try:
+                message = record.getMessage()
+            except Exception as e:
+                message = f"{record.msg!r} {record.args!r} (couldn't format: {e})"
+            entry = {"time": record.created, "level": record.levelname, "module": record.module, "line": record.lineno,
+                     "thread": record.threadName, "message": message}
+            if record.exc_info:
+                entry["exception"] = logging.Formatter().formatException(record.exc_info)
+            entries.append(entry)
+        return entries
+
+    def dump(self, path):
+        with open(path, "w") as f:
+            for entry in self.records():
+                f.write(json.dumps(entry, default=str) + "\n")
+        return path
+
+
+_listener = None
+_queue_handler = None
+_ring = None
+_crash_dir = "."
+
+
+def level_number(name):
+    """'debug' -> 10"""
+    level = logging.getLevelName(name.strip().upper())
+    if not isinstance(level, int):
+        raise ValueError(f"Unknown log level {name!r}")
+    return level
+
+
+def parse_levels(text):
+    """'boatMain:INFO, drivers:WARNING' -> {'boatMain': 20, 'drivers': 30}"""
+    levels = {}
+    for item in text.split(","):
+        if item.strip():
+            name, level = item.split(":")
+            levels[name.strip()] = level_number(level)
+    return levels
+
+
+def setup(config):
+    """Routes the root logger through the queue and ring buffer, only the first call does anything
+    Args:
+        - config (configparser.ConfigParser): the [LOGGING] section is used
+    """
+    global _listener, _queue_handler, _ring, _crash_dir
+    if _listener is not None:
+        return
+    section = config["LOGGING"]
+    level = level_number(section["level"])
+    ring_level = level_number(section["ring_level"])
+    levels = parse_levels(section["module_levels"])
+    _crash_dir = section["crash_dir"]
+
+    file_handler = logging.FileHandler(section["path"], mode="a")
+    file_handler.setFormatter(logging.Formatter(FORMAT, datefmt=DATE_FORMAT))
+    _queue_handler = DroppingQueueHandler(queue.Queue(int(section["queue_size"])))
+    _queue_handler.addFilter(ModuleLevelFilter(level, levels))
+    _ring = RingBuffer(int(section["ring_size"]), ring_level)
+
+    root = logging.getLogger()
+    root.setLevel(min([level, ring_level] + list(levels.values())))
+    root.addHandler(_queue_handler)
+    root.addHandler(_ring)
+    _listener = logging.handlers.QueueListener(_queue_handler.queue, file_handler)
+    _listener.start()
+    atexit.register(stop)
+
+    previous_hook = sys.excepthook
+    def excepthook(kind, value, traceback):
+        _log_crash((kind, value, traceback), "main thread")
+        previous_hook(kind, value, traceback)
+    sys.excepthook = excepthook
+
+    previous_thread_hook = threading.excepthook
+    def thread_excepthook(args):
+        _log_crash((args.exc_type, args.exc_value, args.exc_traceback), f"thread {getattr(args.thread, 'name', '?')}")
+        previous_thread_hook(args)
+    threading.excepthook = thread_excepthook
+
+
+def _log_crash(exc_info, where):
+    if issubclass(exc_info[0], KeyboardInterrupt):
+        return
+    logging.critical(f"Unhandled exception in {where}", exc_info=exc_info)
+    dump_ring()
+
+
+def dump_ring(path=None):
+    """Writes the recent records to 'path' (crash_dir/crash_<time>.jsonl by default)
+    Returns:
+        - the path written, None if logging isn't set up or the dump failed
+    """
+    if _ring is None:
+        return None
+    if path is None:
+        os.makedirs(_crash_dir, exist_ok=True)
+        path = os.path.join(_crash_dir, time.strftime("crash_%Y%m%d-%H%M%S.jsonl"))
+    try:
+        _ring.dump(path)
+    except OSError as e:
+        logging.error(f"Couldn't dump recent log records to {path}: {e}")
+        return None
+    logging.info(f"Dumped {len(_ring.buffer)} recent log records to {path}")
+    return path
+
+
+def dropped():
+    """Records lost because the writer fell behind"""
+    return 0 if _queue_handler is None else _queue_handler.dropped
+
+
+def stop():
+    """Writes out everything still queued, the listener can't be restarted"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
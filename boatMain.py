@@ -1,18 +1,38 @@
 import sys
 import logging
+import time
 from time import sleep
 import rclpy
 from rclpy.node import Node
-from std_msgs.msg import String
 
 ROS = None
 try:
     import constants as c
     import boatMath
+    import boatLogging
+    from controlLoop import LoopStats
+    from flightRecorder import FlightRecorder
+    from commandFilter import CommandFilter
+    import headingControl
+    from polar import Polar
+    import rosMessages
+    import settings
+    import telemetryFrame
+    from telemetryFrame import TelemetryData
     ROS = False
 except:
     import sailbot.constants as c
     import sailbot.boatMath as boatMath
+    import sailbot.boatLogging as boatLogging
+    from sailbot.controlLoop import LoopStats
+    from sailbot.flightRecorder import FlightRecorder
+    from sailbot.commandFilter import CommandFilter
+    import sailbot.headingControl as headingControl
+    from sailbot.polar import Polar
+    import sailbot.rosMessages as rosMessages
+    import sailbot.settings as settings
+    import sailbot.telemetryFrame as telemetryFrame
+    from sailbot.telemetryFrame import TelemetryData
     ROS = True
 
 try:
@@ -30,6 +50,7 @@ try:
         from drivers import driver
         from transceiver import arduino
         from eventUtils import Waypoint, EventFinished
+        from search import Search
     else:
         from sailbot.windvane import windVane
         from sailbot.GPS import gps
@@ -64,40 +85,73 @@ class boat(Node):
     """
     The overarching class for the entire boat, contains all sensor objects and automation functions
     """
-    def __init__(self, calibrateOdrive = True):
+    def __init__(self, calibrateOdrive = True, gps=None, compass=None, windvane=None, transceiver=None, publishers=None, record=True):
         """
         Set everything up and start the main loop
+        Args:
+            - gps, compass, windvane, transceiver: used instead of the ROS-fed sensors, the windvane and the arduino
+              when given, ex. replay.py's recorded ones
+            - publishers: (sail, rudder) publishers, when given the boat is not made a ROS node: nothing is
+              subscribed to and mainLoop() can't be used, controlTick() is called directly
+            - record: write a flight recording if [RECORDER] enabled is set
         """
-        
-        super().__init__('main_subscriber')
+        self.ros = publishers is None
+        if self.ros:
+            super().__init__('main_subscriber')
 
         # create sensor objects
-        self.gps = dummyObject()
-        self.gps.latitude = 0.0
-        self.gps.longitude = 0.0
-        self.gps.track_angle_deg = 0.0
-        self.gps.updateGPS = lambda *args: None #do nothing if this function is called and return None
-        self.compass = dummyObject() #compass()
-        self.compass.angle = 0.0
-        
-        self.gps_subscription = self.create_subscription(String, 'GPS', self.ROS_GPSCallback, 10)
-        self.compass_subscription = self.create_subscription(String, 'compass', self.ROS_compassCallback, 10)
+        if gps is None:
+            gps = dummyObject()
+            gps.latitude = 0.0
+            gps.longitude = 0.0
+            gps.track_angle_deg = 0.0
+            gps.speed = 0.0
+            gps.timestamp = None   # ROS time (seconds) the latest fix was published by the GPS node
+            gps.latency = None     # how long the latest fix took to arrive
+            gps.updateGPS = lambda *args: None #do nothing if this function is called and return None
+        self.gps = gps
+        if compass is None:
+            compass = dummyObject() #compass()
+            compass.angle = 0.0
+            compass.timestamp = None
+            compass.latency = None
+            compass.turnRate = 0.0
+        self.compass = compass
         
-        self.pub = self.create_publisher(String, 'driver', 10)
-        #self.windvane = windVane()
-        
-        # try both of the USB ports the 'arduino' (transciver) may be connected to
-        try:
-            self.arduino = arduino(c.config['MAIN']['ardu_port'])
-            if self.arduino.readData() == "'":
-                raise Exception("Could not read arduino")
+        self.state_subscription = None
+        if not self.ros:
+            self.sail_pub, self.rudder_pub = publishers
+        else:
+            if int(c.config['ESTIMATOR']['use_in_control']):
+                # position, heading, speed and turn rate from the state estimator (estimatorNode.py) instead of the raw sensors
+                self.gps_subscription = self.create_subscription(rosMessages.NavSatFix, rosMessages.STATE_FIX_TOPIC, self.ROS_GPSCallback, 10)
+                self.state_subscription = self.create_subscription(rosMessages.Odometry, rosMessages.STATE_TOPIC, self.ROS_stateCallback, 10)
             else:
-                print(self.arduino.readData())
-        except:
-            self.arduino = arduino(c.config['MAIN']['ardu_port2'])
-            if self.arduino.readData() == "'":
-                raise Exception("Could not read arduino")
-
+                self.gps_subscription = self.create_subscription(rosMessages.NavSatFix, rosMessages.GPS_FIX_TOPIC, self.ROS_GPSCallback, 10)
+                self.compass_subscription = self.create_subscription(rosMessages.Imu, rosMessages.COMPASS_TOPIC, self.ROS_compassCallback, 10)
+            self.gps_vel_subscription = self.create_subscription(rosMessages.TwistStamped, rosMessages.GPS_VEL_TOPIC, self.ROS_GPSVelCallback, 10)
+            
+            self.sail_pub = self.create_publisher(rosMessages.Float64, rosMessages.SAIL_TOPIC, 10)
+            self.rudder_pub = self.create_publisher(rosMessages.Float64, rosMessages.RUDDER_TOPIC, 10)
+        self.windvane = windVane() if windvane is None else windvane
+        
+        if transceiver is not None:
+            self.arduino = transceiver
+        else:
+            # try both of the USB ports the 'arduino' (transciver) may be connected to
+            try:
+                self.arduino = arduino(c.config['MAIN']['ardu_port'])
+                if self.arduino.readData() == "'":
+                    raise Exception("Could not read arduino")
+                else:
+                    print(self.arduino.readData())
+            except:
+                self.arduino = arduino(c.config['MAIN']['ardu_port2'])
+                if self.arduino.readData() == "'":
+                    raise Exception("Could not read arduino")
+
+            # From here on the transceiver is read by a background thread so the control loop never waits on it
+            self.arduino.startReader()
 
         # Set default values for variables
         self.DEBUG_main = False
@@ -105,7 +159,7 @@ class boat(Node):
         self.event_arr = []
         self.manualControl = True   # check RC Mode to change manualControl, and manualControl checks for everything else (faster on memory)
         self.cycleTargets = False
-        self.currentTarget = None  # (longitude, latitude) tuple
+        self.currentTarget = None  # [latitude, longitude] of the waypoint being sailed to
         self.targets = []  # list of (longitude, latitude) tuples
 
         # Where we want the sail and rudder to be vs where they currently are
@@ -116,84 +170,133 @@ class boat(Node):
 
         self.override = False   #whether to automatically switch to RC when inputting manual commands or prevent the commands
         self.MODE_SETTING = c.config['MODES']['MOD_RC']
+
+        # The control loop is run by a ROS timer at a fixed rate instead of spinning as fast as possible
+        self.controlPeriod = 1 / float(c.config['MAIN']['control_rate'])
+        self.loopStats = LoopStats(self.controlPeriod, float(c.config['MAIN']['loop_stats_interval']))
+        self.controlTimer = None
+        self.telemetryPeriod = 1 / float(c.config['MAIN']['telemetry_rate'])
+        self.lastTelemetry = 0
+        self.telemetryErrors = 0    # telemetry frames that failed to send
+
+        # Only publish sail/rudder commands that actually move the actuators, see commandFilter.py
+        self.sailFilter = CommandFilter()
+        self.rudderFilter = CommandFilter()
+        self.settingsChanged(None, settings.current())
+
+        # Steers to a compass heading, updated once per control tick by turnToAngle()
+        self.headingController = headingControl.HeadingController()
+        self.polar = Polar.load()
+
+        # config.ini edits take effect without restarting, see settings.py
+        settings.on_change(self.settingsChanged)
+        settings.watch()
+
+        # one sample of what the boat sensed and commanded per control tick, see flightRecorder.py
+        self.recorder = FlightRecorder() if record and int(c.config['RECORDER']['enabled']) else None
         #pump_thread = Thread(target=self.pumpMessages)
         #pump_thread.start()
 
-        if not self.manualControl:  # set mode for automation
-            if self.MODE_SETTING == events["ED"]:
-                logging.info("Received message to Automate: ENDURANCE")
-                self.eevee = Endurance(self.event_arr,self.DEBUG_main)
-
-            elif self.MODE_SETTING == events["SK"]:
-                logging.info("Received message to Automate: STATION_KEEPING")
-                self.eevee = Station_Keeping(self.event_arr,self.DEBUG_main)
-
-
-            elif self.MODE_SETTING == events["PN"]:
-                logging.info("Received message to Automate: PRECISION_NAVIGATE")
-                self.eevee = Precision_Navigation(self.event_arr,self.DEBUG_main)
-
-            elif self.MODE_SETTING == events["SE"]:
-                logging.info("Received message to Automate: SEARCH")
-                self.eevee = Search(self.event_arr)
-
-        self.mainLoop()
-        
-    def ROS_GPSCallback(self, string):
-        if string == "None,None,None":
-            self.gps.latitude = None
-            self.gps.longitude = None
-            self.gps.track_angle_deg = None
-            return
-
-        lat, long, trackangle = string.replace("(", "").replace(")", "").split(",")
-        self.gps.latitude = float(lat)
-        self.gps.longitude = float(long)
-        self.gps.track_angle_deg = float(trackangle)
-
-    def ROS_compassCallback(self, string):
-        if string == "None,None":
-            self.compass.angle = None
-            return
+    def startEvent(self):
+        """
+        Creates the event for MODE_SETTING from event_arr, None in RC
+            - events read the boat's ROS fed gps and its windvane, they don't open the sensors themselves
+        """
+        self.eevee = None
+        if self.MODE_SETTING == events["ED"]:
+            logging.info("Received message to Automate: ENDURANCE")
+            self.eevee = Endurance(self.event_arr, gps=self.gps, windvane=self.windvane)
+
+        elif self.MODE_SETTING == events["SK"]:
+            logging.info("Received message to Automate: STATION_KEEPING")
+            self.eevee = Station_Keeping(self.event_arr, self.DEBUG_main, gps=self.gps, windvane=self.windvane)
+
+        elif self.MODE_SETTING == events["PN"]:
+            logging.info("Received message to Automate: PRECISION_NAVIGATE")
+            self.eevee = Precision_Navigation(self.event_arr, self.DEBUG_main, gps=self.gps, windvane=self.windvane)
+
+        elif self.MODE_SETTING == events["SE"]:
+            logging.info("Received message to Automate: SEARCH")
+            self.eevee = Search(self.event_arr, gps=self.gps, windvane=self.windvane)
+
+    def ROS_GPSCallback(self, msg):
+        self.gps.latitude, self.gps.longitude, self.gps.timestamp = rosMessages.read_gps_fix(msg)
+        self.gps.latency = self.messageAge(self.gps.timestamp)
+
+    def ROS_GPSVelCallback(self, msg):
+        speed, track, _ = rosMessages.read_gps_vel(msg)
+        if track is not None:
+            self.gps.track_angle_deg = track
+        if speed is not None and self.state_subscription is None:
+            self.gps.speed = speed
+
+    def ROS_compassCallback(self, msg):
+        self.compass.angle, self.compass.timestamp = rosMessages.read_heading(msg)
+        self.compass.latency = self.messageAge(self.compass.timestamp)
+
+    def ROS_stateCallback(self, msg):
+        self.compass.angle, self.gps.speed, self.compass.turnRate, self.compass.timestamp = rosMessages.read_state(msg)
+        self.compass.latency = self.messageAge(self.compass.timestamp)
+
+    def messageAge(self, stamp):
+        """Seconds between a message's header stamp and now"""
+        return rosMessages.stamp_to_seconds(self.get_clock().now().to_msg()) - stamp
+
+    def publishDriverCommand(self, actuator, angle, force=False):
+        """
+        Publish 'angle' to the sail or rudder driver topic if the command filter for that actuator lets it through
+        Returns:
+            - True if the command was published
+        """
+        if actuator == "sail":
+            commandFilter, pub = self.sailFilter, self.sail_pub
+        else:
+            commandFilter, pub = self.rudderFilter, self.rudder_pub
+        if not commandFilter.should_send(angle, force=force):
+            return False
 
-        angle = string.replace("(", "").replace(")", "")
-        self.compass.angle = float(angle)
+        logging.debug("(driver:%s:%s)", actuator, angle)
+        pub.publish(rosMessages.make_command(angle))
+        return True
 
-        
+    def settingsChanged(self, old, new):
+        """
+        Applies reloaded settings that were copied into objects, runs on the settings watcher thread
+        """
+        interval = 1 / new.max_command_rate if new.max_command_rate > 0 else 0.0
+        for commandFilter, deadband in ((self.sailFilter, new.sail_deadband), (self.rudderFilter, new.rudder_deadband)):
+            commandFilter.deadband = deadband
+            commandFilter.min_interval = interval
+            commandFilter.keepalive = new.keepalive_interval
 
-    def adjustSail(self, angle=None):
+    def adjustSail(self, angle=None, force=False):
         """
         Move the sail to 'angle', angle is value between 0 and 90, 0 being all the way in
+            - without an angle the sail is trimmed to the polar's best angle for the windvane reading
+            - force (bool): publish even if the sail is already at 'angle'
         """
-        dataStr = String()
-        if self.manualControl and angle != None:
-            # set sail to angle
-            dataStr.data = F"(driver:sail:{angle})"
-            self.get_logger().info(dataStr.data)
-            self.pub.publish(dataStr)
+        if angle != None:
+            # set sail to angle, RC or letting the sail out to stop the boat
+            self.publishDriverCommand("sail", angle, force)
+            self.currentSail = angle
 
         elif self.currentTarget or self.manualControl:
-            # set sail to optimal angle based on windvane readings
-            windDir = self.windvane.angle
-            targetAngle = windDir + 35
-            dataStr.data = F"(driver:sail:{targetAngle})"
-            self.get_logger().info(dataStr.data)
-            self.pub.publish(dataStr)
+            # set sail to the polar's best trim for the windvane reading
+            targetAngle = float(self.polar.sail_angle(self.windvane.angle))
+            self.publishDriverCommand("sail", targetAngle, force)
             self.currentSail = targetAngle
 
         else:
             # move sail to home position
-            dataStr.data = F"(driver:sail:{0})"
-            self.get_logger().info(dataStr.data)
-            self.pub.publish(dataStr)
+            if self.publishDriverCommand("sail", 0, force):
+                logging.info('Adjusted sail to home position')
             self.currentSail = 0
-            logging.info('Adjusted sail to home position')
 
-    def adjustRudder(self, angleTo):
+    def adjustRudder(self, angleTo, force=False):
         """
         Move the rudder to 'angle', angle is value between -45 and 45
+            - force (bool): publish even if the rudder is already at 'angle'
         """
-        dataStr = String()
         if self.currentTarget or self.manualControl == True:
             # adjust rudder for best wind
             # angleTo = gps.angleTo(self.currentTarget)
@@ -202,21 +305,15 @@ class boat(Node):
 
             if d_angle > 180: d_angle -= 180
 
-            dataStr.data = F"(driver:rudder:{d_angle})"
-            self.get_logger().info(dataStr.data)
-            self.pub.publish(dataStr)
-
+            if self.publishDriverCommand("rudder", d_angle, force):
+                logging.debug('Adjusted rudder to: %d', d_angle)
             self.currentRudder = d_angle
-            logging.info('Adjusted rudder to: %d', d_angle)
 
         else:
             # move rudder to home position
-            dataStr.data = F"(driver:rudder:{0})"
-            self.get_logger().info(dataStr.data)
-            self.pub.publish(dataStr)
-
+            if self.publishDriverCommand("rudder", 0, force):
+                logging.info('Adjusted rudder to home position')
             self.currentRudder = 0
-            logging.info('Adjusted rudder to home position')
 
     def pumpMessages(self):
         """
@@ -227,9 +324,19 @@ class boat(Node):
 
     def mainLoop(self):
         """
-        Main loop that will run until boat is stopped 
+        Main loop that will run until boat is stopped
+            - controlTick() is scheduled by a ROS timer at 'control_rate' Hz and the node is spun to service it
         """
-        while True:
+        if self.controlTimer is None:
+            self.controlTimer = self.create_timer(self.controlPeriod, self.controlTick)
+        rclpy.spin(self)
+
+    def controlTick(self):
+        """
+        One iteration of the control loop, called at a fixed rate by mainLoop()
+        """
+        self.loopStats.start()
+        try:
             self.readMessages() # read messages from transceiver   
 
             if self.manualControl:
@@ -241,7 +348,7 @@ class boat(Node):
                 try:
                     waypoint = self.eevee.next_gps()
                     if waypoint is not None:
-                        self.currentTarget[0], self.currentTarget[1] = waypoint.lat, waypoint.lon
+                        self.currentTarget = [waypoint.lat, waypoint.lon]
                         if self.DEBUG_main:
                             print(self.currentTarget)
                         else:
@@ -256,65 +363,67 @@ class boat(Node):
                     self.MODE_SETTING = c.config['MODES']['MOD_RC']
                     self.manualControl = True
                 except Exception as ex:
-                    logging.critical("Unhandled exception occured! Setting to RC!")
+                    logging.critical("Unhandled exception occured! Setting to RC!", exc_info=ex)
+                    boatLogging.dump_ring()
                     self.MODE_SETTING = c.config['MODES']['MOD_RC']
                     self.manualControl = True
-                    logging.critical(ex)
 
+            # send telemetry to shore at 'telemetry_rate' Hz
+            if time.monotonic() - self.lastTelemetry >= self.telemetryPeriod:
+                self.lastTelemetry = time.monotonic()
+                try:
+                    self.sendData()
+                except Exception as e:
+                    # telemetry is nice to have, an exception here would end rclpy.spin and with it sail/rudder control
+                    self.telemetryErrors += 1
+                    if self.telemetryErrors % 100 == 1:
+                        logging.warning("failed to send telemetry (%d so far): %s", self.telemetryErrors, e)
+
+            if self.recorder is not None:
+                try:
+                    self.recordSample()
+                except Exception as e:
+                    # losing the recording is better than losing the control loop
+                    logging.error("Flight recorder failed, recording stopped: %s", e, exc_info=True)
+                    self.recorder = None
+        finally:
+            self.loopStats.stop()
 
 
-    def sendData(self):
-        #GPS:x/y, RudderPos, SailPos, BoatOrientation, Windspd, WindDir, Batt
-        #1/2,3,4,5,6,7,8
-        totstr = ""
-        arr = ["N/a"] * 8
-
-        try:
-            arr[0] = F"{self.gps.longitude}"
-            arr[1] = F"{self.gps.latitude}"
-        except Exception as e:
-            logging.info(f"failed to find data: gps, {e}")
-            print(f"data error: {e}")
-
-        try:
-            if abs(self.currentRudder) >= 10:
-                arr[2] = F"{self.currentRudder}"
-            else: #format so number is 2 digits
-                arr[2] = F"0{self.currentRudder}"
-        except Exception as e:
-            logging.info(f"failed to find data: rudder, {e}")
-            print(f"data error: {e}")
 
+    def recordSample(self):
+        """
+        Save this tick's sensor readings, commands, mode and event progress to the flight recorder
+        """
         try:
-            if abs(self.currentSail) >= 10:
-                arr[3] = F"{self.currentSail}"
-            else: #format so number is 2 digits
-                arr[3] = F"0{self.currentSail}"
-        except Exception as e:
-            logging.info(f"failed to find data: sail, {e}")
-            print(f"data error: {e}")
-        
-        try:
-            arr[4] = F"{self.compass.angle}"
-        except Exception as e:
-            logging.info(f"failed to find data: compass, {e}")
-            print(f"data error: {e}")
+            windAngle = self.windvane.angle
+        except Exception:
+            windAngle = None
+        target = self.currentTarget
+        self.recorder.record(time=time.time(), lat=self.gps.latitude, lon=self.gps.longitude,
+                             target_lat=target[0] if target else None, target_lon=target[1] if target else None,
+                             gps_speed=self.gps.speed, gps_track=self.gps.track_angle_deg, heading=self.compass.angle,
+                             wind_angle=windAngle, sail_cmd=self.currentSail, rudder_cmd=self.currentRudder,
+                             sail=self.sailFilter.last_sent, rudder=self.rudderFilter.last_sent,
+                             mode=int(self.MODE_SETTING), manual=self.manualControl,
+                             event_state=self.eevee.state_code() if self.eevee is not None else -1)
 
+    def sendData(self):
+        """
+        Send a binary telemetry frame (see telemetryFrame.py) to shore through the transceiver
+        """
+        data = TelemetryData(lat=self.gps.latitude,
+                             lon=self.gps.longitude,
+                             rudder=self.currentRudder,
+                             sail=self.currentSail,
+                             heading=self.compass.angle)
         try:
-            #arr[5] = #dont have
-            arr[6] = F"{self.windvane.angle}"
+            data.wind_dir = self.windvane.angle
         except Exception as e:
-            logging.info(f"failed to find data: windvane, {e}")
-            print(f"data error: {e}")
+            logging.debug("failed to find data: windvane, %s", e)
+        # wind speed and battery aren't measured yet
 
-        #arr[7] = #dont have
-
-        for i in range(8):
-            totstr += arr[i]
-            if i<7:
-                totstr += ","
-        
-        self.arduino.send("DATA: " + totstr)
+        self.arduino.sendBytes(telemetryFrame.encode_data(data))
 
 
     def readMessages(self, msgOR=None):
@@ -325,7 +434,7 @@ class boat(Node):
             msgs = msgOR
         else:
             #msgs = self.arduino.read()[:-3].replace('\n', '')
-            msgs = self.arduino.readData()
+            msgs = self.arduino.readMessages() # only what has already arrived, never blocks
         #print(msgs)
 
         try:
@@ -361,8 +470,9 @@ class boat(Node):
                             self.manualControl = True
 
                         if self.manualControl: 
-                            rudderMidPoint = (float(c.config['CONSTANTS']["rudder_angle_max"]) - float(c.config['CONSTANTS']['rudder_angle_min']))/2
-                            halfDeadZone  = float(c.config['CONSTANTS']['ControllerRudderDeadZoneDegs']) / 2
+                            config = settings.current()
+                            rudderMidPoint = config.rudder_mid_point
+                            halfDeadZone = config.rudder_dead_zone / 2
 
                             # ignore values within the dead zone, ex: if controller is at 1 degree, rudder will still default to 0
                             if float(ary[1]) < rudderMidPoint + halfDeadZone and float(ary[1]) > rudderMidPoint - halfDeadZone:  
@@ -390,8 +500,14 @@ class boat(Node):
 
                                 logging.info(F'Setting event array')
                                 self.event_arr = []
-                                for i in range((len(ary)-2)/2):
-                                    self.event_arr.append(Waypoint(ary[(2*i)+2],ary[(2*i)+3]))
+                                for i in range((len(ary)-2)//2):
+                                    self.event_arr.append(Waypoint(float(ary[(2*i)+2]), float(ary[(2*i)+3])))
+                                if self.recorder is not None:
+                                    # replay.py rebuilds the event from this
+                                    event = next((name for name, code in events.items() if code == self.MODE_SETTING), None)
+                                    self.recorder.note("mode", mode=self.MODE_SETTING, event=event,
+                                                       event_info=[[w.lat, w.lon] for w in self.event_arr])
+                                self.startEvent()
                                 processed = True
                         except Exception as e:
                             print(F"Error changing mode: {e}")
@@ -406,10 +522,10 @@ class boat(Node):
 
 
                     elif ary[0] == 'addTarget': # add current GPS to list of targets
-                        while self.gps.latitude == None or self.gps.longitude == None:
-                            print("no gps")
-                            #self.gps.updategps()
-                            sleep(.1)
+                        if self.gps.latitude == None or self.gps.longitude == None:
+                            # GPS callbacks only run between control ticks, waiting here would block them forever
+                            print("no gps, target not added")
+                            continue
                         target = (self.gps.latitude, self.gps.longitude)
                         logging.info(F"added Target at {target}")
                         self.targets.append(target)
@@ -459,69 +575,49 @@ class boat(Node):
         Go to GPS coordinates lat, long
         """
 
-        # Get current GPS coordinates, if we can't load info from GPS wait until we can and print error message
+        # Get current GPS coordinates, if we can't load info from GPS skip this tick and try again on the next one
         #self.gps.updategps()
-        while self.gps.latitude == None or self.gps.longitude == None:
-            print("no gps")
-            #self.gps.updategps()
-            sleep(.1)
+        if self.gps.latitude == None or self.gps.longitude == None:
+            logging.debug("no gps")
+            return
 
         # determine angle we need to turn
         compassAngle = self.compass.angle
         deltaAngle = boatMath.angleToPoint(compassAngle, self.gps.latitude, self.gps.longitude, lat, long)
         targetAngle = (compassAngle + deltaAngle) % 360
-        windAngle = self.windvane.angle
+        # the windvane measures the wind relative to the bow, the polar wants the direction it blows from
+        windDirection = (compassAngle + self.windvane.angle) % 360
 
-        
-        if (deltaAngle + windAngle) % 360 < self.windvane.noGoMin and (
-                deltaAngle + windAngle) % 360 > self.windvane.noGoMax: # angle is not in no go zone
-            self.turnToAngle(targetAngle)
-        else: # angle is in no go zone, go to the nearest edge of no go zone
-            if (targetAngle - compassAngle) % 360 <= 180:
-                # turn left
-                self.turnToAngle(self.windvane.noGoMin)
-            else:
-                # turn right
-                self.turnToAngle(self.windvane.noGoMax)
+        # sail the heading that closes on the target fastest: straight at it, or beating/gybing towards it
+        config = settings.current()
+        heading, _ = self.polar.vmg_heading(targetAngle, windDirection, config.wind_speed, heading=compassAngle,
+                                            tack_margin=config.tack_margin)
+        self.turnToAngle(heading)
+        self.adjustSail()
 
-        if abs(boatMath.distanceInMBetweenEarthCoordinates(lat, long, self.gps.latitude, self.gps.longitude)) < int(c.config['CONSTANTS']['reachedGPSThreshhold']):
+        if abs(boatMath.distanceInMBetweenEarthCoordinates(lat, long, self.gps.latitude, self.gps.longitude)) < settings.current().reached_gps_threshold:
             # if we are very close to GPS coord
             if self.cycleTargets:
                 self.targets.append((lat, long))
             self.currentTarget = None
             self.adjustRudder(0)
 
-    def turnToAngle(self, angle, wait_until_finished = False):
+    def turnToAngle(self, angle):
         """
-        adjust rudder until the boat is facing compass angle 'angle'
-        if wait_until_finished is True the boat will continue to adjust rudder until the boat is facing the right direction
-        if wait_until_finished is False the boat will adjust the rudder to an appropriate angle and then return
+        adjust rudder to turn the boat towards compass angle 'angle'
+            - the rudder angle comes from the PID heading controller (headingControl.py), call once per control tick
+              until the boat faces 'angle', waiting here would block the ROS timer that runs controlTick()
+        Returns:
+            - True if the boat is within angle_margin of 'angle'
         """
-        leftPositive = -1  # change to negative one if boat is rotating the wrong way
-        
-        logging.info("starting turnToAngle")
-        compassAngle = self.compass.angle
-        while abs(compassAngle - angle) > int(c.config['CONSTANTS']['angle_margin_of_error']): # while not facing the right angle
-            compassAngle = self.compass.angle
-
-            if ((angle - compassAngle) % 360 <= 180):  # turn Left
-                # move rudder to at most 45 degrees
-                rudderPos = leftPositive * min(45, 3 * abs(compassAngle - angle))  # /c.rotationSmoothingConst)
-                logging.info(F'turning to angle: {angle} from angle: {compassAngle} by turning rudder to {rudderPos}')
-                self.adjustRudder(int(rudderPos))
-            else: 
-                # move rudder to at most -45 degrees
-                rudderPos = -1 * leftPositive * min(45, 3 * abs(compassAngle - angle))  # /c.rotationSmoothingConst)
-                logging.info(F'turning to angle: {angle} from angle: {compassAngle} by turning rudder to {rudderPos}')
-                self.adjustRudder(int(rudderPos))
-
-            if not wait_until_finished:
-                break
-            
-
-
-        #print(compassAngle)
-        logging.info("finished turnToAngle")
+        turnRate = self.compass.turnRate if self.state_subscription is not None else None
+        rudderPos = self.headingController.update(angle, self.compass.angle, time.monotonic(),
+                                                  speed=self.gps.speed, turn_rate=turnRate)
+        # published directly: adjustRudder offsets its angle by the GPS track for RC
+        if self.publishDriverCommand("rudder", rudderPos):
+            logging.debug('turning to angle: %s from angle: %s by turning rudder to %.1f', angle, self.compass.angle, rudderPos)
+        self.currentRudder = rudderPos
+        return abs(headingControl.heading_error(angle, self.compass.angle)) <= settings.current().angle_margin
 
 
 def main(args=None):
@@ -538,16 +634,25 @@ def main(args=None):
         # b.turnToAngle(90)
         # b.goToGPS(40.44368167, -79.9580000)
         print("Cleaning Up")
-        b.adjustRudder(0)
-        b.adjustSail(0)
+        b.adjustRudder(0, force=True)
+        b.adjustSail(0, force=True)
 
+        b.arduino.stopReader()
+        if b.recorder is not None:
+            b.recorder.close()
         b.destroy_node()
         rclpy.shutdown()
 
     except KeyboardInterrupt as e:
         print("\n\nEXITING...\n\n")
-        b.adjustRudder(0)
-        b.adjustSail(0)
+        logging.info(b.loopStats.summary())
+        if boatLogging.dropped():
+            logging.warning("%d log records were dropped because the log file fell behind", boatLogging.dropped())
+        b.adjustRudder(0, force=True)
+        b.adjustSail(0, force=True)
+        b.arduino.stopReader()
+        if b.recorder is not None:
+            b.recorder.close()
         b.destroy_node()
         rclpy.shutdown()
         print("EXITED CLEANLY")
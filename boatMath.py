@@ -1,8 +1,16 @@
 """
 Math functions useful for sailbotting
+    - haversine(), initial_bearing() and destination_point() take plain floats (fast math path) or numpy arrays
+    - The *_array() versions take N x 2 arrays of (lat, lon) degrees, ex. every heatmap chunk or search pattern leg at once
+    - `python3 boatMath.py` benchmarks the scalar and array paths
 """
 import math
 
+import numpy as np
+
+EARTH_RADIUS = 6371000
+_SCALARS = (float, int)
+
 def degreesToRadians(degrees):
   return degrees * math.pi / 180
 
@@ -13,18 +21,74 @@ def getCoordinateADistanceAlongAngle(distance, angle):
     print("write function")
     return "lat, long"
 
-def distanceInMBetweenEarthCoordinates(lat1, lon1, lat2, lon2):
-  earthRadiusKm = 6371
+def haversine(lat1, lon1, lat2, lon2):
+    """Great circle distance in meters, takes floats or numpy arrays (which broadcast against each other)"""
+    if type(lat1) in _SCALARS and type(lon1) in _SCALARS and type(lat2) in _SCALARS and type(lon2) in _SCALARS:
+        phi1, phi2 = math.radians(lat1), math.radians(lat2)
+        a = math.sin((phi2 - phi1) / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+        return 2 * EARTH_RADIUS * math.asin(math.sqrt(min(a, 1.0)))
+
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    a = np.sin((phi2 - phi1) / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(np.radians(np.subtract(lon2, lon1)) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def initial_bearing(lat1, lon1, lat2, lon2):
+    """Compass bearing (0-360, clockwise from north) from point 1 towards point 2, takes floats or numpy arrays"""
+    if type(lat1) in _SCALARS and type(lon1) in _SCALARS and type(lat2) in _SCALARS and type(lon2) in _SCALARS:
+        phi1, phi2 = math.radians(lat1), math.radians(lat2)
+        d_lon = math.radians(lon2 - lon1)
+        y = math.sin(d_lon) * math.cos(phi2)
+        x = math.cos(phi1) * math.sin(phi2) - math.sin(phi1) * math.cos(phi2) * math.cos(d_lon)
+        return math.degrees(math.atan2(y, x)) % 360
+
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    d_lon = np.radians(np.subtract(lon2, lon1))
+    y = np.sin(d_lon) * np.cos(phi2)
+    x = np.cos(phi1) * np.sin(phi2) - np.sin(phi1) * np.cos(phi2) * np.cos(d_lon)
+    return np.degrees(np.arctan2(y, x)) % 360
+
+
+def destination_point(lat, lon, bearing, distance):
+    """The (lat, lon) reached by travelling 'distance' meters along a compass bearing, takes floats or numpy arrays"""
+    if type(lat) in _SCALARS and type(lon) in _SCALARS and type(bearing) in _SCALARS and type(distance) in _SCALARS:
+        phi, theta, delta = math.radians(lat), math.radians(bearing), distance / EARTH_RADIUS
+        phi2 = math.asin(math.sin(phi) * math.cos(delta) + math.cos(phi) * math.sin(delta) * math.cos(theta))
+        lam2 = math.atan2(math.sin(theta) * math.sin(delta) * math.cos(phi), math.cos(delta) - math.sin(phi) * math.sin(phi2))
+        return math.degrees(phi2), (lon + math.degrees(lam2) + 540) % 360 - 180
+
+    phi, theta, delta = np.radians(lat), np.radians(bearing), np.divide(distance, EARTH_RADIUS)
+    phi2 = np.arcsin(np.sin(phi) * np.cos(delta) + np.cos(phi) * np.sin(delta) * np.cos(theta))
+    lam2 = np.arctan2(np.sin(theta) * np.sin(delta) * np.cos(phi), np.cos(delta) - np.sin(phi) * np.sin(phi2))
+    return np.degrees(phi2), (np.add(lon, np.degrees(lam2)) + 540) % 360 - 180
+
+
+def haversine_array(points1, points2):
+    """
+    Args:
+        - points1, points2 (array like): N x 2 (or a single 2 long) arrays of (lat, lon) degrees
+    Returns:
+        - np.ndarray of N distances in meters
+    """
+    points1, points2 = np.asarray(points1, dtype=float), np.asarray(points2, dtype=float)
+    return haversine(points1[..., 0], points1[..., 1], points2[..., 0], points2[..., 1])
+
 
-  dLat = degreesToRadians(lat2-lat1)
-  dLon = degreesToRadians(lon2-lon1)
+def bearing_array(points1, points2):
+    """N compass bearings from each (lat, lon) in points1 to the matching one in points2"""
+    points1, points2 = np.asarray(points1, dtype=float), np.asarray(points2, dtype=float)
+    return initial_bearing(points1[..., 0], points1[..., 1], points2[..., 0], points2[..., 1])
 
-  lat1 = degreesToRadians(lat1)
-  lat2 = degreesToRadians(lat2)
 
-  a = math.sin(dLat/2) * math.sin(dLat/2) + math.sin(dLon/2) * math.sin(dLon/2) * math.cos(lat1) * math.cos(lat2)
-  c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-  return earthRadiusKm * c * 1000
+def destination_array(points, bearings, distances):
+    """N x 2 array of the (lat, lon) reached from each point along each bearing"""
+    points = np.asarray(points, dtype=float)
+    lat, lon = destination_point(points[..., 0], points[..., 1], np.asarray(bearings, dtype=float), np.asarray(distances, dtype=float))
+    return np.stack((lat, lon), axis=-1)
+
+
+def distanceInMBetweenEarthCoordinates(lat1, lon1, lat2, lon2):
+  return haversine(lat1, lon1, lat2, lon2)
 
 def computeNewCoordinate(lat, lon, d_lat, d_lon):
     """
@@ -41,32 +105,13 @@ def computeNewCoordinate(lat, lon, d_lat, d_lon):
     return (new_lat, new_lon)
 
 def angleBetweenCoordinates(lat1, lon1, lat2, lon2):
-    #angle (relative to north?) from lat/long1 to lat/long2
-    theta1 = degreesToRadians(lat1)
-    theta2 = degreesToRadians(lat2)
-    delta1 = degreesToRadians(lat2 - lat1)
-    delta2 = degreesToRadians(lon2 - lon1)
-
-    y = math.sin(delta2) * math.cos(theta2)
-    x = math.cos(theta1) * math.sin(theta2) - math.sin(theta1)*math.cos(theta2)*math.cos(delta2)
-    brng = math.atan(y/x)
-    brng *= 180/math.pi
-
-    brng = (brng + 360) % 360
-
-    return brng
+    #angle relative to north from lat/long1 to lat/long2
+    return initial_bearing(lat1, lon1, lat2, lon2)
 
 
 def calculate_compass_angle(pt1, pt2):
     """Calculates the angle between two gps points"""
-    delta_lon = pt2.lon - pt1.lon
-    y = math.sin(math.radians(delta_lon)) * math.cos(math.radians(pt2.lat))
-    x = math.cos(math.radians(pt1.lat)) * math.sin(math.radians(pt2.lat)) - math.sin(
-        math.radians(pt1.lat)) * math.cos(math.radians(pt2.lat)) * math.cos(math.radians(delta_lon))
-    angle = math.atan2(y, x)
-    angle_deg = math.degrees(angle)
-    compass_angle = (angle_deg + 360) % 360
-    return compass_angle
+    return initial_bearing(pt1.lat, pt1.lon, pt2.lat, pt2.lon)
 
 def angleToPoint(heading, lat1, long1, lat2, long2):
     phi = math.atan2(long1-long2, lat1-lat2)
@@ -94,4 +139,33 @@ def convertWindAngle (windAngle):
     # This also assumes the compass is measured from 0 to 360 degrees
     compassAngle = boatCompass + tempAngle # we would need to get the boat compass reading from the compass
 
-    return (compassAngle % 360)
\ No newline at end of file
+    return (compassAngle % 360)
+
+
+if __name__ == "__main__":
+    import time
+
+    def throughput(function, repeat):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            function()
+        return (time.perf_counter() - start) / repeat
+
+    rng = np.random.default_rng(0)
+    for count in (1, 100, 100000):
+        points1 = np.column_stack((rng.uniform(32.9, 33.1, count), rng.uniform(-117.1, -116.9, count)))
+        points2 = np.column_stack((rng.uniform(32.9, 33.1, count), rng.uniform(-117.1, -116.9, count)))
+        pairs = [(float(a[0]), float(a[1]), float(b[0]), float(b[1])) for a, b in zip(points1, points2)]
+        repeat = max(1, 200000 // count)
+
+        results = {
+            "haversine": (throughput(lambda: [haversine(*pair) for pair in pairs], repeat),
+                          throughput(lambda: haversine_array(points1, points2), repeat)),
+            "bearing": (throughput(lambda: [initial_bearing(*pair) for pair in pairs], repeat),
+                        throughput(lambda: bearing_array(points1, points2), repeat)),
+            "destination": (throughput(lambda: [destination_point(a, b, 45.0, 100.0) for a, b, _, _ in pairs], repeat),
+                            throughput(lambda: destination_array(points1, 45.0, 100.0), repeat)),
+        }
+        for name, (scalar, array) in results.items():
+            print(f"{count:>6} points {name:<12} scalar loop {count / scalar / 1e6:8.2f}M pts/s   "
+                  f"array {count / array / 1e6:8.2f}M pts/s")
@@ -7,6 +7,9 @@ import time
 import logging
 import numpy as np
 import os
+import queue
+import threading
+from dataclasses import dataclass, field
 
 import constants as c
 
@@ -16,7 +19,9 @@ if c.config["MAIN"]["device"] == "pi":
     from compass import compass
     from boatMath import calculate_compass_angle
 from objectDetection import ObjectDetection, draw_bbox
+from cameraStream import CameraStream, make_source
 from eventUtils import Waypoint
+from flightRecorder import FrameSaver
 from utils import singleton
 
 
@@ -49,6 +54,93 @@ class Frame():
         return f"Frame({self.img, self.time, self.gps, self.heading, self.pitch, self.detections})"
 
 
+@dataclass(slots=True)
+class SurveyTiming:
+    """
+    Seconds spent in each stage of a Camera.survey()
+        - move: commanding the yaw servo and waiting for it to settle, per image
+        - capture: waiting for a frame from the camera stream, per image
+        - detect: each detection pass, one pass can cover several images
+        - total: the whole survey, with pipelining this is close to the slowest stage instead of the sum
+    """
+    move: list = field(default_factory=list)
+    capture: list = field(default_factory=list)
+    detect: list = field(default_factory=list)
+    total: float = 0.0
+
+    def __str__(self):
+        return (f"Survey took {self.total:.2f}s (move {sum(self.move):.2f}s, capture {sum(self.capture):.2f}s, "
+                f"detect {sum(self.detect):.2f}s in {len(self.detect)} passes)")
+
+
+class SurveyDetector:
+    """
+    Runs detection on survey frames in a worker thread while the camera moves on to the next image
+        - Frames that queue up while the model is busy are analyzed together as one batch
+
+    Functions:
+        - submit() - queue a frame for detection
+        - join() - wait for every queued frame to be analyzed
+        - stop() - drop the queued frames and let the worker finish, when the survey itself failed
+    """
+    def __init__(self, object_detection, timing):
+        self.object_detection = object_detection
+        self.timing = timing
+        self._queue = queue.Queue()
+        self._error = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="SurveyDetector", daemon=True)
+        self._thread.start()
+
+    def submit(self, frame):
+        self._queue.put(frame)
+
+    def join(self, timeout=float(c.config["CAMERA"]["detect_timeout"])):
+        """Waits for detection to finish, raising any error the worker hit
+        Raises:
+            - RuntimeError: when detection takes longer than 'timeout' seconds
+        """
+        self._queue.put(None)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            self._stop.set()
+            raise RuntimeError(f"Survey detection didn't finish within {timeout}s")
+        if self._error is not None:
+            raise self._error
+
+    def stop(self, timeout=1.0):
+        """Drops frames that haven't been analyzed and waits up to 'timeout' seconds for the worker, never raises"""
+        self._stop.set()
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _run(self):
+        done = False
+        while not done:
+            batch = [self._queue.get()]
+            # take everything captured while the last batch was running
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                done = True
+                batch = [frame for frame in batch if frame is not None]
+            if not batch or self._error is not None or self._stop.is_set():
+                continue
+
+            start = time.perf_counter()
+            try:
+                detections = self.object_detection.analyze_batch([frame.img for frame in batch])
+            except Exception as e:
+                self._error = e
+                continue
+            self.timing.detect.append(time.perf_counter() - start)
+            for frame, frame_detections in zip(batch, detections):
+                frame.detections = frame_detections
+
+
 @singleton
 class Camera:
     """
@@ -58,6 +150,8 @@ class Camera:
         - servos (CameraServo): interface to control camera servos
             - servos.pitch and servos.yaw will always have the immediate camera position
             - pitch and yaw can be modified to move the physical servos 
+        - stream (CameraStream): the open camera session, frames are read from its ring buffer
+        - last_survey_timing (SurveyTiming): how long each stage of the last survey() took
     
     Functions:
         - capture(): Takes a picture
@@ -66,15 +160,26 @@ class Camera:
     def __init__(self):
         if (c.config["MAIN"]["device"] == "pi"):
             self.servos = CameraServos()
-            self.path = os.getcwd()
             self.gps = gps()
             self.compass = compass()
-        else:
-            self._cap = cv2.VideoCapture(int(c.config["CAMERA"]["source"]))
+        self.stream = CameraStream(make_source()).start()
+        self._object_detection = None
+        self.last_survey_timing = None
+        # frames with detections are kept for replaying the run (replay.py)
+        self.frame_saver = FrameSaver() if int(c.config["RECORDER"]["save_frames"]) else None
+
+    @property
+    def object_detection(self):
+        """The camera's ObjectDetection, the model is only loaded the first time detection is requested"""
+        if self._object_detection is None:
+            self._object_detection = ObjectDetection()
+        return self._object_detection
 
     def __del__(self):
-        if (c.config["MAIN"]["device"] != "pi"):
-            self._cap.release()
+        # __init__ may have failed before the stream was made, ex. no camera
+        stream = getattr(self, "stream", None)
+        if stream is not None:
+            stream.stop()
 
     def capture(self, context=True, detect=False, annotate=False, save=False) -> Frame:
         """Takes a single picture from camera
@@ -89,27 +194,22 @@ class Camera:
 
         frame = Frame()
 
-        if (c.config["MAIN"]["device"] == "pi"):
-            # Inefficient as FUCK
-            cmd = fr"libcamera-still -t 1 -o '{self.path}/buffer0.jpg' --width 640 --height 640"
-            os.system(cmd)
-            frame.img = cv2.imread(f"{self.path}/buffer0.jpg")
-            if (frame.img is None):
-                raise RuntimeError("No camera image detected!")
-        else:
-            _, frame.img = self._cap.read()
+        # Wait for the first frame started after this call so nothing taken while the servos moved is used
+        capture_time, frame.img = self.stream.read()
 
         if context:
-            frame.time = time.time()
+            frame.time = capture_time
             frame.gps = Waypoint(gps.longitude, gps.latitude)
             frame.pitch = self.servos.pitch
             frame.heading = (self.compass.angle + (self.servos.yaw - 90)) % 360
 
         if detect:
-            object_detection = ObjectDetection()
-            frame.detections = object_detection.analyze(frame.img)
+            frame.detections = self.object_detection.analyze(frame.img)
             if context:
                 estimate_all_buoy_gps(frame)
+            # saved before the boxes are drawn on the image
+            if self.frame_saver is not None:
+                self.frame_saver.save(frame)
 
             if annotate:
                 draw_bbox(frame)
@@ -133,6 +233,7 @@ class Camera:
                context=True, detect=False, annotate=False, save=False) -> list[Frame]:
         """Takes a horizontal panaroma over the camera's field of view
             - Maximum boat FoV is ~242.2 degrees (not tested)
+            - With detect=True, each image is analyzed in a worker thread while the servo moves to the next one
         # Args:
             - num_images (int): how many images to take across FoV
                 - Picamera2 lens covers an FoV of 62.2 degrees horizontal and 48.8 vertical
@@ -156,23 +257,56 @@ class Camera:
         servo_step = int(servo_range / num_images)
         MIN_ANGLE = int(c.config["CAMERASERVOS"]["min_angle"])
         MAX_ANGLE = int(c.config["CAMERASERVOS"]["max_angle"])
+        settle_time = float(c.config["CAMERASERVOS"]["settle_time"])
+
+        timing = SurveyTiming()
+        survey_start = time.perf_counter()
+        detector = SurveyDetector(self.object_detection, timing) if detect else None
 
         # Move camera to desired pitch
         self.servos.pitch = pitch
 
         if self.servos.yaw <= 90:
             # Survey left -> right when camera is facing left or center
-            for self.servos.yaw in range(MIN_ANGLE, MAX_ANGLE, servo_step):
-                images.append(self.capture(context=context, annotate=annotate, save=save, detect=False))
+            yaw_angles = range(MIN_ANGLE, MAX_ANGLE, servo_step)
         else:
             # Survey right -> left when camera is facing right
-            for self.servos.yaw in range(MAX_ANGLE, MIN_ANGLE, servo_step):
-                images.append(self.capture(context=context, annotate=annotate, save=save, detect=False))
+            yaw_angles = range(MAX_ANGLE, MIN_ANGLE, -servo_step)
+
+        try:
+            for yaw in yaw_angles:
+                start = time.perf_counter()
+                self.servos.yaw = yaw
+                time.sleep(settle_time)
+                timing.move.append(time.perf_counter() - start)
+
+                start = time.perf_counter()
+                frame = self.capture(context=context, save=save, detect=False)
+                timing.capture.append(time.perf_counter() - start)
+                images.append(frame)
+
+                if detector is not None:
+                    detector.submit(frame)
+        except BaseException:
+            # don't let waiting on detection block or replace the error that stopped the survey
+            if detector is not None:
+                detector.stop()
+            raise
+        if detector is not None:
+            detector.join()
 
         if detect:
-            object_detection = ObjectDetection()
             for frame in images:
-                frame.detections = object_detection.analyze(frame.img)
+                if context:
+                    estimate_all_buoy_gps(frame)
+                if self.frame_saver is not None:
+                    self.frame_saver.save(frame)
+                if annotate:
+                    draw_bbox(frame)
+
+        timing.total = time.perf_counter() - survey_start
+        self.last_survey_timing = timing
+        logging.info(timing)
 
         return images
 
@@ -0,0 +1,249 @@
+"""
+Long running camera capture session that keeps the most recent frames in memory
+    - The camera is opened once and a background thread keeps reading frames into a small ring buffer
+    - Camera.capture() takes the next frame from the buffer instead of starting libcamera-still and reading a jpg back from disk
+    - Every frame is stamped with when it was exposed, never later: the sensor's own timestamp where the source has
+      one (read_stamped()), otherwise the time the read started, so read(after=t) never returns a frame exposed before t
+    - Sources:
+        - picamera2: the Pi camera through libcamera (https://github.com/raspberrypi/picamera2)
+        - opencv: any V4L2/USB camera through cv2.VideoCapture
+        - fake: a still image (or blank frames) at a fixed rate, for testing without a camera
+"""
+import logging
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+import constants as c
+
+
+class Picamera2Source:
+    """Pi camera through picamera2, frames are BGR like cv2.imread()"""
+    def __init__(self, width, height, buffer_count=4):
+        self.width = width
+        self.height = height
+        self.buffer_count = buffer_count
+        self._camera = None
+
+    def open(self):
+        from picamera2 import Picamera2
+        self._camera = Picamera2()
+        # picamera2's RGB888 is stored B,G,R which is what OpenCV expects
+        config = self._camera.create_video_configuration(main={"size": (self.width, self.height), "format": "RGB888"},
+                                                         buffer_count=self.buffer_count)
+        self._camera.configure(config)
+        self._camera.start()
+
+    def read(self):
+        return self._camera.capture_array("main")
+
+    def read_stamped(self):
+        """(time.time() the frame was exposed, image) from the sensor timestamp in the frame's metadata"""
+        request = self._camera.capture_request()
+        try:
+            img = request.make_array("main")
+            sensor_ns = request.get_metadata().get("SensorTimestamp")
+        finally:
+            request.release()
+        if sensor_ns is None:
+            return None, img
+        # SensorTimestamp is CLOCK_BOOTTIME in nanoseconds
+        age = time.clock_gettime(time.CLOCK_BOOTTIME) - sensor_ns / 1e9
+        return time.time() - age, img
+
+    def close(self):
+        if self._camera is not None:
+            self._camera.stop()
+            self._camera.close()
+            self._camera = None
+
+
+class OpenCVSource:
+    """V4L2/USB camera through cv2.VideoCapture"""
+    def __init__(self, index, width, height):
+        self.index = index
+        self.width = width
+        self.height = height
+        self._cap = None
+
+    def open(self):
+        import cv2
+        self._cap = cv2.VideoCapture(self.index)
+        self._cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+        self._cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        self._cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # the ring buffer is ours, don't let the driver queue stale frames
+
+    def read(self):
+        ok, img = self._cap.read()
+        if not ok:
+            raise RuntimeError(f"Could not read from camera {self.index}")
+        return img
+
+    def close(self):
+        if self._cap is not None:
+            self._cap.release()
+            self._cap = None
+
+
+class FakeSource:
+    """
+    Stand-in camera for tests and the PC
+        - Returns a copy of 'image' (or a blank frame) 'fps' times per second
+
+    Attributes:
+        - count (int): frames returned so far
+    """
+    def __init__(self, width, height, fps=30, image=None):
+        self.width = width
+        self.height = height
+        self.period = 1 / fps
+        self.image = image
+        self.count = 0
+        self._base = None
+        self._next = 0.0
+
+    def open(self):
+        if self.image is None:
+            self._base = np.zeros((self.height, self.width, 3), dtype=np.uint8)
+        elif isinstance(self.image, str):
+            import cv2
+            self._base = cv2.imread(self.image)
+            if self._base is None:
+                raise RuntimeError(f"Could not read fake camera image {self.image}")
+        else:
+            self._base = np.asarray(self.image, dtype=np.uint8)
+        self._next = time.monotonic()
+
+    def read(self):
+        return self.read_stamped()[1]
+
+    def read_stamped(self):
+        """(time the fake frame is 'exposed', after waiting for its slot, image)"""
+        delay = self._next - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self._next = max(self._next + self.period, time.monotonic())
+        self.count += 1
+        return time.time(), self._base.copy()
+
+    def close(self):
+        pass
+
+
+def make_source(kind=c.config["CAMERA"]["stream_source"]):
+    """Creates the camera source set in [CAMERA] stream_source
+    Args:
+        - kind (str): 'picamera2', 'opencv', 'fake' or 'auto' (picamera2 on the pi, opencv on a pc)
+    """
+    width = int(c.config["CAMERA"]["resolution_width"])
+    height = int(c.config["CAMERA"]["resolution_height"])
+    if kind == "auto":
+        kind = "picamera2" if c.config["MAIN"]["device"] == "pi" else "opencv"
+
+    if kind == "picamera2":
+        return Picamera2Source(width, height, buffer_count=int(c.config["CAMERA"]["stream_buffer"]))
+    if kind == "opencv":
+        return OpenCVSource(int(c.config["CAMERA"]["source"]), width, height)
+    if kind == "fake":
+        return FakeSource(width, height, fps=float(c.config["CAMERA"]["fake_fps"]), image=c.config["CAMERA"]["fake_image"] or None)
+    raise ValueError(f"Unknown camera stream source '{kind}'")
+
+
+class CameraStream:
+    """
+    Reads frames from a camera source on a background thread into a ring buffer
+
+    Attributes:
+        - source: the Picamera2Source, OpenCVSource or FakeSource frames are read from
+        - frames_captured (int): frames read since start()
+        - errors (int): failed reads, the thread keeps retrying
+
+    Functions:
+        - start() - opens the source and starts the capture thread
+        - stop() - stops the capture thread and closes the source
+        - read() - waits for the next frame
+        - latest() - the newest buffered frame without waiting
+    """
+    def __init__(self, source, buffer_size=int(c.config["CAMERA"]["stream_buffer"])):
+        self.source = source
+        self.frames_captured = 0
+        self.errors = 0
+        self._frames = deque(maxlen=buffer_size)  # (time.time() of capture, image)
+        self._new_frame = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        if self._running:
+            return self
+        self.source.open()
+        self._running = True
+        self._thread = threading.Thread(target=self._capture_loop, name="CameraStream", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+        self.source.close()
+
+    def _capture_loop(self):
+        read_stamped = getattr(self.source, "read_stamped", None)
+        while self._running:
+            try:
+                # stamped before the read returns: a frame that was already waiting in the driver is older than
+                # the moment read() finishes, so stamping it afterwards could pass it off as newer than 'after'
+                started = time.time()
+                stamp, img = read_stamped() if read_stamped is not None else (None, self.source.read())
+                if stamp is None:
+                    stamp = started
+            except Exception as e:
+                self.errors += 1
+                logging.warning(f"Camera read failed: {e}")
+                time.sleep(0.1)
+                continue
+
+            with self._new_frame:
+                self._frames.append((stamp, img))
+                self.frames_captured += 1
+                self._new_frame.notify_all()
+
+    def latest(self):
+        """
+        Returns:
+            - (capture time, image) of the newest frame, (None, None) if nothing has been captured yet
+        """
+        with self._new_frame:
+            return self._frames[-1] if self._frames else (None, None)
+
+    def read(self, after=None, timeout=2.0):
+        """Waits for a frame captured after a given time
+            - After moving the camera servos, pass nothing so frames taken mid-move are skipped
+        Args:
+            - after (float): time.time() the frame must be newer than, defaults to now
+            - timeout (float): seconds to wait for a frame
+        Returns:
+            - (capture time, image)
+        Raises:
+            - RuntimeError: when no frame arrives within 'timeout'
+        """
+        if after is None:
+            after = time.time()
+        with self._new_frame:
+            frame = self._first_after(after)
+            if frame is None:
+                self._new_frame.wait_for(lambda: self._first_after(after) is not None, timeout=timeout)
+                frame = self._first_after(after)
+        if frame is None:
+            raise RuntimeError("No camera image detected!")
+        return frame
+
+    def _first_after(self, after):
+        for frame in self._frames:
+            if frame[0] > after:
+                return frame
+        return None
@@ -0,0 +1,72 @@
+"""
+Coalesces repeated actuator commands so only meaningful changes are sent to the drivers
+"""
+import time
+
+
+class CommandFilter:
+    """
+    Decides whether a new actuator setpoint is worth publishing
+        - A setpoint is only sent when it moves more than 'deadband' degrees from the last one sent
+        - Sends are limited to 'max_rate' per second, a held back change goes out on the first call after the limit expires
+        - The last setpoint is resent every 'keepalive' seconds even if nothing changed, 0 disables the keepalive
+
+    Attributes:
+        - deadband (float): the smallest change (in degrees) that is published
+        - min_interval (float): the shortest time in seconds between two published commands
+        - keepalive (float): how often in seconds the last command is repeated
+        - last_sent (float): the last published setpoint, None if nothing has been sent yet
+        - sent (int): how many commands were published
+        - suppressed (int): how many commands were dropped
+
+    Functions:
+        - should_send() - checks a setpoint and records it as sent if it should be published
+        - reset() - forget the last setpoint so the next command is always sent
+    """
+
+    def __init__(self, deadband=0.0, max_rate=0.0, keepalive=0.0):
+        """
+        Args:
+            - deadband (float): the smallest change (in degrees) that is published
+            - max_rate (float): maximum commands per second, 0 for unlimited
+            - keepalive (float): seconds between repeats of an unchanged command, 0 to disable
+        """
+        self.deadband = deadband
+        self.min_interval = 1 / max_rate if max_rate > 0 else 0.0
+        self.keepalive = keepalive
+        self.sent = 0
+        self.suppressed = 0
+        self.reset()
+
+    def reset(self):
+        self.last_sent = None
+        self._last_time = None
+
+    def should_send(self, value, force=False, now=None):
+        """Checks whether 'value' should be published
+        Args:
+            - value (float): the new setpoint
+            - force (bool): always publish, ex. when returning the actuators home on shutdown
+            - now (float): the current time.monotonic(), supplied by callers that already have it
+        Returns:
+            - True if the command should be published (and records it as sent), otherwise False
+        """
+        if now is None:
+            now = time.monotonic()
+
+        if force or self.last_sent is None:
+            send = True
+        else:
+            elapsed = now - self._last_time
+            if abs(value - self.last_sent) > self.deadband:
+                send = elapsed >= self.min_interval
+            else:
+                send = self.keepalive > 0 and elapsed >= self.keepalive
+
+        if send:
+            self.last_sent = value
+            self._last_time = now
+            self.sent += 1
+        else:
+            self.suppressed += 1
+        return send
@@ -17,8 +17,13 @@ import math
 
 import rclpy
 from rclpy.node import Node
-from std_msgs.msg import String
 
+try:
+    import constants as c
+    import rosMessages
+except:
+    import sailbot.constants as c
+    import sailbot.rosMessages as rosMessages
 from utils import singleton
 
 
@@ -39,15 +44,29 @@ class compass(Node):
         self.averagedAngle = 0
 
         super().__init__('Compass')
-        self.pub = self.create_publisher(String, 'compass', 10)
-        timer_period = 0.5  # seconds
+        self.pub = self.create_publisher(rosMessages.Imu, rosMessages.COMPASS_TOPIC, 10)
+        self.legacy_pub = None
+        if int(c.config['ROS']['legacy_string_topics']):
+            self.legacy_pub = self.create_publisher(rosMessages.String, rosMessages.LEGACY_COMPASS_TOPIC, 10)
+        timer_period = 1 / float(c.config['ESTIMATOR']['compass_rate'])  # seconds
         self.timer = self.create_timer(timer_period, self.timer_callback)
 
     def timer_callback(self):
-        msg = String()
-        msg.data = F"{self.angle}"
-        self.pub.publish(msg)
-        self.get_logger().info('Publishing: "%s"' % msg.data)
+        try:
+            angle = self.angle
+        except Exception as e:
+            self.get_logger().warning(F"Compass read failed: {e}")
+            angle = None
+        try:
+            acceleration = self.accel.acceleration
+        except Exception as e:
+            self.get_logger().warning(F"Accelerometer read failed: {e}")
+            acceleration = None
+        self.pub.publish(rosMessages.make_heading(self, angle, acceleration))
+
+        if self.legacy_pub is not None:
+            self.legacy_pub.publish(rosMessages.make_legacy_string(F"{angle}"))
+        self.get_logger().debug(F'Publishing: {angle}')
 
     def run(self):
         pass
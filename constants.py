@@ -17,12 +17,13 @@ else:
 config = configparser.ConfigParser()
 config.read(F'{prefix}config.ini')
 
-logging.basicConfig(filename="log.log",
-                    filemode='a',
-                    format='%(asctime)s,%(msecs)d %(name)s %(levelname)s %(message)s',
-                    datefmt='%H:%M:%S',
-                    level=logging.DEBUG)
-    
+# log records are written to log.log by a background thread, see boatLogging.py
+try:
+    import boatLogging
+except ImportError:
+    import sailbot.boatLogging as boatLogging
+boatLogging.setup(config)
+
 def save():
     with open('../config.ini', 'w') as configfile:
         config.write(configfile) 
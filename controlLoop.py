@@ -0,0 +1,89 @@
+"""
+Timing statistics for the boat's fixed-rate control loop
+"""
+import logging
+import time
+
+
+class LoopStats:
+    """
+    Measures how well a fixed-rate loop keeps to its schedule
+        - Call start() at the top of every tick and stop() at the end
+        - Jitter is how late/early a tick started compared to when it was scheduled
+        - An overrun is a tick whose work took longer than the loop period (missed its deadline)
+
+    Attributes:
+        - period (float): the nominal time between ticks in seconds
+        - ticks (int): how many ticks have completed
+        - overruns (int): how many ticks missed their deadline
+        - max_jitter (float): worst absolute start jitter in seconds
+        - max_exec (float): longest time spent inside a single tick in seconds
+
+    Functions:
+        - start() - marks the beginning of a tick
+        - stop() - marks the end of a tick and updates the statistics
+        - summary() - human readable statistics for logging
+        - reset() - clears all statistics
+    """
+
+    def __init__(self, period, report_interval=30):
+        """
+        Args:
+            - period (float): the nominal time between ticks in seconds
+            - report_interval (float): how often (in seconds) to log a summary, 0 to disable
+        """
+        self.period = period
+        self.report_interval = report_interval
+        self.reset()
+
+    def reset(self):
+        self.ticks = 0
+        self.overruns = 0
+        self.max_jitter = 0.0
+        self.max_exec = 0.0
+        self._sum_jitter = 0.0
+        self._sum_exec = 0.0
+        self._last_start = None
+        self._tick_start = None
+        self._last_report = time.monotonic()
+
+    @property
+    def mean_jitter(self):
+        return self._sum_jitter / max(self.ticks - 1, 1)
+
+    @property
+    def mean_exec(self):
+        return self._sum_exec / max(self.ticks, 1)
+
+    def start(self):
+        now = time.monotonic()
+        if self._last_start is not None:
+            jitter = abs((now - self._last_start) - self.period)
+            self._sum_jitter += jitter
+            self.max_jitter = max(self.max_jitter, jitter)
+        self._last_start = now
+        self._tick_start = now
+
+    def stop(self):
+        if self._tick_start is None:
+            return
+        now = time.monotonic()
+        elapsed = now - self._tick_start
+        self._tick_start = None
+
+        self.ticks += 1
+        self._sum_exec += elapsed
+        self.max_exec = max(self.max_exec, elapsed)
+        if elapsed > self.period:
+            self.overruns += 1
+            logging.warning(f"Control loop overran its deadline: tick took {elapsed * 1000:.1f}ms "
+                            f"(period {self.period * 1000:.1f}ms)")
+
+        if self.report_interval and now - self._last_report >= self.report_interval:
+            logging.info(self.summary())
+            self._last_report = now
+
+    def summary(self):
+        return (f"Control loop @ {1 / self.period:.1f}Hz: {self.ticks} ticks, {self.overruns} overruns, "
+                f"exec mean {self.mean_exec * 1000:.2f}ms max {self.max_exec * 1000:.2f}ms, "
+                f"jitter mean {self.mean_jitter * 1000:.2f}ms max {self.max_jitter * 1000:.2f}ms")
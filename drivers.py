@@ -2,22 +2,31 @@
 hadles turning motors using Odrive/Stepper driver 
 """
 
+import logging
+
 import board
 import busio
 #import adafruit_pca9685 as pcaLib
 import rclpy
 from rclpy.node import Node
-from std_msgs.msg import String
 try:
     import constants as c
+    import boatLogging
+    import rosMessages
     import stepper
     from Odrive import Odrive
     from windvane import windVane
+    from polar import Polar
+    import settings
 except:
     import sailbot.constants as c
+    import sailbot.boatLogging as boatLogging
+    import sailbot.rosMessages as rosMessages
     import sailbot.stepper as stepper
     from sailbot.Odrive import Odrive
     from sailbot.windvane import windVane
+    from sailbot.polar import Polar
+    import sailbot.settings as settings
 
 from threading import Thread
 from RPi import GPIO
@@ -47,6 +56,7 @@ class obj_sail:
     def __init__(self, auto = False):
         self.autoAdjust = auto
         self.current = 0
+        self.polar = Polar.load()
         if USE_STEPPER_SAIL:
             self.step = stepper.stepperDriver(SAIL_DIR_PIN, SAIL_PUL_PIN)
         if USE_ODRIVE_SAIL:
@@ -60,7 +70,7 @@ class obj_sail:
         return min2 + (max2-min2)*((x-min1)/(max1-min1))
 
     def set(self, degrees):
-        print(F"setting sail: {degrees}")
+        logging.debug("setting sail: %s", degrees)
         degrees = float(degrees)
 
         if USE_STEPPER_SAIL:
@@ -72,17 +82,14 @@ class obj_sail:
                 self.step.turn(True, -self.steps)
 
         if USE_ODRIVE_SAIL:
-            val = self.map(degrees, 0, 90, 0, float(c.config['ODRIVE']['odriveSailRotations']))
+            val = self.map(degrees, 0, 90, 0, settings.current().odrive_sail_rotations)
             DRV.posSet(self.odriveAxis, val)
         self.current = degrees
     
     def autoAdjustSail(self):
         while True:
             if self.autoAdjust == True:
-                windDir = self.windvane.angle
-                if windDir > 180:
-                    windDir = 180 - (windDir - 180)
-                targetAngle = max(min(windDir / 2, 90), 3)
+                targetAngle = float(self.polar.sail_angle(self.windvane.angle))
                 self.set(targetAngle)
 
                 
@@ -105,7 +112,7 @@ class obj_rudder:
         return min2 + (max2-min2)*((x-min1)/(max1-min1))
     
     def set(self, degrees):
-        print(F"setting rudder: {degrees}")
+        logging.debug("setting rudder: %s", degrees)
         degrees = float(degrees)
         
         if USE_STEPPER_RUDDER:
@@ -122,7 +129,8 @@ class obj_rudder:
                 self.step.turn(False, -self.steps)
 
         if USE_ODRIVE_RUDDER:
-            val = self.map(degrees, float(c.config['CONSTANTS']['rudder_angle_min']), float(c.config['CONSTANTS']['rudder_angle_max']), -float(c.config['ODRIVE']['odriveRudderRotations'])/2, float(c.config['ODRIVE']['odriveRudderRotations'])/2)
+            config = settings.current()
+            val = self.map(degrees, config.rudder_angle_min, config.rudder_angle_max, -config.odrive_rudder_rotations/2, config.odrive_rudder_rotations/2)
             DRV.posSet(self.odriveAxis, val)
             #print(F"set rudder to {val} {degrees}")
 
@@ -139,22 +147,30 @@ class driver(Node):
         self.sail = obj_sail()
         self.rudder = obj_rudder()
 
-        self.driver_subscription = self.create_subscription(String, 'driver', self.ROS_Callback, 10)
+        self.sail_subscription = self.create_subscription(rosMessages.Float64, rosMessages.SAIL_TOPIC, self.ROS_SailCallback, 10)
+        self.rudder_subscription = self.create_subscription(rosMessages.Float64, rosMessages.RUDDER_TOPIC, self.ROS_RudderCallback, 10)
+        # old string commands are still accepted so manual 'ros2 topic pub' commands keep working
+        self.driver_subscription = self.create_subscription(rosMessages.String, rosMessages.LEGACY_DRIVER_TOPIC, self.ROS_Callback, 10)
+
+    def ROS_SailCallback(self, msg):
+        self.sail.set(msg.data)
+
+    def ROS_RudderCallback(self, msg):
+        self.rudder.set(msg.data)
 
     def ROS_Callback(self, string):
         # string = (driver:sail/rudder:{targetAngle})
-        resolved = False
-        args = string.data.replace('(', '').replace(')', "").split(":")
-        if args[0] == 'driver':
-            if args[1] == 'sail':
-                self.sail.set(float(args[2]))
-                resolved = True
-            elif args[1] == 'rudder':
-                self.rudder.set(float(args[2]))
-                resolved = True
+        try:
+            command = rosMessages.parse_legacy_driver(string.data)
+        except ValueError:
+            command = None
 
-        if not resolved:
-            print(F"driver failed to resolve command: {string.data}, parsed to {args}")
+        if command is None:
+            logging.warning("driver failed to resolve command: %s", string.data)
+        elif command[0] == 'sail':
+            self.sail.set(command[1])
+        else:
+            self.rudder.set(command[1])
 
 
 def main(args = None):
@@ -163,7 +179,8 @@ def main(args = None):
     try:
         rclpy.spin(drv)
     except Exception as e:
-        print(F"exception rased in driver {e}")
+        logging.exception("exception raised in driver")
+        boatLogging.dump_ring()
     # Destroy the node explicitly
     # (optional - otherwise it will be done automatically
     # when the garbage collector destroys the node object)
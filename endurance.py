@@ -33,16 +33,16 @@ class Endurance(Event):
             event_info = [(b1_lat, b1_long),(b2_lat, b2_long),(b3_lat, b3_long), (b4_lat, b4_long)]
     """
     
-    def __init__(self, event_info):
+    def __init__(self, event_info, gps=None, windvane=None):
         if len(event_info) != REQUIRED_ARGS:
             raise TypeError(f"Expected {REQUIRED_ARGS} arguments, got {len(event_info)}")
         
-        super().__init__(event_info)
+        super().__init__(event_info, gps=gps, windvane=windvane)
         logging.info("Endurance moment")
 
         # BOAT STATE
-        self.waypoint_queue = event_info
-        rounding_buffer = c.config["ENDURANCE"]["rounding_buffer"]
+        self.waypoint_queue = [Waypoint(buoy.lat, buoy.lon) for buoy in event_info]    # copies, add_meters moves them
+        rounding_buffer = float(c.config["ENDURANCE"]["rounding_buffer"])
         for buoy in self.waypoint_queue:
             buoy.add_meters(rounding_buffer, rounding_buffer)
         self.waypoint_queue *= 10
@@ -58,9 +58,9 @@ class Endurance(Event):
             - OR EventFinished exception to signal that the event has been completed
         """
 
-        if has_reached_waypoint(self.waypoint_queue[0], distance=10):
+        if has_reached_waypoint(self.gps, self.waypoint_queue[0], distance=10):
             logging.info("Rounded buoy")
-            self.waypoint_queue.pop()
+            self.waypoint_queue.pop(0)
 
         if len(self.waypoint_queue) == 0:
             raise EventFinished
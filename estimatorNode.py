@@ -0,0 +1,85 @@
+"""
+ROS node running the state estimator (stateEstimator.py)
+    - Subscribes to the GPS fix/velocity, compass (heading and accelerometer) and rudder command topics
+    - Publishes the fused state at [ESTIMATOR] rate on state/fix and state/odom, predicted to the publish time
+"""
+import logging
+
+import rclpy
+from rclpy.node import Node
+
+try:
+    import constants as c
+    import rosMessages
+    from stateEstimator import BoatEKF
+except ImportError:
+    import sailbot.constants as c
+    import sailbot.rosMessages as rosMessages
+    from sailbot.stateEstimator import BoatEKF
+
+
+class stateEstimator(Node):
+    """
+    Attributes:
+        - ekf (stateEstimator.BoatEKF)
+        - state (stateEstimator.BoatState): the latest published state, None before the first GPS fix
+    """
+    def __init__(self):
+        super().__init__('StateEstimator')
+        self.ekf = BoatEKF()
+        self.state = None
+        self.accel_axis = int(c.config['ESTIMATOR']['accel_axis'])
+        self.accel_sign = float(c.config['ESTIMATOR']['accel_sign'])
+
+        self.create_subscription(rosMessages.NavSatFix, rosMessages.GPS_FIX_TOPIC, self.ROS_GPSCallback, 10)
+        self.create_subscription(rosMessages.TwistStamped, rosMessages.GPS_VEL_TOPIC, self.ROS_GPSVelCallback, 10)
+        self.create_subscription(rosMessages.Imu, rosMessages.COMPASS_TOPIC, self.ROS_compassCallback, 10)
+        self.create_subscription(rosMessages.Float64, rosMessages.RUDDER_TOPIC, self.ROS_rudderCallback, 10)
+
+        self.fix_pub = self.create_publisher(rosMessages.NavSatFix, rosMessages.STATE_FIX_TOPIC, 10)
+        self.state_pub = self.create_publisher(rosMessages.Odometry, rosMessages.STATE_TOPIC, 10)
+        self.timer = self.create_timer(1 / float(c.config['ESTIMATOR']['rate']), self.timer_callback)
+
+    def now(self):
+        return rosMessages.stamp_to_seconds(self.get_clock().now().to_msg())
+
+    def ROS_GPSCallback(self, msg):
+        lat, lon, stamp = rosMessages.read_gps_fix(msg)
+        self.ekf.update_gps(lat, lon, stamp, std=rosMessages.read_gps_std(msg))
+
+    def ROS_GPSVelCallback(self, msg):
+        speed, track, stamp = rosMessages.read_gps_vel(msg)
+        self.ekf.update_gps_velocity(speed, track, stamp)
+
+    def ROS_compassCallback(self, msg):
+        heading, stamp = rosMessages.read_heading(msg)
+        acceleration = rosMessages.read_acceleration(msg)
+        if self.accel_axis >= 0:
+            self.ekf.set_acceleration(None if acceleration is None else self.accel_sign * acceleration[self.accel_axis])
+        self.ekf.update_compass(heading, stamp)
+
+    def ROS_rudderCallback(self, msg):
+        self.ekf.set_rudder(msg.data)
+
+    def timer_callback(self):
+        state = self.ekf.state(self.now())
+        if state is None:
+            return
+        self.state = state
+        self.fix_pub.publish(rosMessages.make_gps_fix(self, state.latitude, state.longitude, std=state.position_std))
+        self.state_pub.publish(rosMessages.make_state(self, state))
+        self.get_logger().debug(F'Publishing: {state.latitude},{state.longitude} {state.heading:.1f}deg {state.speed:.2f}m/s')
+
+
+def main(args=None):
+    rclpy.init(args=args)
+    estimator = stateEstimator()
+    logging.info("State estimator started")
+    rclpy.spin(estimator)
+
+    estimator.destroy_node()
+    rclpy.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -8,10 +8,10 @@ from dataclasses import dataclass
 import math
 import time
 
-import constants as c
+import numpy as np
 
-if c.config["MAIN"]["DEVICE"] == "pi":
-    from GPS import gps
+import constants as c
+from boatMath import haversine, haversine_array
 
 
 @dataclass(slots=True)
@@ -45,14 +45,19 @@ class Event:
     Attributes: 
         - event_info (array) - provided starter information about the event
             - event_info = []
+        - gps - the boat's position fix (latitude, longitude), boatMain passes its ROS fed one
+        - windvane - the boat's windvane (angle, position), None if the event doesn't need it
     
     Functions:
         - next_gps() - event logic which determines where to sail to next
+        - state_code() - event progress for the flight recorder
     """
     
-    def __init__(self, event_info, debugInp=False):        
+    def __init__(self, event_info, debugInp=False, gps=None, windvane=None):        
         self.event_info = event_info
         self.DEBUG=debugInp
+        self.gps = gps
+        self.windvane = windvane
         
     @abstractmethod
     def next_gps(self):
@@ -66,40 +71,23 @@ class Event:
         """
 
         raise 
+
+    def state_code(self):
+        """
+        Small number describing where the event logic is, saved by the flight recorder each tick (-1 if not tracked)
+        """
+        return -1
     
     def gps_spoof(self):
         inp = input("GPS: ")
-        gps.latitude = inp.split(" ")[0]
-        gps.longitude = inp.split(" ")[1]
+        self.gps.latitude = float(inp.split(" ")[0])
+        self.gps.longitude = float(inp.split(" ")[1])
             
 class EventFinished(Exception):
     """Signals that the event is finished and that it is safe to return to manual control"""
     pass
 
 
-"""
-def PID():  #hana
-    total_error = 0.0
-    oldError = 0.0
-    oldTime = time.time()
-    last_pnt_x, .last_pnt_y = None,None
-    gps_class = gps()
-    # New PID stuff
-    if (time.time() - oldTime < 100):  # Only runs every tenth of a second #new
-        # Finds the angle the boat should take
-        error = boat_RefObj.targetAngle - compass.angle  # Finds how far off the boat is from its goal
-        totalError += error  # Gets the total error to be used for the integral gain
-        derivativeError = (error - oldError) / (time.time() - oldtime)  # Gets the change in error for the derivative portion
-        deltaAngle = c.config['CONSTANTS']["P"] * error + c.config['CONSTANTS']["I"] * totalError + c.config['CONSTANTS']["D"] * derivativeError  # Finds the angle the boat should be going
-
-        # Translates the angle into lat and log so goToGPS won't ignore it
-        boat_RefObj.currentAngle = getCoordinateADistanceAlongAngle(1000, deltaAngle + self.boat_RefObj.compass.angle)
-
-        # Resets the variable
-        oldTime = time.time()
-        oldError = error
-"""
-
 def SK_f(self,x,a1,b1,a2,b2): return self.SK_m(a1,b1,a2,b2)*x + self.SK_v(a1,b1,a2,b2)  #f(x)=mx+b
 def SK_m(self,a1,b1,a2,b2): return (b2-b1)/(a2-a1)                                      #m: slope between two lines
 def SK_v(self,a1,b1,a2,b2): return b1-(self.SK_m(a1,b1,a2,b2)*a1)                       #b: +y between two lines
@@ -115,22 +103,22 @@ def distance_between(waypoint1, waypoint2):
     # Returns:
         - distance in meters between points (float)
     """
-    EARTH_RADIUS = 6371000
+    return haversine(waypoint1.lat, waypoint1.lon, waypoint2.lat, waypoint2.lon)
 
-    # Convert latitude and longitude to radians
-    lat1, lon1, lat2, lon2 = map(math.radians, [waypoint1.lat, waypoint1.lon, waypoint2.lat, waypoint2.lon])
 
-    # Haversine formula
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-    a = math.sin(dlat / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon / 2) ** 2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    
-    distance = EARTH_RADIUS * c
+def waypoints_to_array(waypoints):
+    """Converts a list of Waypoints into an N x 2 numpy array of (lat, lon)"""
+    return np.array([(waypoint.lat, waypoint.lon) for waypoint in waypoints], dtype=float).reshape(-1, 2)
 
-    return distance
+
+def distances_between(waypoint, waypoints):
+    """Distance in meters from one Waypoint to each of a list of Waypoints in one vectorized call
+    # Returns:
+        - np.ndarray of distances, in the same order as waypoints
+    """
+    return haversine_array((waypoint.lat, waypoint.lon), waypoints_to_array(waypoints))
 
 
-def has_reached_waypoint(waypoint, distance=float(c.config["CONSTANTS"]["reached_waypoint_distance"])):
-    """Returns true/false if the boat is close enough to the waypoint"""
-    return distance_between(gps.GPS, waypoint) < distance
+def has_reached_waypoint(gps, waypoint, distance=float(c.config["CONSTANTS"]["reached_waypoint_distance"])):
+    """Returns true/false if the boat (at the fix 'gps') is close enough to the waypoint"""
+    return haversine(gps.latitude, gps.longitude, waypoint.lat, waypoint.lon) < distance
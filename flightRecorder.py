@@ -0,0 +1,394 @@
+"""
+Binary flight data recorder: what the boat sensed and commanded on every control tick
+    - Each sample is a fixed-size little endian record (RECORD below), files are a small header followed by records,
+      so a file can be memory mapped straight into a numpy structured array
+    - The control loop only copies values into an in-memory batch, full batches are written by a background thread
+      so a slow SD card never stalls the loop
+    - Files rotate at [RECORDER] file_size_mb, the oldest files are deleted to keep the directory under budget_mb
+    - Missing values (no GPS fix, no windvane) are NaN
+    - load() reads a run back: a 7 hour endurance run at 10 Hz (~250k records, ~20MB) loads in well under a second
+    - Things that aren't per-tick samples go to notes.jsonl (note()), ex. the mode and event info the boat was given,
+      also written by the background thread
+    - FrameSaver keeps the camera frames events used, with their detections, so replay.py can feed them back
+
+File layout:
+    - 4 bytes   magic b'SBFR'
+    - 2 bytes   format version
+    - 2 bytes   header size H
+    - 2 bytes   record size
+    - 2 bytes   length of the JSON description
+    - JSON      {"fields": numpy dtype description, "start": unix time the file was opened}, zero padded to H bytes
+    - records   until the end of the file, a partly written last record is ignored
+
+Usage:
+    python3 flightRecorder.py flights/          (prints a summary of the recorded runs)
+    python3 flightRecorder.py --benchmark       (writes and loads a simulated 7 hour run)
+"""
+import glob
+import json
+import logging
+import os
+import queue
+import struct
+import threading
+import time
+
+import numpy as np
+
+try:
+    import constants as c
+except ImportError:
+    import sailbot.constants as c
+
+NOTES = "notes.jsonl"
+MAGIC = b"SBFR"
+VERSION = 1
+HEADER_SIZE = 1024
+_PREFIX = struct.Struct("<4sHHHH")
+
+RECORD = np.dtype([
+    ("time", "<f8"),            # unix time of the control tick
+    ("lat", "<f8"),             # GPS position
+    ("lon", "<f8"),
+    ("target_lat", "<f8"),      # waypoint goToGPS is steering to
+    ("target_lon", "<f8"),
+    ("gps_speed", "<f4"),       # m/s over ground
+    ("gps_track", "<f4"),       # degrees
+    ("heading", "<f4"),         # compass degrees
+    ("wind_angle", "<f4"),      # windvane, degrees relative to the bow
+    ("sail_cmd", "<f4"),        # sail/rudder the control loop decided on
+    ("rudder_cmd", "<f4"),
+    ("sail", "<f4"),            # sail/rudder last sent to the drivers (after the command filter)
+    ("rudder", "<f4"),
+    ("mode", "i1"),             # boatMain.MODE_SETTING
+    ("manual", "u1"),           # 1 in RC mode
+    ("event_state", "<i2"),     # Event.state_code()
+])
+
+
+def _nan_record():
+    record = np.zeros((), dtype=RECORD)
+    for name in RECORD.names:
+        if RECORD[name].kind == "f":
+            record[name] = np.nan
+    return record
+
+
+def _header(dtype, start):
+    description = json.dumps({"fields": dtype.descr, "start": start}).encode()
+    if _PREFIX.size + len(description) > HEADER_SIZE:
+        raise ValueError("Record description doesn't fit in the header")
+    prefix = _PREFIX.pack(MAGIC, VERSION, HEADER_SIZE, dtype.itemsize, len(description))
+    return (prefix + description).ljust(HEADER_SIZE, b"\0")
+
+
+def read_header(path):
+    """
+    Returns:
+        - (dtype, header size, start time) of a recorder file
+    """
+    with open(path, "rb") as f:
+        prefix = f.read(_PREFIX.size)
+        magic, version, header_size, record_size, length = _PREFIX.unpack(prefix)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a flight recorder file")
+        description = json.loads(f.read(length))
+    dtype = np.dtype([tuple(field) for field in description["fields"]])
+    if dtype.itemsize != record_size:
+        raise ValueError(f"{path}: record size {record_size} doesn't match its fields")
+    return dtype, header_size, description["start"]
+
+
+class FlightRecorder:
+    """
+    Attributes:
+        - directory (str): where flight_<time>.bin files are written
+        - records (int): samples recorded since start
+        - dropped (int): batches (and notes) lost because the writer thread fell behind
+        - path (str): the file being written
+
+    Functions:
+        - record() - add one sample, called from the control loop
+        - flush() - hand the current batch to the writer without waiting for it to fill
+        - note() - save a one-off event (not a sample) to notes.jsonl
+        - close() - write everything out and stop the writer thread
+    """
+
+    def __init__(self, directory=c.config["RECORDER"]["directory"],
+                 file_size_mb=float(c.config["RECORDER"]["file_size_mb"]),
+                 budget_mb=float(c.config["RECORDER"]["budget_mb"]),
+                 batch_records=int(c.config["RECORDER"]["batch_records"]), dtype=RECORD):
+        """
+        Args:
+            - file_size_mb (float): start a new file after this many MB
+            - budget_mb (float): delete the oldest files once the directory holds more than this
+            - batch_records (int): records collected in memory before they are written
+        """
+        self.directory = directory
+        self.file_size = int(file_size_mb * 1e6)
+        self.budget = int(budget_mb * 1e6)
+        self.dtype = dtype
+        self.records = 0
+        self.dropped = 0
+        self.path = None
+
+        self._empty = _nan_record() if dtype is RECORD else np.zeros((), dtype=dtype)
+        self._batch = np.empty(batch_records, dtype=dtype)
+        self._count = 0
+        self._file = None
+        self._queue = queue.Queue(maxsize=64)
+        os.makedirs(directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._write_loop, name="FlightRecorder", daemon=True)
+        self._thread.start()
+
+    def record(self, **values):
+        """Adds one sample, fields that aren't given are NaN/0
+        Args:
+            - values: RECORD field name -> value, None is stored as missing
+        """
+        self._batch[self._count] = self._empty
+        row = self._batch[self._count]  # a view into the batch
+        for name, value in values.items():
+            if value is not None:
+                row[name] = value
+        self._count += 1
+        self.records += 1
+        if self._count == len(self._batch):
+            self.flush()
+
+    def flush(self):
+        if not self._count:
+            return
+        batch = self._batch[:self._count].copy()
+        self._count = 0
+        try:
+            self._queue.put_nowait(batch)
+        except queue.Full:
+            self.dropped += 1
+
+    def note(self, kind, **data):
+        """Queues {'time', 'kind', **data} to be appended to notes.jsonl by the writer thread
+        Args:
+            - data: has to be JSON serializable, it is serialized now so later changes aren't saved
+        """
+        line = json.dumps({"time": time.time(), "kind": kind, **data}) + "\n"
+        try:
+            self._queue.put_nowait(line)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        self.flush()
+        self._queue.put(None)
+        self._thread.join(timeout=10)
+
+    # ---------------------------------- WRITER THREAD ----------------------------------
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            if isinstance(item, str):
+                self._write_note(item)
+                continue
+            try:
+                self._write(item)
+            except OSError as e:
+                logging.error(f"Flight recorder couldn't write {self.path}: {e}")
+                self._file = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _write_note(self, line):
+        try:
+            with open(os.path.join(self.directory, NOTES), "a") as f:
+                f.write(line)
+        except OSError as e:
+            logging.error(f"Flight recorder couldn't write a note: {e}")
+
+    def _write(self, batch):
+        if self._file is None or self._file.tell() + batch.nbytes > self.file_size:
+            self._rotate(float(batch["time"][0]) if "time" in batch.dtype.names else time.time())
+        self._file.write(batch.tobytes())
+        self._file.flush()
+
+    def _rotate(self, start):
+        if self._file is not None:
+            self._file.close()
+        name = time.strftime("flight_%Y%m%d-%H%M%S", time.localtime(start))
+        path = os.path.join(self.directory, f"{name}.bin")
+        suffix = 1
+        while os.path.exists(path):
+            path = os.path.join(self.directory, f"{name}_{suffix}.bin")
+            suffix += 1
+        self.path = path
+        self._file = open(path, "wb")
+        self._file.write(_header(self.dtype, start))
+        self._enforce_budget()
+
+    def _enforce_budget(self):
+        files = sorted(glob.glob(os.path.join(self.directory, "flight_*.bin")), key=os.path.getmtime)
+        sizes = [os.path.getsize(path) for path in files]
+        total = sum(sizes)
+        for path, size in zip(files, sizes):
+            # leave room for the file just started to fill up
+            if total + self.file_size <= self.budget or path == self.path:
+                break
+            os.remove(path)
+            total -= size
+            logging.info(f"Flight recorder deleted {path} to stay under {self.budget / 1e6:.0f}MB")
+
+
+class FrameSaver:
+    """
+    Saves camera frames with their metadata and detections, written by a background thread
+        - <time>.jpg is the image, <time>.json has the time, camera gps/heading/pitch and detections
+          (box, confidence and estimated position)
+    """
+    def __init__(self, directory=c.config["RECORDER"]["frames_directory"]):
+        self.directory = directory
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=16)
+        os.makedirs(directory, exist_ok=True)
+        threading.Thread(target=self._write_loop, name="FrameSaver", daemon=True).start()
+
+    def save(self, frame):
+        """Queues a camera.Frame, its metadata is copied now so later changes to the frame aren't saved"""
+        try:
+            self._queue.put_nowait((frame_metadata(frame), getattr(frame, "img", None)))
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self):
+        """Waits until every queued frame is written"""
+        self._queue.join()
+
+    def _write_loop(self):
+        while True:
+            metadata, img = self._queue.get()
+            name = os.path.join(self.directory, f"{metadata['time']:.3f}")
+            try:
+                if img is not None:
+                    import cv2  # only needed on the boat, simulated frames have no image
+                    cv2.imwrite(name + ".jpg", img)
+                with open(name + ".json", "w") as f:
+                    json.dump(metadata, f)
+            except OSError as e:
+                logging.error(f"Couldn't save frame {name}: {e}")
+            finally:
+                self._queue.task_done()
+
+
+def frame_metadata(frame):
+    def position(waypoint):
+        return None if waypoint is None else [float(waypoint.lat), float(waypoint.lon)]
+    # simulated frames (scenarioRunner.SimCamera) only have some of these
+    def get(item, name):
+        value = getattr(item, name, None)
+        return None if value is None else float(value)
+    return {"time": get(frame, "time") or time.time(), "gps": position(getattr(frame, "gps", None)),
+            "heading": get(frame, "heading"), "pitch": get(frame, "pitch"),
+            "detections": [{"x": get(d, "x"), "y": get(d, "y"), "w": get(d, "w"), "h": get(d, "h"),
+                            "conf": get(d, "conf"), "gps": position(getattr(d, "gps", None))} for d in frame.detections]}
+
+
+# ---------------------------------- READING ----------------------------------
+
+def read_notes(directory):
+    """The notes of a recording directory as a list of dicts, oldest first"""
+    path = os.path.join(directory, NOTES)
+    if not os.path.isfile(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def read_frames(directory):
+    """
+    Returns:
+        - list of (metadata dict, image path or None) saved by FrameSaver, oldest first
+    """
+    frames = []
+    for path in glob.glob(os.path.join(directory, "*.json")):
+        with open(path) as f:
+            metadata = json.load(f)
+        image = path[:-len(".json")] + ".jpg"
+        frames.append((metadata, image if os.path.isfile(image) else None))
+    return sorted(frames, key=lambda frame: frame[0]["time"])
+
+
+def open_file(path):
+    """Memory maps one recorder file
+    Returns:
+        - read-only numpy structured array (np.memmap) of its records
+    """
+    dtype, header_size, _ = read_header(path)
+    count = (os.path.getsize(path) - header_size) // dtype.itemsize
+    if count <= 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", offset=header_size, shape=(count,))
+
+
+def flight_files(path):
+    """Recorder files of a directory in the order they were written, or [path] for a single file"""
+    if os.path.isdir(path):
+        return sorted(glob.glob(os.path.join(path, "flight_*.bin")), key=lambda file: (read_header(file)[2], file))
+    return [path]
+
+
+def load(path, start=None, end=None):
+    """Reads recorded samples into memory
+    Args:
+        - path (str): a recorder file or a directory of them
+        - start, end (float): only keep samples between these unix times
+    Returns:
+        - numpy structured array, ex. data['heading'], data['time']
+    """
+    parts = [open_file(file) for file in flight_files(path)]
+    parts = [part for part in parts if len(part)]
+    if not parts:
+        return np.zeros(0, dtype=RECORD)
+    data = np.concatenate(parts) if len(parts) > 1 else np.array(parts[0])
+    if start is not None or end is not None:
+        times = data["time"]
+        keep = np.ones(len(data), dtype=bool)
+        if start is not None:
+            keep &= times >= start
+        if end is not None:
+            keep &= times <= end
+        data = data[keep]
+    return data
+
+
+if __name__ == "__main__":
+    import sys
+    import tempfile
+
+    if len(sys.argv) == 2 and sys.argv[1] == "--benchmark":
+        with tempfile.TemporaryDirectory() as directory:
+            recorder = FlightRecorder(directory, file_size_mb=16, budget_mb=1000, batch_records=100)
+            samples = 7 * 3600 * 10
+            start = time.perf_counter()
+            for i in range(samples):
+                t = 1.7e9 + i / 10
+                recorder.record(time=t, lat=42 + i * 1e-7, lon=-71, gps_speed=2.0, gps_track=90, heading=90 + np.sin(i / 100),
+                                wind_angle=45, sail_cmd=30, rudder_cmd=-2, sail=30, rudder=-2, mode=3, manual=0, event_state=1)
+            recorder.close()
+            elapsed = time.perf_counter() - start
+            print(f"record(): {elapsed / samples * 1e6:.1f}us per sample, {len(flight_files(directory))} files, "
+                  f"{sum(os.path.getsize(f) for f in flight_files(directory)) / 1e6:.1f}MB")
+            start = time.perf_counter()
+            data = load(directory)
+            print(f"load(): {len(data)} records (7h at 10Hz) in {(time.perf_counter() - start) * 1e3:.0f}ms")
+    else:
+        for path in sys.argv[1:]:
+            data = load(path)
+            if not len(data):
+                print(f"{path}: empty")
+                continue
+            duration = data["time"][-1] - data["time"][0]
+            print(f"{path}: {len(data)} records over {duration / 60:.1f} minutes from "
+                  f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(data['time'][0]))}, "
+                  f"{np.count_nonzero(~np.isnan(data['lat']))} with a GPS fix")
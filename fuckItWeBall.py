@@ -10,7 +10,7 @@ class bad_search():
         self.pattern = self.create_search_pattern()
 
     def next_gps(self):
-        if has_reached_waypoint(self.pattern[0]):
+        if has_reached_waypoint(self.gps, self.pattern[0]):
             self.pattern.pop(0)
             if len(self.pattern) == 0:
                 return EventFinished
@@ -0,0 +1,177 @@
+"""
+Local east-north-up (ENU) coordinates for event geometry
+    - Events project their Waypoints once into meters east/north of a course origin, then do all of their
+      line/side/distance math on plain (east, north) tuples instead of slopes between raw lat/lon degrees
+    - Within a few km of the origin the flat-earth error is a few cm, far below GPS error
+    - Points and directions are (x, y) tuples: x = meters east, y = meters north
+    - Compass bearings are degrees clockwise from north, like compass.angle
+"""
+import math
+
+try:
+    from eventUtils import Waypoint
+except ImportError:
+    from sailbot.eventUtils import Waypoint
+
+EARTH_RADIUS = 6371000
+METERS_PER_DEGREE = math.radians(EARTH_RADIUS)
+
+
+class LocalFrame:
+    """
+    Tangent plane anchored at an origin Waypoint, the meters per degree of longitude is cached at creation
+
+    Attributes:
+        - origin (Waypoint): the point that is (0, 0)
+
+    Functions:
+        - to_enu() - Waypoint -> (east, north) in meters
+        - to_waypoint() - (east, north) in meters -> Waypoint
+    """
+    __slots__ = ("origin", "_lat0", "_lon0", "_m_per_lon")
+
+    def __init__(self, origin):
+        self.origin = Waypoint(origin.lat, origin.lon)
+        self._lat0 = origin.lat
+        self._lon0 = origin.lon
+        self._m_per_lon = METERS_PER_DEGREE * math.cos(math.radians(origin.lat))
+
+    def to_enu(self, waypoint):
+        return self.latlon_to_enu(waypoint.lat, waypoint.lon)
+
+    def latlon_to_enu(self, lat, lon):
+        return ((lon - self._lon0) * self._m_per_lon, (lat - self._lat0) * METERS_PER_DEGREE)
+
+    def to_waypoint(self, point):
+        return Waypoint(self._lat0 + point[1] / METERS_PER_DEGREE, self._lon0 + point[0] / self._m_per_lon)
+
+
+# ---------------------------------- VECTORS ----------------------------------
+
+def add(a, b):
+    return (a[0] + b[0], a[1] + b[1])
+
+
+def sub(a, b):
+    return (a[0] - b[0], a[1] - b[1])
+
+
+def scale(a, k):
+    return (a[0] * k, a[1] * k)
+
+
+def dot(a, b):
+    return a[0] * b[0] + a[1] * b[1]
+
+
+def cross(a, b):
+    """z component of a x b, positive when b is counterclockwise (left) of a"""
+    return a[0] * b[1] - a[1] * b[0]
+
+
+def norm(a):
+    return math.hypot(a[0], a[1])
+
+
+def unit(a):
+    length = math.hypot(a[0], a[1])
+    if length == 0:
+        raise ValueError("Can't normalize a zero length vector")
+    return (a[0] / length, a[1] / length)
+
+
+def midpoint(a, b):
+    return ((a[0] + b[0]) / 2, (a[1] + b[1]) / 2)
+
+
+def lerp(a, b, t):
+    """The point a fraction t of the way from a to b"""
+    return (a[0] + (b[0] - a[0]) * t, a[1] + (b[1] - a[1]) * t)
+
+
+def distance(a, b):
+    return math.hypot(b[0] - a[0], b[1] - a[1])
+
+
+def rotate(a, degrees):
+    """Rotates a vector counterclockwise"""
+    angle = math.radians(degrees)
+    cos, sin = math.cos(angle), math.sin(angle)
+    return (a[0] * cos - a[1] * sin, a[0] * sin + a[1] * cos)
+
+
+def polar(radius, degrees):
+    """Vector of length radius at a math angle (counterclockwise from east)"""
+    angle = math.radians(degrees)
+    return (radius * math.cos(angle), radius * math.sin(angle))
+
+
+def bearing_to_vector(bearing):
+    """Unit vector pointing along a compass bearing"""
+    angle = math.radians(bearing)
+    return (math.sin(angle), math.cos(angle))
+
+
+def vector_to_bearing(a):
+    return math.degrees(math.atan2(a[0], a[1])) % 360
+
+
+# ---------------------------------- LINES ----------------------------------
+
+def signed_distance_to_line(point, a, b):
+    """Distance in meters from point to the line through a and b, positive left of a -> b and negative right of it"""
+    direction = sub(b, a)
+    return cross(direction, sub(point, a)) / norm(direction)
+
+
+def side_of_line(point, a, b):
+    """1 if point is left of the line a -> b, -1 if it is right of it, 0 if it is on it"""
+    side = cross(sub(b, a), sub(point, a))
+    return (side > 0) - (side < 0)
+
+
+def line_intersection(p, direction, a, b):
+    """Where the ray/line p + t * direction crosses the line through a and b
+    Returns:
+        - (point, t) or None if the lines are parallel
+    """
+    edge = sub(b, a)
+    denominator = cross(direction, edge)
+    if abs(denominator) < 1e-12:
+        return None
+    t = cross(sub(a, p), edge) / denominator
+    return add(p, scale(direction, t)), t
+
+
+class Gate:
+    """
+    A line the boat has to cross, stored as a point on the line and the unit normal pointing in the direction of travel
+        - passed() is a single dot product so it can run every tick without any orientation special cases
+
+    Attributes:
+        - point ((float, float)): a point on the line
+        - normal ((float, float)): unit vector the boat crosses the line along
+    """
+    __slots__ = ("point", "normal")
+
+    def __init__(self, point, normal):
+        self.point = point
+        self.normal = unit(normal)
+
+    @classmethod
+    def through(cls, a, b, towards):
+        """Gate along the line a-b that is passed when the boat reaches the side 'towards' is on"""
+        normal = rotate(sub(b, a), 90)
+        if dot(normal, sub(towards, a)) < 0:
+            normal = scale(normal, -1)
+        return cls(a, normal)
+
+    def distance(self, point):
+        """Signed distance in meters, negative before the gate and positive after it"""
+        return (point[0] - self.point[0]) * self.normal[0] + (point[1] - self.point[1]) * self.normal[1]
+
+    def passed(self, point):
+        return self.distance(point) >= 0
+
+    def __repr__(self):
+        return f"Gate({self.point}, {self.normal})"
@@ -0,0 +1,196 @@
+"""
+PID heading controller for the rudder, run once per control loop tick
+    - Wrap-aware error: 359 -> 1 degrees is a 2 degree turn, not 358
+    - Derivative on measurement (the boat's turn rate), so changing the target doesn't kick the rudder
+    - Anti-windup: the integral is clamped and stops growing while the rudder is saturated in the same direction
+    - The output is slew limited so the rudder servo isn't slammed from side to side
+    - Gains are scheduled by boat speed: the rudder has less authority when slow, so the gains grow (up to a limit)
+    - Every heading step (target change over step_threshold) is measured and logged: rise time, overshoot,
+      settling time and steady state error, so tuning can be compared run to run
+    - Rudder sign follows boatMain.adjustRudder: positive rudder turns the boat counterclockwise
+"""
+import logging
+import math
+from dataclasses import dataclass
+
+try:
+    import constants as c
+except ImportError:
+    import sailbot.constants as c
+
+
+def heading_error(target, heading):
+    """Signed degrees to turn from heading to target, positive is clockwise (-180, 180]"""
+    return 180 - (180 - (target - heading)) % 360
+
+
+@dataclass(slots=True)
+class StepResponse:
+    """
+    Measurements of one heading step
+
+    Attributes:
+        - size (float): degrees the target moved (signed)
+        - rise_time (float): seconds from 10% to 90% of the step, None if it never got there
+        - overshoot (float): degrees past the target
+        - settling_time (float): seconds until the heading stayed within the settle band, None if it didn't
+        - steady_state_error (float): mean absolute error over the last settle_hold seconds
+    """
+    size: float
+    rise_time: float = None
+    overshoot: float = 0.0
+    settling_time: float = None
+    steady_state_error: float = None
+
+    def __str__(self):
+        def seconds(value):
+            return "never" if value is None else f"{value:.1f}s"
+        return (f"{self.size:+.0f}deg step: rise {seconds(self.rise_time)}, overshoot {self.overshoot:.1f}deg, "
+                f"settled {seconds(self.settling_time)}, steady state error {self.steady_state_error or 0:.1f}deg")
+
+
+class _StepTracker:
+    """Follows the heading after a target step until it settles or times out"""
+    def __init__(self, size, start, band, hold, timeout):
+        self.result = StepResponse(size)
+        self.start = start
+        self.band = band
+        self.hold = hold
+        self.timeout = timeout
+        self._t10 = None
+        self._inside_since = None
+        self._errors = []
+
+    def update(self, error, now):
+        """error is the remaining error to the target, returns True when measuring is finished"""
+        elapsed = now - self.start
+        size = self.result.size
+        progress = 1 - error / size if size else 1
+        if self._t10 is None and progress >= 0.1:
+            self._t10 = elapsed
+        if self.result.rise_time is None and progress >= 0.9:
+            self.result.rise_time = elapsed - (self._t10 or 0)
+        self.result.overshoot = max(self.result.overshoot, -math.copysign(1, size) * error)
+
+        if abs(error) <= self.band:
+            if self._inside_since is None:
+                self._inside_since = elapsed
+                self._errors = []
+            self._errors.append(abs(error))
+            if elapsed - self._inside_since >= self.hold:
+                self.result.settling_time = self._inside_since
+                self.result.steady_state_error = sum(self._errors) / len(self._errors)
+                return True
+        else:
+            self._inside_since = None
+        return elapsed >= self.timeout
+
+
+class HeadingController:
+    """
+    Attributes:
+        - kp (float): degrees of rudder per degree of heading error
+        - ki (float): degrees of rudder per degree-second of error
+        - kd (float): degrees of rudder per degree/second of turn rate
+        - integral (float): the integral term in degrees of rudder
+        - rudder (float): the last output
+        - last_step (StepResponse): measurements of the latest finished heading step
+
+    Functions:
+        - update() - the rudder angle for this tick
+        - reset() - forget the integral/derivative history (e.g. after manual control)
+    """
+
+    def __init__(self, kp=float(c.config["HEADING"]["kp"]), ki=float(c.config["HEADING"]["ki"]),
+                 kd=float(c.config["HEADING"]["kd"]), max_rudder=float(c.config["CONSTANTS"]["rudder_angle_max"]),
+                 slew_rate=float(c.config["HEADING"]["slew_rate"]), integral_limit=float(c.config["HEADING"]["integral_limit"]),
+                 reference_speed=float(c.config["HEADING"]["reference_speed"]), max_gain_scale=float(c.config["HEADING"]["max_gain_scale"]),
+                 step_threshold=float(c.config["HEADING"]["step_threshold"]), settle_band=float(c.config["HEADING"]["settle_band"]),
+                 settle_hold=2.0, step_timeout=30.0, max_dt=1.0):
+        """
+        Args:
+            - slew_rate (float): most the rudder output can move per second in degrees
+            - integral_limit (float): most rudder the integral can contribute in degrees
+            - reference_speed (float): boat speed (m/s) the gains are tuned at, 0 disables scheduling
+            - max_gain_scale (float): most the gains can be multiplied by when the boat is slow
+            - step_threshold (float): target changes over this many degrees are measured as a step
+            - settle_band (float): degrees from the target counted as settled
+            - max_dt (float): a longer gap between updates resets the controller instead of integrating over it
+        """
+        self.kp, self.ki, self.kd = kp, ki, kd
+        self.max_rudder = max_rudder
+        self.slew_rate = slew_rate
+        self.integral_limit = integral_limit
+        self.reference_speed = reference_speed
+        self.max_gain_scale = max_gain_scale
+        self.step_threshold = step_threshold
+        self.settle_band = settle_band
+        self.settle_hold = settle_hold
+        self.step_timeout = step_timeout
+        self.max_dt = max_dt
+
+        self.last_step = None
+        self.reset()
+
+    def reset(self):
+        self.integral = 0.0
+        self.rudder = 0.0
+        self._last_time = None
+        self._last_heading = None
+        self._last_target = None
+        self._step = None
+
+    def gain_scale(self, speed):
+        """Multiplier for the gains at a boat speed"""
+        if not self.reference_speed or speed is None:
+            return 1.0
+        return min(self.reference_speed / max(speed, 1e-3), self.max_gain_scale)
+
+    def update(self, target, heading, now, speed=None, turn_rate=None):
+        """
+        Args:
+            - target (float): compass heading to hold
+            - heading (float): current compass heading
+            - now (float): time in seconds (time.monotonic())
+            - speed (float): boat speed in m/s for gain scheduling, None uses the base gains
+            - turn_rate (float): degrees/second clockwise if known (state estimator), otherwise from the heading change
+        Returns:
+            - rudder angle in degrees
+        """
+        error = heading_error(target, heading)
+        dt = None if self._last_time is None else now - self._last_time
+        if dt is not None and (dt <= 0 or dt > self.max_dt):
+            self.reset()
+            dt = None
+
+        if turn_rate is None:
+            turn_rate = 0.0 if dt is None else heading_error(heading, self._last_heading) / dt
+        self._track_step(target, error, now)
+        self._last_time, self._last_heading, self._last_target = now, heading, target
+
+        scale = self.gain_scale(speed)
+        # positive output turns clockwise, which is negative rudder
+        proportional = scale * self.kp * error
+        derivative = -scale * self.kd * turn_rate
+        if dt is not None:
+            candidate = max(-self.integral_limit, min(self.integral + scale * self.ki * error * dt, self.integral_limit))
+            saturated = abs(proportional + derivative + self.integral) >= self.max_rudder
+            # don't wind up further while the rudder is already pinned in the same direction
+            if not saturated or abs(candidate) < abs(self.integral):
+                self.integral = candidate
+        output = proportional + self.integral + derivative
+        rudder = max(-self.max_rudder, min(-output, self.max_rudder))
+
+        if dt is not None and self.slew_rate:
+            step = self.slew_rate * dt
+            rudder = max(self.rudder - step, min(rudder, self.rudder + step))
+        self.rudder = rudder
+        return rudder
+
+    def _track_step(self, target, error, now):
+        if self._last_target is not None and abs(heading_error(target, self._last_target)) >= self.step_threshold:
+            self._step = _StepTracker(error, now, self.settle_band, self.settle_hold, self.step_timeout)
+        if self._step is not None and self._step.update(error, now):
+            self.last_step = self._step.result
+            self._step = None
+            logging.info(f"Heading {self.last_step}")
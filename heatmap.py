@@ -0,0 +1,299 @@
+"""
+Pools buoy detections that are close together so Search can tell real buoys from one-off false positives
+    - Chunks are indexed in a uniform grid of chunk_radius sized cells (in meters)
+    - A detection only has to be compared with the chunks in its own and the 8 neighbouring cells
+      so lookups stay O(1) no matter how many detections the search has collected
+    - Confidence can decay with a half-life so old false positives fade and eventually get evicted
+        - Every chunk decays by the same factor, so chunks are ranked by a score that never has to be recomputed:
+          score = sum(conf * 2^((detection time - start) / half_life)), confidence now = score * 2^(-(now - start) / half_life)
+        - The best chunk is kept as a running argmax and stale chunks are popped from a min-heap of scores
+
+Run `python3 heatmap.py` to benchmark the grid against scanning every chunk
+"""
+import heapq
+import math
+import time
+
+try:
+    from sailbot.eventUtils import Waypoint
+    from sailbot.geodesy import LocalFrame, METERS_PER_DEGREE
+except ImportError:
+    from eventUtils import Waypoint
+    from geodesy import LocalFrame, METERS_PER_DEGREE
+
+
+class Heatmap:
+    """Datastructure which splits the search radius into X-meter circular 'chunks'
+        - Each detection has its confidence pooled with the nearest chunk it falls inside of, or starts a new chunk
+            - Decrease chunk radius if two separate buoys are being grouped as one
+            - Increase chunk radius if the same buoy is creating multiple chunks (caused by GPS estimation error)
+        - NOTE: Chunks can overlap which may cause problems (if so, then extend code to use tri/square/hex chunks instead of circles)
+        - Positions are converted to meters east/north of the first detection, accurate to a few cm over a search area
+
+        Attributes:
+            - chunks (set[HeatmapChunk])
+            - chunk_radius (float)
+            - half_life (float): seconds for a chunk's confidence to halve, 0 disables decay
+            - evict_below (float): chunks whose decayed confidence drops below this are removed
+            - evicted (int): how many chunks have been removed
+    """
+
+    # Scores are rescaled before 2^(age / half_life) gets large enough to lose precision
+    _MAX_EXPONENT = 64
+
+    def __init__(self, chunk_radius, half_life=0.0, evict_below=0.0, clock=time.monotonic):
+        self.chunks = set()
+        self.chunk_radius = chunk_radius
+        self.half_life = half_life
+        self.evict_below = evict_below
+        self.evicted = 0
+        self._clock = clock
+        self._grid = {}  # (cell x, cell y) -> list[HeatmapChunk] whose average position is in that cell
+        self._frame = None  # LocalFrame anchored at the first detection
+
+        self._start = clock()  # scores are relative to this time
+        self._best = None
+        self._heap = []  # (score, id, chunk), entries are left behind when a chunk's score grows
+        self._ids = 0
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def __contains__(self, detection):
+        """
+        Checks if a detection is inside any of the heatmap's chunks' boundary
+            - Invoke using the 'in' keyword ex. 'if detection in heatmap'
+        """
+        return self.find_chunk(detection) is not None
+
+    def _to_meters(self, waypoint):
+        if self._frame is None:
+            self._frame = LocalFrame(waypoint)
+        return self._frame.to_enu(waypoint)
+
+    def _cell(self, x, y):
+        return math.floor(x / self.chunk_radius), math.floor(y / self.chunk_radius)
+
+    def find_chunk(self, detection):
+        """
+        Returns:
+            - the closest HeatmapChunk the detection is inside of, None if it isn't near any chunk
+        """
+        x, y = self._to_meters(detection.gps)
+        cell_x, cell_y = self._cell(x, y)
+
+        closest, closest_distance = None, self.chunk_radius
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for chunk in self._grid.get((cell_x + dx, cell_y + dy), ()):
+                    distance = math.hypot(chunk.x - x, chunk.y - y)
+                    if distance <= closest_distance:
+                        closest, closest_distance = chunk, distance
+        return closest
+
+    def append(self, detection, now=None):
+        """Pools a detection into the closest chunk it is inside of, or creates a new chunk for it
+        Args:
+            - detection (Detection): a detection with its gps estimated
+            - now (float): the clock time of the detection, defaults to now
+        Returns:
+            - the HeatmapChunk the detection was added to
+        """
+        if now is None:
+            now = self._clock()
+        self.evict_stale(now)
+        weight = self._weight(now)
+
+        chunk = self.find_chunk(detection)
+        if chunk is None:
+            chunk = HeatmapChunk(radius=self.chunk_radius, detection=detection)
+            chunk.x, chunk.y = self._to_meters(detection.gps)
+            chunk.cell = self._cell(chunk.x, chunk.y)
+            chunk.score = detection.conf * weight
+            chunk.id = self._ids
+            self._ids += 1
+            self.chunks.add(chunk)
+            self._grid.setdefault(chunk.cell, []).append(chunk)
+            self._update_rank(chunk)
+            return chunk
+
+        chunk.append(detection)
+        chunk.score += detection.conf * weight
+        self._update_rank(chunk)
+        chunk.x, chunk.y = self._to_meters(chunk.average_gps)
+        cell = self._cell(chunk.x, chunk.y)
+        if cell != chunk.cell:
+            # the average moved into another cell
+            self._grid[chunk.cell].remove(chunk)
+            if not self._grid[chunk.cell]:
+                del self._grid[chunk.cell]
+            chunk.cell = cell
+            self._grid.setdefault(cell, []).append(chunk)
+        return chunk
+
+    def remove(self, chunk):
+        self.chunks.discard(chunk)
+        cell = self._grid.get(chunk.cell)
+        if cell is not None and chunk in cell:
+            cell.remove(chunk)
+            if not cell:
+                del self._grid[chunk.cell]
+        if chunk is self._best:
+            # eviction removes the best chunk last, so this only scans when a chunk is removed by hand
+            self._best = max(self.chunks, key=lambda heatmap_chunk: heatmap_chunk.score, default=None)
+
+    def get_highest_confidence_chunk(self, now=None):
+        """
+        Returns:
+            - the chunk with the highest (decayed) confidence in O(1), None if the heatmap is empty
+        """
+        self.evict_stale(now)
+        return self._best
+
+    def confidence(self, chunk, now=None):
+        """The chunk's pooled confidence after decay, the plain sum of its detections' conf when decay is off"""
+        if not self.half_life:
+            return chunk.sum_confidence
+        return chunk.score / self._weight(self._clock() if now is None else now)
+
+    def evict_stale(self, now=None):
+        """Removes every chunk whose decayed confidence is below evict_below"""
+        if not self.half_life or not self.evict_below:
+            return
+        threshold = self.evict_below * self._weight(self._clock() if now is None else now)
+        while self._heap and self._heap[0][0] < threshold:
+            score, _, chunk = heapq.heappop(self._heap)
+            if chunk.score == score and chunk in self.chunks:
+                self.remove(chunk)
+                self.evicted += 1
+
+    def _weight(self, now):
+        """2^((now - start) / half_life): how much a detection made now counts compared to one made at start"""
+        if not self.half_life:
+            return 1.0
+        exponent = (now - self._start) / self.half_life
+        if exponent > self._MAX_EXPONENT:
+            self._rescale(now)
+            exponent = 0.0
+        return 2 ** exponent
+
+    def _rescale(self, now):
+        """Moves the score reference time to 'now', dividing every score by the same factor keeps the ranking"""
+        factor = 2 ** ((now - self._start) / self.half_life)
+        self._start = now
+        for chunk in self.chunks:
+            chunk.score /= factor
+        self._heap = [(chunk.score, chunk.id, chunk) for chunk in self.chunks]
+        heapq.heapify(self._heap)
+
+    def _update_rank(self, chunk):
+        # scores only ever grow, so the best chunk can only be replaced by the one that just changed
+        if self._best is None or chunk.score > self._best.score:
+            self._best = chunk
+        if self.half_life and self.evict_below:
+            heapq.heappush(self._heap, (chunk.score, chunk.id, chunk))
+            if len(self._heap) > 4 * len(self.chunks) + 64:
+                # drop the entries left behind by chunks whose score has grown
+                self._heap = [(chunk.score, chunk.id, chunk) for chunk in self.chunks]
+                heapq.heapify(self._heap)
+
+
+class HeatmapChunk:
+    """
+    A circular boundary which combines nearby detections for better accuracy
+        - Detections within the chunk's radius are assumed to be from the same buoy and averaged
+
+    Attributes:
+        - radius (float): the radial size of the chunk
+        - average_gps (Waypoint): the average point between all detections within a chunk
+        - detection_count (int): the number of detections within a chunk
+        - sum_confidence (float): the combined total of all detections within the chunk
+        - x, y, cell: position in meters and grid cell, maintained by the Heatmap
+        - score (float): decay weighted confidence used by the Heatmap to rank chunks, see Heatmap.confidence()
+    """
+
+    def __init__(self, radius, detection):
+        self.radius = radius
+        self.average_gps = detection.gps
+        self.detection_count = 1
+        self.sum_confidence = detection.conf
+
+        self._sum_lat = detection.gps.lat
+        self._sum_lon = detection.gps.lon
+        self.x = self.y = 0.0
+        self.cell = None
+        self.score = detection.conf
+        self.id = 0
+
+    def __contains__(self, detection):
+        x = (detection.gps.lon - self.average_gps.lon) * METERS_PER_DEGREE * math.cos(math.radians(self.average_gps.lat))
+        y = (detection.gps.lat - self.average_gps.lat) * METERS_PER_DEGREE
+        return math.hypot(x, y) <= self.radius
+
+    def append(self, detection):
+        self.detection_count += 1
+
+        self._sum_lat += detection.gps.lat
+        self._sum_lon += detection.gps.lon
+        self.average_gps = Waypoint(self._sum_lat / self.detection_count, self._sum_lon / self.detection_count)
+
+        self.sum_confidence += detection.conf
+
+
+if __name__ == "__main__":
+    import random
+    import time
+    from types import SimpleNamespace
+
+    def synthetic_detections(count, buoys=20, area=200, noise=1.5, false_positives=0.3):
+        """Detections scattered around a few buoys plus uniformly spread false positives"""
+        random.seed(0)
+        center = Waypoint(33.0, -117.0)
+        buoy_positions = [(random.uniform(-area, area), random.uniform(-area, area)) for _ in range(buoys)]
+        detections = []
+        for _ in range(count):
+            if random.random() < false_positives:
+                x, y = random.uniform(-area, area), random.uniform(-area, area)
+            else:
+                bx, by = random.choice(buoy_positions)
+                x, y = random.gauss(bx, noise), random.gauss(by, noise)
+            gps = Waypoint(center.lat, center.lon)
+            gps.add_meters(x, y)
+            detections.append(SimpleNamespace(gps=gps, conf=random.uniform(0.6, 0.95)))
+        return detections
+
+    def linear_append(chunks, detection, radius):
+        """What append() did before the grid: check every chunk"""
+        for chunk in chunks:
+            if detection in chunk:
+                chunk.append(detection)
+                return
+        chunks.append(HeatmapChunk(radius, detection))
+
+    for count in (1000, 10000, 50000):
+        detections = synthetic_detections(count)
+
+        heatmap = Heatmap(chunk_radius=3)
+        start = time.perf_counter()
+        for detection in detections:
+            heatmap.append(detection)
+        grid_time = time.perf_counter() - start
+
+        chunks = []
+        start = time.perf_counter()
+        for detection in detections:
+            linear_append(chunks, detection, 3)
+        linear_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(1000):
+            heatmap.get_highest_confidence_chunk()
+        best_time = (time.perf_counter() - start) / 1000
+        start = time.perf_counter()
+        for _ in range(1000):
+            max(chunks, key=lambda heatmap_chunk: heatmap_chunk.sum_confidence)
+        max_time = (time.perf_counter() - start) / 1000
+
+        print(f"{count:>6} detections: grid {grid_time * 1e6 / count:7.1f}us/append ({len(heatmap)} chunks), "
+              f"linear scan {linear_time * 1e6 / count:7.1f}us/append ({len(chunks)} chunks)")
+        print(f"{'':>6} best chunk: running argmax {best_time * 1e6:7.2f}us, max() over chunks {max_time * 1e6:7.1f}us")
@@ -0,0 +1,262 @@
+"""
+Streaming NMEA reader for the GPS module
+    - A background thread reads every pending sentence off the serial port instead of parsing one per update() call
+    - GGA (position, satellites, HDOP) and RMC (speed, track, date) sentences from the same epoch are merged into one Fix
+      and the callback runs exactly once per epoch, as soon as both have arrived
+    - The module is switched to a faster baud rate and update rate at start (MTK PMTK commands):
+      at 10 Hz, GGA + RMC is ~1500 bytes/s which doesn't fit in the default 9600 baud
+    - Statistics:
+        - dropped: sentences with a bad checksum or that couldn't be parsed
+        - late: sentences for an epoch that was already published (arrived after the next epoch started)
+        - missed: epochs that never arrived, judged from the gap between fix times
+"""
+import calendar
+import logging
+import threading
+import time
+from dataclasses import dataclass
+
+try:
+    import constants as c
+    from boatMath import convertDegMinToDecDeg
+except ImportError:
+    import sailbot.constants as c
+    from sailbot.boatMath import convertDegMinToDecDeg
+
+
+@dataclass(slots=True)
+class Fix:
+    """
+    One GPS epoch
+
+    Attributes:
+        - time (float): UTC time of the fix in seconds since 1970 (seconds since midnight until a date is known)
+        - received (float): time.time() the first sentence of the epoch was read
+        - latitude, longitude (float): None without a fix
+        - quality (int): GGA fix quality, 0 is no fix
+        - satellites (int): satellites used
+        - hdop (float): horizontal dilution of precision
+        - speed_knots, track_angle_deg (float): from RMC, None if it didn't arrive
+    """
+    time: float
+    received: float
+    latitude: float = None
+    longitude: float = None
+    altitude: float = None
+    quality: int = 0
+    satellites: int = 0
+    hdop: float = None
+    speed_knots: float = None
+    track_angle_deg: float = None
+    _sentences: int = 0  # bit flags of which sentences arrived
+
+    @property
+    def has_fix(self):
+        return self.latitude is not None and self.longitude is not None
+
+
+GGA, RMC = 1, 2
+
+
+def checksum(body):
+    value = 0
+    for char in body:
+        value ^= ord(char)
+    return value
+
+
+def nmea_command(body):
+    """Wraps a command like 'PMTK220,100' into a full sentence with its checksum"""
+    return f"${body}*{checksum(body):02X}\r\n".encode("ascii")
+
+
+def parse_sentence(line):
+    """Splits a sentence into its fields after validating the checksum
+    Returns:
+        - list of fields with the talker removed from the type ('GPGGA' and 'GNGGA' -> 'GGA'), None if it is invalid
+    """
+    line = line.strip()
+    if not line.startswith("$") or len(line) < 9 or line[-3] != "*":
+        return None
+    body = line[1:-3]
+    try:
+        if checksum(body) != int(line[-2:], 16):
+            return None
+    except ValueError:
+        return None
+    fields = body.split(",")
+    fields[0] = fields[0][2:]
+    return fields
+
+
+def _coordinate(value, hemisphere):
+    if not value:
+        return None
+    degrees = convertDegMinToDecDeg(float(value))
+    return -degrees if hemisphere in ("S", "W") else degrees
+
+
+def _seconds_of_day(value):
+    return int(value[0:2]) * 3600 + int(value[2:4]) * 60 + float(value[4:])
+
+
+class NMEAStream:
+    """
+    Reads NMEA sentences from a serial port on a background thread and calls on_fix once per GPS epoch
+
+    Attributes:
+        - fix (Fix): the latest published fix
+        - sentences, dropped, late, missed (int): see module docstring
+        - rate (float): configured update rate in Hz
+
+    Functions:
+        - start() - opens and configures the port, then starts the reader thread
+        - stop()
+        - feed() - parses one line (used by the reader thread, and directly in tests)
+    """
+    def __init__(self, port=c.config["GPS"]["port"], baudrate=int(c.config["GPS"]["baudrate"]),
+                 stream_baudrate=int(c.config["GPS"]["stream_baudrate"]), rate=float(c.config["GPS"]["rate"]),
+                 on_fix=None, serial_port=None):
+        """
+        Args:
+            - port (str): serial device
+            - baudrate (int): the module's power-on baud rate
+            - stream_baudrate (int): baud rate to switch the module to
+            - rate (float): fixes per second to configure (1-10)
+            - on_fix (callable): on_fix(Fix), runs on the reader thread
+            - serial_port: an already open serial-like object (readline/write), skips opening and configuring
+        """
+        self.port = port
+        self.baudrate = baudrate
+        self.stream_baudrate = stream_baudrate
+        self.rate = rate
+        self.on_fix = on_fix
+        self.serial = serial_port
+
+        self.fix = None
+        self.sentences = 0
+        self.dropped = 0
+        self.late = 0
+        self.missed = 0
+        self._pending = None  # Fix being assembled, its time is the UTC seconds of day until published
+        self._last_epoch = None  # UTC seconds of day of the last published fix
+        self._date = None  # seconds since 1970 of the UTC midnight from the last RMC
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        if self.serial is None:
+            self.serial = self.configure()
+        self._running = True
+        self._thread = threading.Thread(target=self._read_loop, name="NMEAStream", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    def configure(self):
+        """Switches the module to stream_baudrate and 'rate' Hz GGA + RMC output
+        Returns:
+            - the serial port opened at stream_baudrate
+        """
+        import serial
+        if self.stream_baudrate != self.baudrate:
+            with serial.Serial(self.port, baudrate=self.baudrate, timeout=1) as port:
+                port.write(nmea_command(f"PMTK251,{self.stream_baudrate}"))
+                port.flush()
+            time.sleep(0.1)  # the module switches after finishing the command
+        port = serial.Serial(self.port, baudrate=self.stream_baudrate, timeout=1)
+        port.write(nmea_command("PMTK314,0,1,0,1,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0"))  # GGA and RMC only
+        port.write(nmea_command(f"PMTK220,{int(1000 / self.rate)}"))
+        port.reset_input_buffer()
+        logging.info(f"GPS streaming at {self.rate}Hz, {self.stream_baudrate} baud")
+        return port
+
+    def _read_loop(self):
+        while self._running:
+            try:
+                line = self.serial.readline()
+            except Exception as e:
+                logging.warning(f"GPS read failed: {e}")
+                time.sleep(0.1)
+                continue
+            if line:
+                self.feed(line.decode("ascii", errors="replace"))
+
+    def feed(self, line, received=None):
+        """Parses one sentence, publishing the epoch it completes"""
+        received = time.time() if received is None else received
+        fields = parse_sentence(line)
+        if fields is None:
+            self.dropped += 1
+            return
+        kind = fields[0]
+        if kind not in ("GGA", "RMC"):
+            return
+        self.sentences += 1
+        try:
+            epoch = _seconds_of_day(fields[1])
+            if kind == "RMC" and fields[9]:
+                date = fields[9]
+                self._date = calendar.timegm((2000 + int(date[4:6]), int(date[2:4]), int(date[0:2]), 0, 0, 0))
+        except (ValueError, IndexError):
+            self.dropped += 1
+            return
+
+        # epochs are matched on UTC time of day, the date is added when the fix is published
+        if self._last_epoch is not None and (self._last_epoch - epoch) % 86400 < 43200:
+            self.late += 1
+            return
+        if self._pending is not None and epoch != self._pending.time:
+            # the next epoch started before the current one was complete
+            self._publish()
+        if self._pending is None:
+            self._pending = Fix(time=epoch, received=received)
+
+        try:
+            if kind == "GGA":
+                self._parse_gga(fields, self._pending)
+            else:
+                self._parse_rmc(fields, self._pending)
+        except (ValueError, IndexError):
+            self.dropped += 1
+            return
+        if self._pending._sentences == GGA | RMC:
+            self._publish()
+
+    @staticmethod
+    def _parse_gga(fields, fix):
+        fix.quality = int(fields[6] or 0)
+        fix.satellites = int(fields[7] or 0)
+        fix.hdop = float(fields[8]) if fields[8] else None
+        fix.altitude = float(fields[9]) if fields[9] else None
+        if fix.quality > 0:
+            fix.latitude = _coordinate(fields[2], fields[3])
+            fix.longitude = _coordinate(fields[4], fields[5])
+        fix._sentences |= GGA
+
+    @staticmethod
+    def _parse_rmc(fields, fix):
+        if fields[2] == "A":
+            fix.speed_knots = float(fields[7]) if fields[7] else None
+            fix.track_angle_deg = float(fields[8]) if fields[8] else None
+            if fix.latitude is None:
+                fix.latitude = _coordinate(fields[3], fields[4])
+                fix.longitude = _coordinate(fields[5], fields[6])
+        fix._sentences |= RMC
+
+    def _publish(self):
+        fix, self._pending = self._pending, None
+        epoch = fix.time
+        if self._last_epoch is not None:
+            self.missed += max(round(((epoch - self._last_epoch) % 86400) * self.rate) - 1, 0)
+        self._last_epoch = epoch
+        if self._date is not None:
+            fix.time = self._date + epoch
+        self.fix = fix
+        if self.on_fix is not None:
+            self.on_fix(fix)
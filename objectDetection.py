@@ -1,18 +1,27 @@
 """
 Interface for detecting buoys
+    - Inference runs on one of two backends, picked with [OBJECTDETECTION] backend:
+        - ultralytics: the .pt weights with Ultralytics + torch
+        - onnx: weights exported by export_onnx() (optionally int8 quantized) run with ONNX Runtime on the CPU
+    - Both backends return the same Detection objects
+    - Compare them on the Pi with `python3 CV/detection_benchmark.py`
 """
-from ultralytics import YOLO  # Documentation: https://docs.ultralytics.com/cfg/
-# from supervision.tools.detections
 import cv2
 import numpy as np
-import torch
 import logging
-from dataclasses import dataclass
+import time
 
 import constants as c
 
+BACKENDS = ("ultralytics", "onnx")
+
+# Loaded backends shared by every ObjectDetection in the process, keyed by (backend, weights path)
+# Loading weights takes seconds on the Pi so each file is only ever loaded once
+_MODEL_CACHE = {}
+# Seconds taken to load (and warm up) each model, keyed by (backend, weights path)
+MODEL_LOAD_TIMES = {}
+
 
-@dataclass(order=True)
 class Detection:
     """
     Object containing the confidence level, bounding box, and location of a buoy from a given image
@@ -25,34 +34,234 @@ class Detection:
         - self.gps (Waypoint) - approximate gps position of buoy
     """
     
-    def __init__(self, result: torch.tensor):
-        _bbox: torch.tensor = result.boxes
-        _xywh: list[float] = np.rint(_bbox.xywh[0]).tolist()
-
-        self.x = int(_xywh[0])
-        self.y = int(_xywh[1])
-        self.w = int(_xywh[2])
-        self.h = int(_xywh[3])
-        self.conf = round(_bbox.conf.item(), 2)
+    def __init__(self, x, y, w, h, conf):
+        self.x = int(np.rint(x))
+        self.y = int(np.rint(y))
+        self.w = int(np.rint(w))
+        self.h = int(np.rint(h))
+        self.conf = round(float(conf), 2)
         # self.class_id: str = ObjectDetection.classes[int(_bbox.cls.numpy()[0])]
         self.gps = None
-        sort_index: int = self.conf
+
+    @classmethod
+    def from_result(cls, result):
+        """Creates a Detection from one box of an Ultralytics result"""
+        _bbox = result.boxes
+        x, y, w, h = _bbox.xywh[0].tolist()
+        return cls(x, y, w, h, _bbox.conf.item())
 
     def __str__(self):
         return f"Detection ({self.conf}%) at ({self.x}, {self.y}) with width {self.w}px and height {self.h}px"
-        
+
+
+class UltralyticsBackend:
+    """
+    Runs the .pt weights with Ultralytics + torch
+
+    Attributes:
+        - model (YOLO): the Ultralytics model
+    """
+    def __init__(self, weights):
+        from ultralytics import YOLO  # Documentation: https://docs.ultralytics.com/cfg/
+        self.model = YOLO(weights)
+
+    def detect(self, image, conf) -> list[Detection]:
+        return self.detect_batch([image], conf)[0]
+
+    def detect_batch(self, images, conf) -> list[list[Detection]]:
+        # TODO: test results.cpu() or results.to("cpu") for performance on Pi
+        # Ultralytics runs a list of images as one batch
+        results = self.model.predict(source=list(images), conf=conf, save=False, verbose=False, line_thickness=1)
+        return [[Detection.from_result(box) for box in result] for result in results]
+
+
+class OnnxBackend:
+    """
+    Runs a YOLOv8 model exported to .onnx with ONNX Runtime on the CPU
+        - Pre and post processing match Ultralytics: letterbox with grey padding, RGB scaled to [0-1], NMS on the boxes
+        - Only needs onnxruntime, opencv and numpy so torch doesn't have to be loaded at all
+        - Models exported with a fixed batch size get batches padded with blank images, dynamic ones take any size
+
+    Attributes:
+        - session (onnxruntime.InferenceSession): the loaded model
+        - input_w, input_h (int): the image size the model was exported with, input_size if its shape doesn't say
+        - batch_size (int): the batch size the model was exported with, None if it is dynamic
+    """
+    def __init__(self, weights, threads=0, nms_iou=0.7, input_size=int(c.config["OBJECTDETECTION"]["onnx_input_size"])):
+        """
+        Args:
+            - weights (str): path to the .onnx model
+            - threads (int): intra-op threads, 0 lets ONNX Runtime use every core
+            - nms_iou (float): overlap above which the lower confidence box is removed
+            - input_size (int): image size for models exported with a symbolic height and width
+        """
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(weights, sess_options=options, providers=["CPUExecutionProvider"])
+        self.nms_iou = nms_iou
+
+        model_input = self.session.get_inputs()[0]
+        self._input_name = model_input.name
+        self.input_h, self.input_w = (size if isinstance(size, int) else input_size for size in model_input.shape[2:4])
+        self.batch_size = model_input.shape[0] if isinstance(model_input.shape[0], int) else None
+
+    def _letterbox(self, image):
+        """Resizes the image to the model input keeping its aspect ratio, returns (image, scale, pad x, pad y)"""
+        h0, w0 = image.shape[:2]
+        scale = min(self.input_h / h0, self.input_w / w0)
+        h, w = round(h0 * scale), round(w0 * scale)
+        if (h, w) != (h0, w0):
+            image = cv2.resize(image, (w, h), interpolation=cv2.INTER_LINEAR)
+
+        left = int(round((self.input_w - w) / 2 - 0.1))
+        top = int(round((self.input_h - h) / 2 - 0.1))
+        padded = np.full((self.input_h, self.input_w, 3), 114, dtype=np.uint8)
+        padded[top:top + h, left:left + w] = image
+        return padded, scale, left, top
+
+    def detect(self, image, conf) -> list[Detection]:
+        return self.detect_batch([image], conf)[0]
+
+    def detect_batch(self, images, conf) -> list[list[Detection]]:
+        images = [cv2.imread(image) if isinstance(image, str) else image for image in images]
+        letterboxed = [self._letterbox(image) for image in images]
+        blob = np.stack([padded for padded, _, _, _ in letterboxed])
+        blob = np.ascontiguousarray(blob[..., ::-1].transpose(0, 3, 1, 2), dtype=np.float32) / 255
+
+        outputs = []
+        step = self.batch_size or len(blob)
+        for i in range(0, len(blob), step):
+            batch = blob[i:i + step]
+            if len(batch) < step:
+                batch = np.concatenate((batch, np.zeros((step - len(batch), *batch.shape[1:]), dtype=np.float32)))
+            outputs.extend(self.session.run(None, {self._input_name: batch})[0])
+
+        return [self._postprocess(output, conf, scale, left, top)
+                for output, (_, scale, left, top) in zip(outputs, letterboxed)]
+
+    def _postprocess(self, output, conf, scale, left, top) -> list[Detection]:
+        # YOLOv8 output per image: (4 + classes, candidates) with rows cx, cy, w, h, class scores...
+        output = output.T
+        scores = output[:, 4:].max(axis=1)
+        keep = scores >= conf
+        boxes, scores = output[keep, :4], scores[keep]
+        if not len(boxes):
+            return []
+
+        corners = np.column_stack((boxes[:, 0] - boxes[:, 2] / 2, boxes[:, 1] - boxes[:, 3] / 2, boxes[:, 2], boxes[:, 3]))
+        indices = cv2.dnn.NMSBoxes(corners.tolist(), scores.tolist(), conf, self.nms_iou)
+
+        detections = []
+        for i in np.array(indices).flatten():
+            x, y, w, h = boxes[i]
+            detections.append(Detection((x - left) / scale, (y - top) / scale, w / scale, h / scale, scores[i]))
+        return detections
+
+
+def default_weights(backend):
+    """The configured weights for a backend"""
+    return c.config["OBJECTDETECTION"]["onnx_weights" if backend == "onnx" else "weights"]
+
+
+def load_model(weights=None, warmup=bool(int(c.config["OBJECTDETECTION"]["warmup"])), backend=c.config["OBJECTDETECTION"]["backend"]):
+    """Returns the cached backend for 'weights', loading it the first time it is requested
+    Args:
+        - weights (str): path to the model weights, defaults to the configured weights for the backend
+        - warmup (bool): run one blank image through a newly loaded model so the first real frame isn't slow
+        - backend (str): 'ultralytics' or 'onnx'
+    Returns:
+        - the loaded UltralyticsBackend or OnnxBackend
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown detection backend '{backend}', expected one of {BACKENDS}")
+    if weights is None:
+        weights = default_weights(backend)
+    key = (backend, weights)
+
+    model = _MODEL_CACHE.get(key)
+    if model is not None:
+        return model
+
+    start = time.perf_counter()
+    if backend == "onnx":
+        model = OnnxBackend(weights, threads=int(c.config["OBJECTDETECTION"]["onnx_threads"]),
+                            nms_iou=float(c.config["OBJECTDETECTION"]["nms_iou"]),
+                            input_size=int(c.config["OBJECTDETECTION"]["onnx_input_size"]))
+    else:
+        model = UltralyticsBackend(weights)
+    load_time = time.perf_counter() - start
+
+    if warmup:
+        blank = np.zeros((int(c.config["CAMERA"]["resolution_height"]), int(c.config["CAMERA"]["resolution_width"]), 3), dtype=np.uint8)
+        model.detect(blank, conf=1.0)
+    MODEL_LOAD_TIMES[key] = time.perf_counter() - start
+
+    logging.info(f"Loaded {weights} ({backend}) in {load_time:.2f}s (ready after {MODEL_LOAD_TIMES[key]:.2f}s with warmup)")
+    _MODEL_CACHE[key] = model
+    return model
+
+
+def release_model(weights=None, backend=None):
+    """Removes models from the cache so their memory can be freed once no ObjectDetection uses them
+    Args:
+        - weights (str): path of the model to release, None releases every model
+        - backend (str): only release models loaded by this backend, None for any backend
+    """
+    for key in list(_MODEL_CACHE):
+        if (backend is None or key[0] == backend) and (weights is None or key[1] == weights):
+            del _MODEL_CACHE[key]
+
+
+def export_onnx(weights=c.config["OBJECTDETECTION"]["weights"], quantize=False, imgsz=640, dynamic=True):
+    """Exports .pt weights to .onnx for the onnx backend, run on a dev machine with Ultralytics installed
+    Args:
+        - weights (str): path to the .pt weights
+        - quantize (bool): also write an int8 (dynamic quantized) copy next to the export as <name>_int8.onnx
+        - imgsz (int): model input size, set [OBJECTDETECTION] onnx_input_size to match
+        - dynamic (bool): export with a dynamic batch size so surveys can be analyzed in one pass
+    Returns:
+        - path of the model to put in [OBJECTDETECTION] onnx_weights
+    """
+    from ultralytics import YOLO
+    path = YOLO(weights).export(format="onnx", imgsz=imgsz, simplify=True, dynamic=dynamic)
+
+    if dynamic:
+        # Ultralytics makes the height and width dynamic too, only the batch axis should be
+        import onnx
+        model = onnx.load(path)
+        for dim in model.graph.input[0].type.tensor_type.shape.dim[2:4]:
+            dim.dim_value = imgsz
+        onnx.save(model, path)
+
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantized = path.replace(".onnx", "_int8.onnx")
+        quantize_dynamic(path, quantized, weight_type=QuantType.QUInt8)
+        path = quantized
+    return path
+
 
 class ObjectDetection:
     """
     AI object detection model
+        - Creating one is cheap, the model itself is loaded once per process by load_model()
     
+    Attributes:
+        - backend (UltralyticsBackend or OnnxBackend): runs the model
+        - inference_count (int): how many images have been analyzed
+        - inference_time (float): total seconds spent analyzing images
+
     Functions: 
         - analyze() - checks image for buoys
+        - analyze_batch() - checks several images for buoys in as few model calls as possible
     """
-    def __init__(self):
-        self.model = YOLO(c.config["OBJECTDETECTION"]["weights"])  # Initialize model for analysis
-            # TODO: test performance after export to .onnx
-            #model.export(format="onnx") or cmd -> yolo task=detect mode=export model=<PATH> format = onnx
+    def __init__(self, weights=None, backend=c.config["OBJECTDETECTION"]["backend"]):
+        self.backend = load_model(weights, backend=backend)  # Initialize model for analysis
+        self.inference_count = 0
+        self.inference_time = 0.0
     
     def analyze(self, image) -> list[Detection]:
         """Detects buoys within a given image. Can be supplied from cv2 or using the Camera.capture()/Camera.survey() methods.
@@ -62,16 +271,36 @@ class ObjectDetection:
             - A list buoys found (if any) stored as a list of Detection objects
                 - list is sorted by highest confidence, detections[0] is ALWAYS the highest confidence match
         """
-        # TODO: test results.cpu() or results.to("cpu") for performance on Pi
-        result = self.model.predict(source=image, conf=float(c.config["OBJECTDETECTION"]["conf_thresh"]), save=False, line_thickness=1)
-        result = result[0] # metadata -> list[tensor]
-        
-        # Add each buoy found by the model into a list
-        detections: list[Detection] = []
-        for detection in result:
-            logging.info("Buoy ({detection.conf}): at ({detection.x},{detection.y})\n")
-            detections.append(Detection(detection)) # Convert tensors into readable Detection class and append to list
-        detections.sort(reverse=True)
+        start = time.perf_counter()
+        detections = self.backend.detect(image, conf=float(c.config["OBJECTDETECTION"]["conf_thresh"]))
+        self.inference_time += time.perf_counter() - start
+        self.inference_count += 1
+        return self._sort(detections)
+
+    def analyze_batch(self, images, batch_size=int(c.config["OBJECTDETECTION"]["batch_size"])) -> list[list[Detection]]:
+        """Detects buoys in several images, running up to 'batch_size' images through the model at once
+            - Used by Camera.survey() so a panorama costs one forward pass instead of one per image
+        Args:
+            - images (list of np.ndarray, .jpg, .png): The RGB images to search for buoys
+            - batch_size (int): the most images given to the model in one call
+        Returns:
+            - A list of detections for each image, in the same order as 'images' (sorted like analyze())
+        """
+        conf = float(c.config["OBJECTDETECTION"]["conf_thresh"])
+        results = []
+        for i in range(0, len(images), batch_size):
+            batch = images[i:i + batch_size]
+            start = time.perf_counter()
+            results.extend(self.backend.detect_batch(batch, conf=conf))
+            self.inference_time += time.perf_counter() - start
+            self.inference_count += len(batch)
+        return [self._sort(detections) for detections in results]
+
+    @staticmethod
+    def _sort(detections):
+        for detection in detections:
+            logging.info(f"Buoy ({detection.conf}): at ({detection.x},{detection.y})\n")
+        detections.sort(key=lambda detection: detection.conf, reverse=True)
         return detections
 
 
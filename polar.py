@@ -0,0 +1,235 @@
+"""
+Boat polar: how fast the boat sails at each true wind angle (TWA) and true wind speed (TWS), and the best sail trim
+    - Loaded from a CSV (polar.csv): one row per TWA, one column per TWS in m/s, plus a 'sail' column with the best
+      sail trim at that angle
+    - Can be fit from logged (twa, tws, boat speed, sail) samples, see Polar.fit() and `python3 polar.py fit`
+    - The table is resampled once onto a fine regular grid so a lookup is index arithmetic plus a bilinear blend,
+      vectorized over numpy arrays (the simulator looks up thousands of boats per step)
+    - vmg_heading() picks the heading that closes on a target fastest (velocity made good), which is the best
+      close-hauled angle upwind and the best broad reach downwind instead of a fixed no-go wedge
+
+Usage:
+    python3 polar.py fit samples.csv polar.csv   (samples.csv has twa, tws, speed and optionally sail columns)
+"""
+import csv
+
+import numpy as np
+
+try:
+    import constants as c
+except ImportError:
+    import sailbot.constants as c
+
+# Resolution of the lookup grid
+ANGLE_STEP = 1.0
+SPEED_STEP = 0.25
+
+_CANDIDATES = np.arange(0, 360, 1.0)  # headings vmg_heading() considers
+
+
+def _fold(twa):
+    """Any wind angle -> 0 (head to wind) to 180 (dead downwind)"""
+    return np.abs(180 - (180 - np.asarray(twa, dtype=float)) % 360)
+
+
+def default_sail(twa):
+    """Sail trim rule used without a measured one: half the wind angle (like drivers.obj_sail.autoAdjustSail)"""
+    return np.clip(_fold(twa) / 2, 3, 90)
+
+
+class Polar:
+    """
+    Attributes:
+        - angles (np.ndarray): TWA of each table row in degrees (0-180)
+        - speeds (np.ndarray): TWS of each table column in m/s
+        - table (np.ndarray): boat speed in m/s, len(angles) x len(speeds)
+        - sail (np.ndarray): best sail trim at each angle
+
+    Functions:
+        - speed() / __call__() - boat speed at (twa, tws), so a Polar can be passed to simEngine.Simulation
+        - sail_angle() - best sail trim at a twa
+        - vmg_heading() - heading that makes the most progress towards a bearing
+        - load() / save() / fit()
+    """
+
+    def __init__(self, angles, speeds, table, sail=None):
+        self.angles = np.asarray(angles, dtype=float)
+        self.speeds = np.asarray(speeds, dtype=float)
+        self.table = np.asarray(table, dtype=float)
+        self.sail = default_sail(self.angles) if sail is None else np.asarray(sail, dtype=float)
+        if self.table.shape != (len(self.angles), len(self.speeds)):
+            raise ValueError(f"Polar table is {self.table.shape}, expected {(len(self.angles), len(self.speeds))}")
+
+        # resample onto a regular grid: rows every ANGLE_STEP degrees, columns every SPEED_STEP m/s from 0
+        grid_angles = np.arange(0, 180 + ANGLE_STEP, ANGLE_STEP)
+        grid_speeds = np.arange(0, self.speeds[-1] + SPEED_STEP, SPEED_STEP)
+        by_angle = np.array([np.interp(grid_angles, self.angles, column) for column in self.table.T]).T
+        speeds = self.speeds
+        if speeds[0] > 0:
+            # no wind is no boat speed
+            speeds = np.concatenate(([0.0], speeds))
+            by_angle = np.hstack((np.zeros((len(grid_angles), 1)), by_angle))
+        self._grid = np.array([np.interp(grid_speeds, speeds, row) for row in by_angle])
+        self._sail_grid = np.interp(grid_angles, self.angles, self.sail)
+        self._max_speed_index = len(grid_speeds) - 1
+
+    # ---------------------------------- LOOKUP ----------------------------------
+
+    def speed(self, twa, tws):
+        """Boat speed in m/s, twa in degrees (any sign/range), tws in m/s (held at the table's edge above it)"""
+        a = _fold(twa) / ANGLE_STEP
+        s = np.clip(np.asarray(tws, dtype=float) / SPEED_STEP, 0, self._max_speed_index)
+        i = np.minimum(a.astype(int), len(self._grid) - 2)
+        j = np.minimum(s.astype(int), self._max_speed_index - 1)
+        u, v = a - i, s - j
+        grid = self._grid
+        return ((grid[i, j] * (1 - u) + grid[i + 1, j] * u) * (1 - v) +
+                (grid[i, j + 1] * (1 - u) + grid[i + 1, j + 1] * u) * v)
+
+    __call__ = speed
+
+    def sail_angle(self, twa):
+        """Best sail trim (0-90) at a true wind angle"""
+        a = _fold(twa) / ANGLE_STEP
+        i = np.minimum(a.astype(int), len(self._sail_grid) - 2)
+        u = a - i
+        return self._sail_grid[i] * (1 - u) + self._sail_grid[i + 1] * u
+
+    def vmg_heading(self, bearing, wind_direction, tws, heading=None, tack_margin=float(c.config["POLAR"]["tack_margin"])):
+        """Heading with the best velocity made good towards a bearing
+        Args:
+            - bearing (float or np.ndarray): compass bearing to the target
+            - wind_direction (float or np.ndarray): compass direction the wind blows from
+            - tws (float or np.ndarray): true wind speed in m/s
+            - heading (float or np.ndarray): current heading, headings on the other tack/gybe have to beat it by
+              tack_margin (fraction of the best boat speed) so the boat doesn't flip between tacks dead upwind
+        Returns:
+            - (heading, vmg in m/s), arrays when any input is an array
+        """
+        scalar = np.ndim(bearing) == np.ndim(wind_direction) == np.ndim(tws) == 0
+        bearing = np.atleast_1d(np.asarray(bearing, dtype=float))[:, None]
+        wind_direction = np.atleast_1d(np.asarray(wind_direction, dtype=float))[:, None]
+        tws = np.atleast_1d(np.asarray(tws, dtype=float))[:, None]
+
+        off_wind = 180 - (180 - (_CANDIDATES - wind_direction)) % 360
+        speed = self.speed(off_wind, tws)
+        vmg = speed * np.cos(np.radians(_CANDIDATES - bearing))
+        score = vmg
+        if heading is not None:
+            current = 180 - (180 - (np.atleast_1d(np.asarray(heading, dtype=float))[:, None] - wind_direction)) % 360
+            other_side = np.sign(off_wind) != np.sign(current)
+            score = vmg - other_side * tack_margin * speed.max(axis=1, keepdims=True)
+
+        best = np.argmax(score, axis=1)
+        rows = np.arange(len(best))
+        headings, best_vmg = _CANDIDATES[best], vmg[rows, best]
+        if scalar:
+            return float(headings[0]), float(best_vmg[0])
+        return headings, best_vmg
+
+    # ---------------------------------- FILES ----------------------------------
+
+    @classmethod
+    def load(cls, path=c.prefix + c.config["POLAR"]["path"]):
+        """Reads a polar CSV, loaded polars are cached since they are read-only"""
+        if path not in _LOADED:
+            with open(path, newline="") as f:
+                rows = [row for row in csv.reader(f) if row and not row[0].startswith("#")]
+            header = rows[0]
+            sail_column = header.index("sail") if "sail" in header else None
+            speed_columns = [i for i in range(1, len(header)) if i != sail_column]
+            data = np.array([[float(value) for value in row] for row in rows[1:]])
+            _LOADED[path] = cls(angles=data[:, 0], speeds=[float(header[i]) for i in speed_columns],
+                                table=data[:, speed_columns],
+                                sail=None if sail_column is None else data[:, sail_column])
+        return _LOADED[path]
+
+    def save(self, path):
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["twa/tws"] + [f"{speed:g}" for speed in self.speeds] + ["sail"])
+            for angle, row, sail in zip(self.angles, self.table, self.sail):
+                writer.writerow([f"{angle:g}"] + [f"{speed:.3f}" for speed in row] + [f"{sail:.1f}"])
+
+    @classmethod
+    def fit(cls, twa, tws, speed, sail=None, angles=np.arange(0, 181, 10), speeds=np.arange(2, 13, 2),
+            percentile=90, min_samples=5):
+        """Builds a polar from logged samples
+            - Each cell is the 'percentile' boat speed of the samples nearest to it, so slow samples from bad
+              steering or tacking don't drag the polar down
+            - Cells with fewer than min_samples samples are interpolated from their neighbours
+            - The sail trim at each angle is the median trim of the samples sailing at 90%+ of the polar
+        Args:
+            - twa, tws, speed, sail (array-like): one value per sample
+        """
+        twa, tws, speed = _fold(twa), np.asarray(tws, dtype=float), np.asarray(speed, dtype=float)
+        angles, speeds = np.asarray(angles, dtype=float), np.asarray(speeds, dtype=float)
+        row = np.abs(twa[:, None] - angles).argmin(axis=1)
+        column = np.abs(tws[:, None] - speeds).argmin(axis=1)
+
+        table = np.full((len(angles), len(speeds)), np.nan)
+        for i in range(len(angles)):
+            for j in range(len(speeds)):
+                cell = speed[(row == i) & (column == j)]
+                if len(cell) >= min_samples:
+                    table[i, j] = np.percentile(cell, percentile)
+        table[angles == 0] = 0.0  # head to wind the boat stops whatever the data says
+        table = _fill(table, axis=0)
+        table = _fill(table, axis=1)
+        table = np.nan_to_num(table)
+
+        fitted_sail = default_sail(angles)
+        if sail is not None:
+            sail = np.asarray(sail, dtype=float)
+            good = speed >= 0.9 * cls(angles, speeds, table).speed(twa, tws)
+            trims = np.full(len(angles), np.nan)
+            for i in range(len(angles)):
+                if np.count_nonzero(good & (row == i)) >= min_samples:
+                    trims[i] = np.median(sail[good & (row == i)])
+            known = ~np.isnan(trims)
+            if known.any():
+                fitted_sail = np.interp(angles, angles[known], trims[known])
+        return cls(angles, speeds, table, fitted_sail)
+
+
+_LOADED = {}
+
+
+def _fill(table, axis):
+    """Linearly interpolates the NaNs of each row/column from its known values"""
+    table = np.moveaxis(table.copy(), axis, 0)
+    index = np.arange(table.shape[0])
+    for k in range(table.shape[1]):
+        column = table[:, k]
+        known = ~np.isnan(column)
+        if known.any() and not known.all():
+            column[~known] = np.interp(index[~known], index[known], column[known])
+    return np.moveaxis(table, 0, axis)
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    if len(sys.argv) == 4 and sys.argv[1] == "fit":
+        with open(sys.argv[2], newline="") as f:
+            samples = list(csv.DictReader(f))
+        columns = {key: np.array([float(sample[key]) for sample in samples]) for key in samples[0]}
+        polar = Polar.fit(columns["twa"], columns["tws"], columns["speed"], columns.get("sail"))
+        polar.save(sys.argv[3])
+        print(f"Fit {len(samples)} samples into {sys.argv[3]}")
+    else:
+        polar = Polar.load()
+        twa, tws = np.random.uniform(0, 180, 100000), np.random.uniform(0, 12, 100000)
+        start = time.perf_counter()
+        polar.speed(twa, tws)
+        print(f"speed(): {(time.perf_counter() - start) * 1e9 / len(twa):.1f}ns per lookup (100k vectorized)")
+        start = time.perf_counter()
+        for _ in range(1000):
+            polar.vmg_heading(0.0, 10.0, 5.0, heading=30.0)
+        print(f"vmg_heading(): {(time.perf_counter() - start) * 1e3:.0f}us per call")
+        for wind_speed in (2, 5, 10):
+            upwind, upwind_vmg = polar.vmg_heading(0.0, 0.0, wind_speed)
+            downwind, downwind_vmg = polar.vmg_heading(180.0, 0.0, wind_speed)
+            print(f"TWS {wind_speed}m/s: beat at {min(upwind, 360 - upwind):.0f}deg ({upwind_vmg:.2f}m/s VMG), "
+                  f"run at {min(downwind, 360 - downwind):.0f}deg ({downwind_vmg:.2f}m/s VMG)")
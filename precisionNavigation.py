@@ -8,11 +8,11 @@ except ImportError:
     import sailbot.constants as c
     
 if c.config["MAIN"]["DEVICE"] == "pi":
-    from sailbot.eventUtils import EventFinished, Waypoint
-    from sailbot.GPS import gps
+    from sailbot.eventUtils import Event, EventFinished, Waypoint
+    import sailbot.geodesy as geo
 else:
-    from eventUtils import EventFinished, Waypoint
-    from GPS import gps
+    from eventUtils import Event, EventFinished, Waypoint
+    import geodesy as geo
 
 """
 # Challenge	Goal:
@@ -34,37 +34,39 @@ else:
         - going back is harder
     
     # Strategy:
-        - TODO write psuedocode about how this event logic works
+        - Project the start line and buoys into meters around the start line center (geodesy.LocalFrame)
+        - Round buoy1 then buoy2 through 5 points offset from the buoys, then return through the start line
+            - Offsets are drawn for a course heading south and rotated to the real course direction
+        - Each point has a gate across the path, the point is passed once the boat crosses its gate
 """
 
 REQUIRED_ARGS = 4
 
-class Precision_Navigation:
+class Precision_Navigation(Event):
     """
     Attributes:
         - event_info (array) - location of buoys to sail around
-            event_info = [(Waypoint(start_left_lat, start_right_long), ...]
+            event_info = [start_left, start_right, buoy1, buoy2] as Waypoints
+        - frame (geodesy.LocalFrame): meters east/north of the start line center
+        - targets (list[Waypoint]): points to sail through in order
+        - gates (list[geodesy.Gate]): the line across the path at each target, in frame coordinates
+        - target_set (int): index of the current target
     """
     
-    def __init__(self, event_info):
+    def __init__(self, event_info, debug=False, gps=None, windvane=None):
         if len(event_info) != REQUIRED_ARGS:
             raise TypeError(f"Expected {REQUIRED_ARGS} arguments, got {len(event_info)}")
+        super().__init__(event_info, debug, gps, windvane)
         logging.info("Precision Navigation moment")
 
         # EVENT INFO
-        self.event_info = event_info
-        self.start_left = event_info[0]
-        self.start_right = event_info[1]
-        self.buoy1 = event_info[2]
-        self.buoy2 = event_info[3]
+        self.start_left, self.start_right, self.buoy1, self.buoy2 = event_info
         self.start_time = time.time()
 
-        self.PN_arr = []
-        self.PN_arr = self.PN_coords()
-
-        self.rev_bool = False
-        self.target_set = 1
-        self.start_time = time.time()
+        self.frame = geo.LocalFrame(Waypoint((self.start_left.lat + self.start_right.lat) / 2,
+                                             (self.start_left.lon + self.start_right.lon) / 2))
+        self.PN_coords()
+        self.target_set = 0
         
     def next_gps(self):
         """
@@ -75,305 +77,68 @@ class Precision_Navigation:
             - OR None to signal the boat to drop sails and clear waypoint queue
             - OR EventFinished exception to signal that the event has been completed
         """
-            #time based check
-        #curr_time = time.time()
-        #if int(curr_time - self.start_time)%4 != 0: return None,None
+        if self.PN_PassCheck():
+            logging.info("PN: PASSED TARGET POINT: %d", self.target_set)
+            self.target_set += 1
 
-            #set check
-        if self.target_set >=int( len(self.PN_arr)/2): 
-            logging.info(f"PN: REACHED FINAL POINT;\nEXITING EVENT")
-            print(f"Finished Perc Nav")
+        if self.target_set >= len(self.targets):
+            logging.info("PN: REACHED FINAL POINT;\nEXITING EVENT")
             raise EventFinished
 
-            #main running: go to points in PN_arr
-        if self.PN_PassCheck():
-            logging.info(f"PN: PASSED TARGET POINT: {self.target_set}")
-            print(f"Passed target point: {self.target_set}")
-            self.target_set += 1
-        
-        logging.info(f"PN: CURR TARGET POINT: {self.target_set}")
-        print(f"Current target point: {self.target_set}")
-        return Waypoint(self.PN_arr[self.target_set*2], self.PN_arr[(self.target_set*2)+1])
+        logging.debug("PN: CURR TARGET POINT: %d", self.target_set)
+        return self.targets[self.target_set]
             
-    #find coords that should go to via cart of buoy coords
     def PN_coords(self):
-
+        """Finds the points to sail through and the gate the boat has to cross at each one"""
         #adjustable values
-        rad1 = (4/6371000) * (180 / math.pi)    #inner rad
-        rad2 = (8/6371000) * (180 / math.pi)    #outer rad
+        rad1 = 4    #inner rad (m)
+        rad2 = 8    #outer rad (m)
         m1= 45; m2= -15 #rad offset from 90 and 225/-45 points
         #see desmos: https://www.desmos.com/calculator/2fjqthukuf
 
-        ret_arr = []
-        #pt1= b3 rad1: 90+m1
-        #pt2= b3 rad2: 225+m2
-        #pt3= between b2 and b4
-        #pt4= b4 rad2:315+m2
-        #pt5= b4 rad1:90+m1
-        #pt6= between b1 and b2
-
-        #calcing x/y points
-        t = math.pi/180 #conv deg to rad
-        #b3[0-3]
-        ret_arr.append( rad1*math.cos(  (90+m1) *t)+self.event_info[4] )  #pt1x[0]
-        ret_arr.append( rad1*math.sin(  (90+m1) *t)+self.event_info[5] )  #pt1y[1]
-        ret_arr.append( rad2*math.cos( (225+m2) *t)+self.event_info[4] )  #pt2x[2]
-        ret_arr.append( rad2*math.sin( (225+m2) *t)+self.event_info[5] )  #pt2y[3]
-
-        #b3/4[4-5]
-        ret_arr.append( (self.event_info[4]+self.event_info[6])/2 )  #pt3x[4]
-        ret_arr.append( (self.event_info[5]+self.event_info[7])/2 )  #pt3y[5]
-
-        #b4[6-9]
-        ret_arr.append( rad2*math.cos( (315-m2) *t)+self.event_info[6] )  #pt4x[6]
-        ret_arr.append( rad2*math.sin( (315-m2) *t)+self.event_info[7] )  #pt4y[7]
-        ret_arr.append( rad1*math.cos(  (90-m1) *t)+self.event_info[6] )  #pt5x[8]
-        ret_arr.append( rad1*math.sin(  (90-m1) *t)+self.event_info[7] )  #pt5y[9]
+        start_left = self.frame.to_enu(self.start_left)
+        start_right = self.frame.to_enu(self.start_right)
+        start = geo.midpoint(start_left, start_right)
+        b1 = self.frame.to_enu(self.buoy1)
+        b2 = self.frame.to_enu(self.buoy2)
+
+        # The offsets are drawn for a course running south from the start line, rotate them to the real course
+        course = geo.sub(geo.midpoint(b1, b2), start)
+        turn = math.degrees(math.atan2(course[1], course[0])) + 90
+
+        def offset(buoy, radius, angle):
+            return geo.add(buoy, geo.rotate(geo.polar(radius, angle), turn))
+
+        points = [offset(b1, rad1, 90 + m1),    #pt1: past buoy1
+                  offset(b1, rad2, 225 + m2),   #pt2: around buoy1
+                  geo.midpoint(b1, b2),         #pt3: between the buoys
+                  offset(b2, rad2, 315 - m2),   #pt4: around buoy2
+                  offset(b2, rad1, 90 - m1),    #pt5: past buoy2
+                  start]                        #pt6: back through the start line
+
+        # Each gate faces along the path at its point (from the previous point towards the next one)
+        self.gates = []
+        for i in range(len(points) - 1):
+            previous = points[i - 1] if i > 0 else start
+            self.gates.append(geo.Gate(points[i], geo.sub(points[i + 1], previous)))
+        # Finishing means crossing the start line heading back up the course
+        self.gates.append(geo.Gate.through(start_left, start_right, towards=geo.sub(start, course)))
+
+        self.points = points
+        self.targets = [self.frame.to_waypoint(point) for point in points]
+        return self.targets
+
+    def state_code(self):
+        """Index of the target being sailed to"""
+        return self.target_set
 
-        #b1/2[10-11]
-        ret_arr.append( (self.event_info[0]+self.event_info[2])/2 )  #pt6x[10]
-        ret_arr.append( (self.event_info[1]+self.event_info[3])/2 )  #pt6y[11]
-
-        return ret_arr
-
-    #find if passed target (ret bool)
     def PN_PassCheck(self):
-        #self.target_set,self.PN_arr
-        #self.event_info
-
-        '''
-        #SK_f(x)
-        #P1[0-1], self.event_info[4-5]
-        #P1[2-3], self.event_info[4-5]
-        #
-        #P1[6-7], self.event_info[6-7]
-        #P1[8-9], self.event_info[6-7]
-        #self.event_info[0-1], self.event_info[2-3]
-
-        #pt1: x<P1x[0],    y<L1(x)[ m(P1[0-1],[]) ]
-        #pt2: x>P2x[2],    y<L2(x)
-        #pt3: x>Perpendicular P2toP4    -(1/m)x+ P[5]-(1/m)*P[6]
-        #pt4: x>P4x[6],    y>L4(x)
-        #pt5: x<P5x[8],    y>L5(x)
-        #pt6: y>L6(x)
-        '''
-
-        gps.updategps()
+        """Returns True once the boat has crossed the current target's gate"""
         if self.DEBUG: self.gps_spoof()
-        #gps.longitude
-        #gps.latitude
-
-        #TODO:
-        #either figure out better system, or put in a 'reverse if' of the next case in each statement to know whether the coords are right
-        #Ie: if x<whatever before it starts the next set, check for x>=whatever in the next case
-        #mult by a 'rev_bool' decided
-        #that really sucks to map out though
-
-        if self.ifupsidedown == None: self.ifupsidedown, self.ifsideways = self.PN_checkwayside() #True=sideways/upsidedown
-        #[x_]upsidedown: flip >/<
-        #[_x]sideways: flip long/lat
-        #00,01,10,11: standard;turn 90deg left for order
-        x=False
-
-        #standard------------------------------------------------------------------
-        if   not(self.ifupsidedown) and not(self.ifsideways):
-            #left(long) of BL buoy[{4},5]
-            #below(lat) line between p1[0,1] and BL buoy[4,5]
-            if self.target_set == 1:
-                x = (gps.longitude <= self.event_info[4]
-                    and gps.latitude <= self.SK_f( gps.longitude,self.PN_arr[0],self.PN_arr[1],self.event_info[4],self.event_info[5] ))
-
-            #below(lat) of BL buoy[4,{5}]
-            #below(lat) line between p2[2,3] and BL buoy[4,5]
-            elif self.target_set == 2:
-                x = (gps.latitude <= self.event_info[5]
-                    and gps.latitude <= self.SK_f( gps.longitude,self.PN_arr[2],self.PN_arr[3],self.event_info[4],self.event_info[5] ))
-
-            #right(long) of line perpendicular to p2[2,3] and p4[6,7] at p3[4,5]
-            elif self.target_set == 3:
-                x = gps.longitude >= self.PN_Perpend(gps.longitude,self.PN_arr[4],self.PN_arr[5],self.PN_arr[2],self.PN_arr[3],self.PN_arr[4],self.PN_arr[5])
-            
-            #right(long) of BR buoy[{6},7]
-            #above(lat) line between p4[6,7] and BR buoy[6,7]
-            elif self.target_set == 4:
-                x = (gps.longitude >= self.event_info[6]
-                    and gps.latitude >= self.SK_f( gps.longitude,self.PN_arr[6],self.PN_arr[7],self.event_info[6],self.event_info[7] ))
-            
-            #above(lat) of BR buoy[6,{7}]
-            #above(lat) line between p5[8,9] and BR buoy[6,7]
-            elif self.target_set == 5:
-                x = (gps.latitude >= self.event_info[7]
-                    and gps.latitude >= self.SK_f( gps.longitude,self.PN_arr[8],self.PN_arr[9],self.event_info[6],self.event_info[7] ))
-
-            #above(lat) line between TL[0,1] and TR[2,3]
-            elif self.target_set == 6:
-                x = gps.latitude >= self.SK_f( gps.longitude,self.event_info[0],self.event_info[1],self.event_info[2],self.event_info[3] )
-            else:
-                logging.info(f"PN: ERROR: 00: TARGET SET OUT OF RANGE (1to6)\nTARGET PNT = {self.target_set}")
-                print(f"PN: ERROR: 00: TARGET SET OUT OF RANGE (1to6)\nTARGET PNT = {self.target_set}")
-
-        #flip long/lat------------------------------------------------------------------
-        elif not(self.ifupsidedown) and     self.ifsideways:
-            #left(long) of BL buoy[{4},5]
-            #below(lat) line between p1[0,1] and BL buoy[4,5]
-            if self.target_set == 1:
-                x = (gps.latitude <= self.event_info[4]
-                    and gps.longitude <= self.SK_f( gps.latitude,self.PN_arr[0],self.PN_arr[1],self.event_info[4],self.event_info[5] ))
-
-            #below(lat) of BL buoy[4,{5}]
-            #below(lat) line between p2[2,3] and BL buoy[4,5]
-            elif self.target_set == 2:
-                x = (gps.longitude <= self.event_info[5]
-                    and gps.longitude <= self.SK_f( gps.latitude,self.PN_arr[2],self.PN_arr[3],self.event_info[4],self.event_info[5] ))
-
-            #right(long) of line perpendicular to p2[2,3] and p4[6,7] at p3[4,5]
-            elif self.target_set == 3:
-                x = gps.latitude >= self.PN_Perpend(gps.latitude,self.PN_arr[4],self.PN_arr[5],self.PN_arr[2],self.PN_arr[3],self.PN_arr[4],self.PN_arr[5])
-            
-            #right(long) of BR buoy[{6},7]
-            #above(lat) line between p4[6,7] and BR buoy[6,7]
-            elif self.target_set == 4:
-                x = (gps.latitude >= self.event_info[6]
-                    and gps.longitude >= self.SK_f( gps.latitude,self.PN_arr[6],self.PN_arr[7],self.event_info[6],self.event_info[7] ))
-            
-            #above(lat) of BR buoy[6,{7}]
-            #above(lat) line between p5[8,9] and BR buoy[6,7]
-            elif self.target_set == 5:
-                x = (gps.longitude >= self.event_info[7]
-                    and gps.longitude >= self.SK_f( gps.latitude,self.PN_arr[8],self.PN_arr[9],self.event_info[6],self.event_info[7] ))
-
-            #above(lat) line between TL[0,1] and TR[2,3]
-            elif self.target_set == 6:
-                x = gps.longitude >= self.SK_f( gps.latitude,self.event_info[0],self.event_info[1],self.event_info[2],self.event_info[3] )
-            else:
-                logging.info(f"PN: ERROR: 00: TARGET SET OUT OF RANGE (1to6)\nTARGET PNT = {self.target_set}")
-                print(f"PN: ERROR: 00: TARGET SET OUT OF RANGE (1to6)\nTARGET PNT = {self.target_set}")
-
-        #flip >/<------------------------------------------------------------------
-        elif self.ifupsidedown      and not(self.ifsideways):
-            #left(long) of BL buoy[{4},5]
-            #below(lat) line between p1[0,1] and BL buoy[4,5]
-            if self.target_set == 1:
-                x = (gps.longitude >= self.event_info[4]
-                    and gps.latitude >= self.SK_f( gps.longitude,self.PN_arr[0],self.PN_arr[1],self.event_info[4],self.event_info[5] ))
-
-            #below(lat) of BL buoy[4,{5}]
-            #below(lat) line between p2[2,3] and BL buoy[4,5]
-            elif self.target_set == 2:
-                x = (gps.latitude >= self.event_info[5]
-                    and gps.latitude >= self.SK_f( gps.longitude,self.PN_arr[2],self.PN_arr[3],self.event_info[4],self.event_info[5] ))
-
-            #right(long) of line perpendicular to p2[2,3] and p4[6,7] at p3[4,5]
-            elif self.target_set == 3:
-                x = gps.longitude <= self.PN_Perpend(gps.longitude,self.PN_arr[4],self.PN_arr[5],self.PN_arr[2],self.PN_arr[3],self.PN_arr[4],self.PN_arr[5])
-            
-            #right(long) of BR buoy[{6},7]
-            #above(lat) line between p4[6,7] and BR buoy[6,7]
-            elif self.target_set == 4:
-                x = (gps.longitude <= self.event_info[6]
-                    and gps.latitude <= self.SK_f( gps.longitude,self.PN_arr[6],self.PN_arr[7],self.event_info[6],self.event_info[7] ))
-            
-            #above(lat) of BR buoy[6,{7}]
-            #above(lat) line between p5[8,9] and BR buoy[6,7]
-            elif self.target_set == 5:
-                x = (gps.latitude <= self.event_info[7]
-                    and gps.latitude <= self.SK_f( gps.longitude,self.PN_arr[8],self.PN_arr[9],self.event_info[6],self.event_info[7] ))
-
-            #above(lat) line between TL[0,1] and TR[2,3]
-            elif self.target_set == 6:
-                x = gps.latitude <= self.SK_f( gps.longitude,self.event_info[0],self.event_info[1],self.event_info[2],self.event_info[3] )
-            else:
-                logging.info(f"PN: ERROR: 00: TARGET SET OUT OF RANGE (1to6)\nTARGET PNT = {self.target_set}")
-                print(f"PN: ERROR: 00: TARGET SET OUT OF RANGE (1to6)\nTARGET PNT = {self.target_set}")
-
-        #flip long/lat, flip >/<------------------------------------------------------------------
-        elif self.ifupsidedown      and     self.ifsideways:
-            #left(long) of BL buoy[{4},5]
-            #below(lat) line between p1[0,1] and BL buoy[4,5]
-            if self.target_set == 1:
-                x = (gps.latitude >= self.event_info[4]
-                    and gps.longitude >= self.SK_f( gps.latitude,self.PN_arr[0],self.PN_arr[1],self.event_info[4],self.event_info[5] ))
-
-            #below(lat) of BL buoy[4,{5}]
-            #below(lat) line between p2[2,3] and BL buoy[4,5]
-            elif self.target_set == 2:
-                x = (gps.longitude >= self.event_info[5]
-                    and gps.longitude >= self.SK_f( gps.latitude,self.PN_arr[2],self.PN_arr[3],self.event_info[4],self.event_info[5] ))
-
-            #right(long) of line perpendicular to p2[2,3] and p4[6,7] at p3[4,5]
-            elif self.target_set == 3:
-                x = gps.latitude <= self.PN_Perpend(gps.latitude,self.PN_arr[4],self.PN_arr[5],self.PN_arr[2],self.PN_arr[3],self.PN_arr[4],self.PN_arr[5])
-            
-            #right(long) of BR buoy[{6},7]
-            #above(lat) line between p4[6,7] and BR buoy[6,7]
-            elif self.target_set == 4:
-                x = (gps.latitude <= self.event_info[6]
-                    and gps.longitude <= self.SK_f( gps.latitude,self.PN_arr[6],self.PN_arr[7],self.event_info[6],self.event_info[7] ))
-            
-            #above(lat) of BR buoy[6,{7}]
-            #above(lat) line between p5[8,9] and BR buoy[6,7]
-            elif self.target_set == 5:
-                x = (gps.longitude <= self.event_info[7]
-                    and gps.longitude <= self.SK_f( gps.latitude,self.PN_arr[8],self.PN_arr[9],self.event_info[6],self.event_info[7] ))
-
-            #above(lat) line between TL[0,1] and TR[2,3]
-            elif self.target_set == 6:
-                x = gps.longitude <= self.SK_f( gps.latitude,self.event_info[0],self.event_info[1],self.event_info[2],self.event_info[3] )
-            else:
-                logging.info(f"PN: ERROR: 00: TARGET SET OUT OF RANGE (1to6)\nTARGET PNT = {self.target_set}")
-                print(f"PN: ERROR: 00: TARGET SET OUT OF RANGE (1to6)\nTARGET PNT = {self.target_set}")
-        
-
-        return x
-
-    def PN_Perpend(self,x,c1,c2,a1,b1,a2,b2):
-        #f(x) = y of line perpendicular to SK_f(a1,b1,a2,b2)
-
-        #x:input
-        #c1/c2:mid x/y
-        #a1/b1:point1
-        #a2/b2:point2
-
-        #m= -m0^-1
-        #v= c2-m0*c1
-        m = -1/self.SK_m(a1,b1,a2,b2)
-        v = c2 - m*c1
-        return m*x+v
-
-    def PN_checkwayside(self):
-        #check if sideways or upsidedown
-        #[!!!!!]return self.ifupsidedown,self.ifsideways
-        #self.event_info
-        #PN_arr
-        '''
-        1:rightways [standard]
-        2:90deg  right
-        3:180deg upsidedown
-        4:90deg  left
-
-        [4,5][10,11]
-        not sideways(1/3): 3>&6< 45deg line(p3/p6)  [same, keep]
-        sideways(2/4     : 3>&6< 45deg line(p3/p6)  [change long/lat asks]
-
-        rightside up(1/2)   [same, keep]
-        1:p3y<p6y
-        2:p3x<p6x
-        upside down(3/4)    [change >&<]
-        1:p3y>p6y
-        2:p3x>p6x
-        '''
-
-        if abs( self.SK_m(self.PN_arr[4],self.PN_arr[5],self.PN_arr[10],self.PN_arr[11]) ) <1:  a=True  #sideways
-        else: a=False
-
-        if a:   #sideways
-            if self.PN_arr[4] > self.PN_arr[10]: b=True    #upsidedown
-            else: b=False   #rightside up
-        else:   #rightways
-            if self.PN_arr[5] > self.PN_arr[11]: b=True    #upsidedown
-            else: b=False   #rightside up
-
-        return b,a  #changed for bool table reasons to b,a
+        if self.gps.latitude is None or self.gps.longitude is None:
+            return False
+        boat = self.frame.latlon_to_enu(self.gps.latitude, self.gps.longitude)
+        return self.gates[self.target_set].passed(boat)
     
 if __name__ == "__main__":
-    pass
\ No newline at end of file
+    pass
@@ -0,0 +1,426 @@
+"""
+Replays a flight recording (flightRecorder.py) through the boat's code and diffs its decisions against the recording
+    - The recorded GPS, compass, windvane and camera frames (with their detections) are put behind the interfaces the
+      code already reads: the gps(), windVane() and Camera() the events create and boatMain's sensor objects, so the
+      event and control code run unchanged
+    - Time comes from the recording, so timers inside the events behave as they did on the water. By default the
+      replay runs as fast as possible, --speed N paces it at N times real time
+    - Event replay (default) calls the event's next_gps() once per recorded tick and compares the waypoint, the event
+      state and when the event finished with the recording
+    - Control replay (--control) runs boatMain's controlTick() on a boat built without starting ROS or opening any
+      hardware and compares the sail and rudder commands, it needs rclpy installed
+    - The event and its waypoints come from the recording's notes.jsonl (saved when the mode is set), or --event and
+      --event-info
+    - Frames are only replayed with their saved detections, images are loaded (--images) only for code that looks at
+      frame.img
+    - `python3 scenarioRunner.py --record DIR` makes a recording from the simulator
+
+Usage:
+    python3 replay.py flights/
+    python3 replay.py flights/ --control --speed 10
+    python3 replay.py flights/ --event PN --event-info 42.0 -71.0 42.0 -71.001
+"""
+import argparse
+import math
+import os
+import sys
+import time
+import types
+from dataclasses import dataclass
+
+import numpy as np
+
+try:
+    import constants as c
+    import flightRecorder
+    import scenarioRunner
+    import settings
+    from eventUtils import Waypoint, distance_between
+except ImportError:
+    import sailbot.constants as c
+    import sailbot.flightRecorder as flightRecorder
+    import sailbot.scenarioRunner as scenarioRunner
+    import sailbot.settings as settings
+    from sailbot.eventUtils import Waypoint, distance_between
+
+WAYPOINT_TOLERANCE = 0.5   # meters between a replayed and recorded waypoint that count as the same
+COMMAND_TOLERANCE = 0.5    # degrees between a replayed and recorded sail/rudder command that count as the same
+
+
+@dataclass(slots=True)
+class Mismatch:
+    """
+    A replayed value that differs from the recording
+
+    Attributes:
+        - index (int): recorded sample
+        - time (float): unix time of the sample
+        - field (str): what differed, ex. 'waypoint', 'event_state', 'rudder_cmd'
+        - recorded, replayed: the two values
+    """
+    index: int
+    time: float
+    field: str
+    recorded: object
+    replayed: object
+
+    def __str__(self):
+        return (f"#{self.index} ({time.strftime('%H:%M:%S', time.localtime(self.time))}) {self.field}: "
+                f"recorded {self.recorded}, replayed {self.replayed}")
+
+
+class Recording:
+    """
+    A recorded run and the sample being replayed
+
+    Attributes:
+        - samples (np.ndarray): flightRecorder.RECORD samples
+        - frames (list): (metadata, image path) saved by flightRecorder.FrameSaver
+        - notes (list): notes.jsonl entries
+        - index (int): the current sample
+    """
+    def __init__(self, samples, frames=(), notes=(), load_images=False):
+        self.samples = samples
+        self.frames = list(frames)
+        self.notes = list(notes)
+        self.load_images = load_images
+        self.index = 0
+        self._frame_times = np.array([metadata["time"] for metadata, _ in self.frames])
+
+    @classmethod
+    def load(cls, directory, start=None, end=None, load_images=False):
+        return cls(flightRecorder.load(directory, start, end),
+                   flightRecorder.read_frames(os.path.join(directory, "frames")),
+                   flightRecorder.read_notes(directory), load_images)
+
+    @property
+    def now(self):
+        return float(self.samples["time"][self.index])
+
+    def value(self, name):
+        """The current sample's field, None if it wasn't recorded (NaN)"""
+        value = float(self.samples[name][self.index])
+        return None if math.isnan(value) else value
+
+    def new_frames(self):
+        """Frames saved since the previous sample, the ones the code captured on this tick"""
+        previous = self.samples["time"][self.index - 1] if self.index > 0 else -math.inf
+        first, last = np.searchsorted(self._frame_times, [previous, self.now], side="right")
+        return [self._frame(*frame) for frame in self.frames[first:last]]
+
+    def _frame(self, metadata, image):
+        def waypoint(position):
+            return None if position is None else Waypoint(*position)
+        img = None
+        if self.load_images and image is not None:
+            import cv2
+            img = cv2.imread(image)
+        detections = [types.SimpleNamespace(**{**detection, "gps": waypoint(detection["gps"])})
+                      for detection in metadata["detections"]]
+        return types.SimpleNamespace(**{**metadata, "gps": waypoint(metadata["gps"]), "img": img,
+                                        "detections": detections})
+
+    def event_note(self):
+        """(event code, event info) from the last mode note, None if there isn't one"""
+        for note in reversed(self.notes):
+            if note.get("kind") == "mode" and note.get("event") in scenarioRunner.EVENTS:
+                return note["event"], [Waypoint(*position) for position in note["event_info"]]
+        return None
+
+
+# ---------------------------------- REPLAYED SENSORS ----------------------------------
+
+_RECORDING = None  # the Recording being replayed in this process
+
+
+class ReplayClock:
+    """Stands in for the time module in event and control code, the clock is the current sample's time"""
+    def time(self):
+        return _RECORDING.now
+
+    def monotonic(self):
+        return _RECORDING.now - float(_RECORDING.samples["time"][0])
+
+    def sleep(self, seconds):
+        pass
+
+    def __getattr__(self, name):
+        # strftime, localtime... from the real module
+        return getattr(time, name)
+
+
+class ReplayGPS:
+    """Reads like GPS.gps and boatMain's ROS fed gps object"""
+    @property
+    def latitude(self):
+        return _RECORDING.value("lat")
+
+    @property
+    def longitude(self):
+        return _RECORDING.value("lon")
+
+    @property
+    def track_angle_deg(self):
+        return _RECORDING.value("gps_track")
+
+    @property
+    def speed(self):
+        return _RECORDING.value("gps_speed")
+
+    def updategps(self, *args):
+        pass
+
+    update = updateGPS = updategps
+
+
+class ReplayCompass:
+    turnRate = None  # not recorded, the heading controller estimates it from the heading
+
+    @property
+    def angle(self):
+        return _RECORDING.value("heading")
+
+
+class ReplayWindvane:
+    """Reads like windvane.windVane, raises when the windvane wasn't read on the recorded tick"""
+    @property
+    def angle(self):
+        angle = _RECORDING.value("wind_angle")
+        if angle is None:
+            raise RuntimeError("No windvane reading recorded")
+        return angle
+
+    @property
+    def position(self):
+        return int(self.angle)
+
+    @property
+    def noGoMin(self):
+        return 360 - settings.current().no_go_angle
+
+    @property
+    def noGoMax(self):
+        return settings.current().no_go_angle
+
+
+class ReplayCamera:
+    """Returns the frames the camera saved on the recorded tick, with their saved detections"""
+    def survey(self, num_images=3, servo_range=180, **kwargs):
+        return _RECORDING.new_frames()
+
+    def capture(self, **kwargs):
+        frames = _RECORDING.new_frames()
+        if frames:
+            return frames[-1]
+        return types.SimpleNamespace(img=None, time=_RECORDING.now, gps=None, heading=None, pitch=None, detections=[])
+
+    def focus(self, detection):
+        pass
+
+
+class ReplayTransceiver:
+    """No shore messages are replayed, telemetry goes nowhere"""
+    def readMessages(self):
+        return []
+
+    def send(self, data):
+        pass
+
+    sendBytes = send
+
+
+class CapturePublisher:
+    """Stands in for a ROS publisher, keeps the last published value"""
+    def __init__(self):
+        self.value = None
+
+    def publish(self, msg):
+        self.value = msg.data
+
+
+def install(recording):
+    """Points the sensor modules at 'recording', has to run before the event or boatMain modules are imported"""
+    global _RECORDING
+    _RECORDING = recording
+    scenarioRunner.install_sensors(gps=ReplayGPS, windvane=ReplayWindvane, camera=ReplayCamera,
+                                   compass={"compass": ReplayCompass},
+                                   drivers={"driver": None}, transceiver={"arduino": ReplayTransceiver})
+
+
+# ---------------------------------- REPLAY ----------------------------------
+
+def _automated(recording):
+    """Indices of the samples recorded while an event was running"""
+    return np.flatnonzero(recording.samples["manual"] == 0)
+
+
+def _pace(recording, speed, started):
+    """Sleeps until the current sample is due when replaying at 'speed' times real time"""
+    if speed > 0:
+        due = (recording.now - float(recording.samples["time"][0])) / speed
+        delay = due - (time.monotonic() - started)
+        if delay > 0:
+            time.sleep(delay)
+
+
+def _compare_waypoint(recording, waypoint, mismatches):
+    # boatMain keeps its target when the event returns None and clears it once goToGPS reaches it,
+    # so only a waypoint recorded next to a returned one can be compared
+    target_lat, target_lon = recording.value("target_lat"), recording.value("target_lon")
+    if waypoint is None or target_lat is None:
+        return
+    if distance_between(waypoint, Waypoint(target_lat, target_lon)) > WAYPOINT_TOLERANCE:
+        mismatches.append(Mismatch(recording.index, recording.now, "waypoint", (target_lat, target_lon),
+                                   (float(waypoint.lat), float(waypoint.lon))))
+
+
+def _compare_finish(recording, finished_at, mismatches):
+    """Checks the event finished on the tick the recording switched back to RC"""
+    samples = recording.samples
+    automated = _automated(recording)
+    recorded_end = next((i for i in range(automated[0], len(samples)) if samples["manual"][i]), None)
+    if recorded_end != finished_at and (recorded_end is not None or finished_at is not None):
+        index = min(i for i in (recorded_end, finished_at) if i is not None)
+        recording.index = index
+        mismatches.append(Mismatch(index, recording.now, "finished",
+                                   "running" if recorded_end is None else f"at #{recorded_end}",
+                                   "running" if finished_at is None else f"at #{finished_at}"))
+
+
+def replay_event(recording, event, event_info, speed=0.0):
+    """Runs the event's next_gps() against the recording (install() must have been called)
+    Args:
+        - event (str): scenarioRunner.EVENTS code, ex. 'PN'
+        - event_info (list[Waypoint]): what the event was created with
+        - speed (float): times real time, 0 replays as fast as possible
+    Returns:
+        - (samples replayed, list[Mismatch])
+    """
+    automated = _automated(recording)
+    if not len(automated):
+        return 0, []
+    event_class, event_finished = scenarioRunner.load_event(event, clock=ReplayClock(), camera=ReplayCamera)
+    recording.index = int(automated[0])
+    instance = event_class(event_info, gps=ReplayGPS(), windvane=ReplayWindvane())
+
+    mismatches, finished_at, replayed = [], None, 0
+    started = time.monotonic()
+    for index in range(automated[0], len(recording.samples)):
+        recording.index = index
+        _pace(recording, speed, started)
+        replayed += 1
+        try:
+            waypoint = instance.next_gps()
+        except event_finished:
+            finished_at = index
+            break
+        if recording.samples["manual"][index]:
+            # the boat went back to RC on this tick, the event didn't finish
+            break
+        _compare_waypoint(recording, waypoint, mismatches)
+        state = instance.state_code()
+        if state != recording.samples["event_state"][index]:
+            mismatches.append(Mismatch(index, recording.now, "event_state", int(recording.samples["event_state"][index]), state))
+
+    _compare_finish(recording, finished_at, mismatches)
+    return replayed, mismatches
+
+
+def make_boat(boatMain, event_code, event_info):
+    """A boatMain.boat running the event on replayed sensors, without ROS or hardware"""
+    boat = boatMain.boat(gps=ReplayGPS(), compass=ReplayCompass(), windvane=ReplayWindvane(), transceiver=ReplayTransceiver(),
+                         publishers=(CapturePublisher(), CapturePublisher()), record=False)
+    boat.event_arr = event_info
+    boat.MODE_SETTING = boatMain.events[event_code]
+    # started like the mode command does, on the boat's (replayed) gps and windvane
+    boat.startEvent()
+    boat.manualControl = False
+    return boat
+
+
+def replay_control(recording, event, event_info, speed=0.0):
+    """Runs boatMain's controlTick() against the recording (install() must have been called, needs rclpy)
+    Returns:
+        - (samples replayed, list[Mismatch])
+    """
+    automated = _automated(recording)
+    if not len(automated):
+        return 0, []
+    try:
+        import boatMain
+        import commandFilter
+    except ImportError:
+        import sailbot.boatMain as boatMain
+        import sailbot.commandFilter as commandFilter
+    clock = ReplayClock()
+    _, event_finished = scenarioRunner.load_event(event, clock=clock, camera=ReplayCamera)
+    # the control code's timers (heading controller, command filter, telemetry) follow the recording too
+    boatMain.time, boatMain.sleep, commandFilter.time = clock, clock.sleep, clock
+    boatMain.EventFinished = event_finished
+
+    recording.index = int(automated[0])
+    boat = make_boat(boatMain, event, event_info)
+
+    mismatches, finished_at, replayed = [], None, 0
+    started = time.monotonic()
+    for index in range(automated[0], len(recording.samples)):
+        recording.index = index
+        _pace(recording, speed, started)
+        replayed += 1
+        boat.controlTick()
+        if boat.manualControl:
+            finished_at = index
+            break
+        if recording.samples["manual"][index]:
+            break
+        for name, value in (("sail_cmd", boat.currentSail), ("rudder_cmd", boat.currentRudder)):
+            recorded = recording.value(name)
+            if recorded is not None and abs(float(value) - recorded) > COMMAND_TOLERANCE:
+                mismatches.append(Mismatch(index, recording.now, name, round(recorded, 2), round(float(value), 2)))
+
+    _compare_finish(recording, finished_at, mismatches)
+    return replayed, mismatches
+
+
+def print_report(replayed, mismatches, elapsed, recording, limit=20):
+    duration = float(recording.samples["time"][-1] - recording.samples["time"][0]) if len(recording.samples) else 0
+    print(f"Replayed {replayed} of {len(recording.samples)} samples ({duration:.0f}s recorded) in {elapsed:.2f}s")
+    if not mismatches:
+        print("No differences")
+        return
+    fields = {}
+    for mismatch in mismatches:
+        fields[mismatch.field] = fields.get(mismatch.field, 0) + 1
+    print(f"{len(mismatches)} differences: " + ", ".join(f"{field} x{count}" for field, count in fields.items()))
+    for mismatch in mismatches[:limit]:
+        print(f"    {mismatch}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a flight recording and diff the decisions against it")
+    parser.add_argument("directory", help="flight recorder directory")
+    parser.add_argument("--control", action="store_true", help="replay boatMain's control loop, not just the event")
+    parser.add_argument("--speed", type=float, default=0.0, help="times real time, 0 is as fast as possible")
+    parser.add_argument("--event", choices=list(scenarioRunner.EVENTS), help="instead of the recorded event")
+    parser.add_argument("--event-info", type=float, nargs="+", metavar="LAT LON", help="instead of the recorded waypoints")
+    parser.add_argument("--start", type=float, help="unix time to start from")
+    parser.add_argument("--end", type=float, help="unix time to stop at")
+    parser.add_argument("--images", action="store_true", help="load the saved frame images")
+    args = parser.parse_args()
+
+    recording = Recording.load(args.directory, args.start, args.end, args.images)
+    event, event_info = recording.event_note() or (None, [])
+    event = args.event or event
+    if args.event_info:
+        event_info = [Waypoint(lat, lon) for lat, lon in zip(args.event_info[::2], args.event_info[1::2])]
+    if event is None:
+        sys.exit("No event in the recording's notes, pass --event and --event-info")
+
+    install(recording)
+    start = time.perf_counter()
+    try:
+        replayed, mismatches = (replay_control if args.control else replay_event)(recording, event, event_info, args.speed)
+    except ImportError as e:
+        sys.exit(f"Control replay needs boatMain and its dependencies (rclpy): {e}")
+    print_report(replayed, mismatches, time.perf_counter() - start, recording)
+    sys.exit(1 if mismatches else 0)
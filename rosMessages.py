@@ -0,0 +1,264 @@
+"""
+Typed ROS messages passed between the sensor, driver and boatMain nodes
+    - GPS fixes are sensor_msgs/NavSatFix, GPS speed/track is geometry_msgs/TwistStamped (like nmea_navsat_driver)
+      and each fix's time, HDOP, satellites and sentence statistics are a diagnostic_msgs/DiagnosticStatus
+    - Compass heading is a sensor_msgs/Imu orientation so it carries a timestamp and a validity flag
+    - Sail and rudder commands are std_msgs/Float64 on one topic per actuator
+    - The fused state (estimatorNode.py) is a NavSatFix with its position covariance plus a nav_msgs/Odometry
+      carrying heading, speed and turn rate
+    - The old '(lat,lon,track)' and '(driver:sail:angle)' strings can still be parsed and published for older tools
+"""
+import math
+
+from std_msgs.msg import Float64, String
+from sensor_msgs.msg import NavSatFix, NavSatStatus, Imu
+from geometry_msgs.msg import TwistStamped
+from nav_msgs.msg import Odometry
+from diagnostic_msgs.msg import DiagnosticStatus, KeyValue
+
+GPS_FIX_TOPIC = 'GPS/fix'
+GPS_VEL_TOPIC = 'GPS/vel'
+GPS_STATUS_TOPIC = 'GPS/status'
+COMPASS_TOPIC = 'compass/imu'
+SAIL_TOPIC = 'driver/sail'
+RUDDER_TOPIC = 'driver/rudder'
+STATE_FIX_TOPIC = 'state/fix'
+STATE_TOPIC = 'state/odom'
+
+# String topics used before the typed messages, only published when [ROS] legacy_string_topics = 1
+LEGACY_GPS_TOPIC = 'GPS'
+LEGACY_COMPASS_TOPIC = 'compass'
+LEGACY_DRIVER_TOPIC = 'driver'
+
+KNOTS_TO_MS = 0.514444
+
+
+def stamp_to_seconds(stamp):
+    """Converts a builtin_interfaces/Time into seconds"""
+    return stamp.sec + stamp.nanosec * 1e-9
+
+
+def _stamp(node, msg, frame_id, stamp=None):
+    """Stamps a message with 'stamp' (seconds) or the node's current time"""
+    if stamp is None:
+        msg.header.stamp = node.get_clock().now().to_msg()
+    else:
+        msg.header.stamp.sec = int(stamp)
+        msg.header.stamp.nanosec = int((stamp - int(stamp)) * 1e9)
+    msg.header.frame_id = frame_id
+
+
+# ---------------------------------- GPS ----------------------------------
+
+def make_gps_fix(node, lat, lon, std=None, stamp=None):
+    """Builds a NavSatFix, a missing lat/lon is published as NaN with STATUS_NO_FIX
+    Args:
+        - std (float): 1 sigma horizontal accuracy in meters if known
+        - stamp (float): when the fix was measured in seconds, defaults to now
+    """
+    msg = NavSatFix()
+    _stamp(node, msg, 'gps', stamp)
+    msg.status.service = NavSatStatus.SERVICE_GPS
+    if lat is None or lon is None:
+        msg.status.status = NavSatStatus.STATUS_NO_FIX
+        msg.latitude = math.nan
+        msg.longitude = math.nan
+    else:
+        msg.status.status = NavSatStatus.STATUS_FIX
+        msg.latitude = float(lat)
+        msg.longitude = float(lon)
+    msg.altitude = math.nan
+    if std is None:
+        msg.position_covariance_type = NavSatFix.COVARIANCE_TYPE_UNKNOWN
+    else:
+        msg.position_covariance[0] = msg.position_covariance[4] = float(std) ** 2
+        msg.position_covariance_type = NavSatFix.COVARIANCE_TYPE_DIAGONAL_KNOWN
+    return msg
+
+
+def read_gps_std(msg):
+    """The 1 sigma horizontal accuracy in meters of a NavSatFix, None if it wasn't given"""
+    if msg.position_covariance_type == NavSatFix.COVARIANCE_TYPE_UNKNOWN:
+        return None
+    return math.sqrt(max(msg.position_covariance[0], msg.position_covariance[4]))
+
+
+def read_gps_fix(msg):
+    """
+    Returns:
+        - (lat, lon, stamp) where lat/lon are None if the GPS has no fix and stamp is in seconds
+    """
+    stamp = stamp_to_seconds(msg.header.stamp)
+    if msg.status.status < NavSatStatus.STATUS_FIX:
+        return None, None, stamp
+    return msg.latitude, msg.longitude, stamp
+
+
+def make_gps_vel(node, speed_knots, track_angle_deg, stamp=None):
+    """Builds a TwistStamped holding the GPS ground velocity in m/s (x = east, y = north)"""
+    msg = TwistStamped()
+    _stamp(node, msg, 'gps', stamp)
+    if speed_knots is None or track_angle_deg is None:
+        msg.twist.linear.x = math.nan
+        msg.twist.linear.y = math.nan
+    else:
+        speed = speed_knots * KNOTS_TO_MS
+        track = math.radians(track_angle_deg)
+        msg.twist.linear.x = speed * math.sin(track)
+        msg.twist.linear.y = speed * math.cos(track)
+    return msg
+
+
+def read_gps_vel(msg):
+    """
+    Returns:
+        - (speed m/s, track angle to north in degrees, stamp), speed and track are None if unknown
+        - NOTE: the track angle is meaningless when the boat isn't moving
+    """
+    stamp = stamp_to_seconds(msg.header.stamp)
+    east, north = msg.twist.linear.x, msg.twist.linear.y
+    if math.isnan(east) or math.isnan(north):
+        return None, None, stamp
+    return math.hypot(east, north), math.degrees(math.atan2(east, north)) % 360, stamp
+
+
+def make_gps_status(node, fix, stream):
+    """
+    Builds a DiagnosticStatus describing a GPS fix (nmeaReader.Fix) and the reader's (nmeaReader.NMEAStream) statistics
+        - level is OK with a fix and WARN without one
+    """
+    msg = DiagnosticStatus()
+    msg.name = 'GPS'
+    msg.hardware_id = stream.port
+    msg.level = DiagnosticStatus.OK if fix.has_fix else DiagnosticStatus.WARN
+    msg.message = 'fix' if fix.has_fix else 'no fix'
+    values = {'fix_time': fix.time, 'hdop': fix.hdop, 'satellites': fix.satellites, 'quality': fix.quality,
+              'sentences': stream.sentences, 'dropped': stream.dropped, 'late': stream.late, 'missed': stream.missed}
+    msg.values = [KeyValue(key=key, value=str(value)) for key, value in values.items()]
+    return msg
+
+
+def read_gps_status(msg):
+    """
+    Returns:
+        - dict of the values in a GPS DiagnosticStatus as floats (None for missing values)
+    """
+    return {item.key: None if item.value == 'None' else float(item.value) for item in msg.values}
+
+
+# ---------------------------------- COMPASS ----------------------------------
+
+def make_heading(node, angle, acceleration=None):
+    """
+    Builds an Imu message from a compass heading (degrees clockwise from north)
+        - The heading is stored as a yaw quaternion in ROS' east-north-up convention
+        - Per sensor_msgs/Imu, a covariance[0] of -1 marks the orientation/acceleration as missing
+    """
+    msg = Imu()
+    _stamp(node, msg, 'compass')
+    if angle is None:
+        msg.orientation_covariance[0] = -1.0
+    else:
+        yaw = math.radians(90 - angle)
+        msg.orientation.z = math.sin(yaw / 2)
+        msg.orientation.w = math.cos(yaw / 2)
+
+    if acceleration is None:
+        msg.linear_acceleration_covariance[0] = -1.0
+    else:
+        msg.linear_acceleration.x, msg.linear_acceleration.y, msg.linear_acceleration.z = acceleration
+    msg.angular_velocity_covariance[0] = -1.0
+    return msg
+
+
+def read_heading(msg):
+    """
+    Returns:
+        - (heading in degrees clockwise from north, stamp), heading is None if the compass had no reading
+    """
+    stamp = stamp_to_seconds(msg.header.stamp)
+    if msg.orientation_covariance[0] == -1.0:
+        return None, stamp
+    yaw = 2 * math.atan2(msg.orientation.z, msg.orientation.w)
+    return (90 - math.degrees(yaw)) % 360, stamp
+
+
+def read_acceleration(msg):
+    """
+    Returns:
+        - (x, y, z) acceleration in m/s^2 from an Imu message, None if it wasn't measured
+    """
+    if msg.linear_acceleration_covariance[0] == -1.0:
+        return None
+    return msg.linear_acceleration.x, msg.linear_acceleration.y, msg.linear_acceleration.z
+
+
+# ---------------------------------- STATE ----------------------------------
+
+def make_state(node, state):
+    """
+    Builds an Odometry message from a stateEstimator.BoatState
+        - Pose is meters east/north of the estimator origin with the heading as a yaw quaternion (east-north-up)
+        - Twist is the speed along the heading and the yaw rate (counterclockwise positive, rad/s)
+        - Covariances are filled for x, y, yaw, speed and yaw rate
+    """
+    msg = Odometry()
+    _stamp(node, msg, 'enu')
+    msg.child_frame_id = 'boat'
+    msg.pose.pose.position.x = state.x
+    msg.pose.pose.position.y = state.y
+    yaw = math.radians(90 - state.heading)
+    msg.pose.pose.orientation.z = math.sin(yaw / 2)
+    msg.pose.pose.orientation.w = math.cos(yaw / 2)
+    msg.twist.twist.linear.x = state.speed
+    msg.twist.twist.angular.z = -math.radians(state.turn_rate)
+
+    P = state.covariance
+    pose = [0.0] * 36
+    pose[0], pose[1], pose[6], pose[7] = P[0, 0], P[0, 1], P[1, 0], P[1, 1]
+    pose[35] = P[3, 3]
+    msg.pose.covariance = [float(value) for value in pose]
+    twist = [0.0] * 36
+    twist[0], twist[35] = P[2, 2], P[4, 4]
+    msg.twist.covariance = [float(value) for value in twist]
+    return msg
+
+
+def read_state(msg):
+    """
+    Returns:
+        - (heading in compass degrees, speed m/s, turn rate degrees/s clockwise, stamp)
+    """
+    yaw = 2 * math.atan2(msg.pose.pose.orientation.z, msg.pose.pose.orientation.w)
+    return ((90 - math.degrees(yaw)) % 360, msg.twist.twist.linear.x, -math.degrees(msg.twist.twist.angular.z),
+            stamp_to_seconds(msg.header.stamp))
+
+
+# ---------------------------------- DRIVERS ----------------------------------
+
+def make_command(angle):
+    msg = Float64()
+    msg.data = float(angle)
+    return msg
+
+
+# ------------------------------ LEGACY STRINGS ------------------------------
+
+def make_legacy_string(data):
+    msg = String()
+    msg.data = data
+    return msg
+
+
+def parse_legacy_gps(data):
+    """Parses '(lat,lon,track)', returns (lat, lon, track) with None for missing values"""
+    values = data.replace("(", "").replace(")", "").split(",")
+    return tuple(None if value == "None" else float(value) for value in values)
+
+
+def parse_legacy_driver(data):
+    """Parses '(driver:sail/rudder:{angle})', returns (actuator, angle) or None if it isn't a driver command"""
+    args = data.replace('(', '').replace(')', "").split(":")
+    if len(args) != 3 or args[0] != 'driver' or args[1] not in ('sail', 'rudder'):
+        return None
+    return args[1], float(args[2])
@@ -0,0 +1,619 @@
+"""
+Monte Carlo scoring of the event planners on the headless simulator (simEngine.py)
+    - Every scenario randomizes the wind, current, GPS noise and buoy layout, builds the event from that layout
+      and drives its next_gps() against a simulated boat until it finishes or runs out of time
+    - The event code is imported unchanged: it is given the simulated GPS and windvane like boatMain gives it the boat's,
+      its camera and clock are swapped for simulated ones inside the worker processes only, so nothing touches real hardware
+    - Scores are measured from the boat's track using the competition rules (not the event's own bookkeeping)
+    - Scenarios run on a multiprocessing pool across every core
+    - --record runs one scenario in this process and saves it like the boat's flight recorder, for replay.py
+
+Usage:
+    python3 scenarioRunner.py --events PN SK --runs 200
+    python3 scenarioRunner.py --events SK --runs 50 --seed 3 --json results.json
+    python3 scenarioRunner.py --events SE --seed 3 --record flights/sim
+"""
+import argparse
+import importlib
+import importlib.util
+import json
+import logging
+import math
+import multiprocessing
+import os
+import sys
+import time
+import types
+from collections import Counter
+from dataclasses import asdict, dataclass
+
+import numpy as np
+
+try:
+    import constants as c
+    import geodesy as geo
+    from eventUtils import Waypoint
+    from flightRecorder import FlightRecorder, FrameSaver
+    from simEngine import Simulation, SimConfig, steer_to, wrap180
+except ImportError:
+    import sailbot.constants as c
+    import sailbot.geodesy as geo
+    from sailbot.eventUtils import Waypoint
+    from sailbot.flightRecorder import FlightRecorder, FrameSaver
+    from sailbot.simEngine import Simulation, SimConfig, steer_to, wrap180
+
+# event code -> (module, class, simulated seconds before giving up)
+EVENTS = {
+    "PN": ("precisionNavigation", "Precision_Navigation", 600),
+    "SK": ("stationKeeping", "Station_Keeping", 400),
+    "ED": ("endurance", "Endurance", 3600),
+    "SE": ("search", "Search", 900),
+}
+
+ORIGIN = Waypoint(42.0, -71.0)
+
+# Seconds the boat keeps its last course after the event finishes
+FINISH_COAST = 10
+
+
+@dataclass(slots=True)
+class Scenario:
+    """
+    One randomized run of an event
+
+    Attributes:
+        - event (str): key into EVENTS
+        - seed (int): seeds the layout, wind walk and sensor noise
+        - wind_speed (float): m/s
+        - wind_direction (float): compass direction the wind blows from
+        - current (tuple): (east, north) in m/s
+        - gps_noise (float): standard deviation of each GPS fix in meters
+        - duration (float): simulated seconds before the run counts as a timeout
+    """
+    event: str
+    seed: int
+    wind_speed: float
+    wind_direction: float
+    current: tuple
+    gps_noise: float
+    duration: float
+    gust_std: float = 0.1
+    shift_std: float = 1.0
+
+
+@dataclass(slots=True)
+class ScenarioResult:
+    """
+    Attributes:
+        - outcome (str): 'finished', 'timeout' or '<stage> <exception type>' when the event code raised
+        - score (float): competition points earned by the simulated track
+        - time_in_box (float): station keeping seconds inside the box during the 5 minutes
+        - lap_time (float): seconds to finish the course (PN) or the first lap (ED), None if never
+    """
+    event: str
+    seed: int
+    outcome: str
+    score: float = 0.0
+    sim_time: float = 0.0
+    distance_sailed: float = 0.0
+    time_in_box: float = None
+    lap_time: float = None
+    error: str = None
+
+
+def make_scenarios(event, runs, seed=0):
+    """Draws 'runs' random scenarios for an event"""
+    rng = np.random.default_rng(seed)
+    scenarios = []
+    for i in range(runs):
+        current = rng.uniform(0, 0.3)
+        current_direction = math.radians(rng.uniform(0, 360))
+        scenarios.append(Scenario(event=event, seed=int(seed * 100003 + i),
+                                  wind_speed=float(rng.uniform(2, 7)), wind_direction=float(rng.uniform(0, 360)),
+                                  current=(current * math.sin(current_direction), current * math.cos(current_direction)),
+                                  gps_noise=float(rng.uniform(0.5, 3)), duration=EVENTS[event][2]))
+    return scenarios
+
+
+# ---------------------------------- SIMULATED SENSORS ----------------------------------
+
+_WORLD = None  # the World of the scenario running in this process
+
+
+class SimClock:
+    """Stands in for the time module inside event code so timers follow simulated time"""
+    EPOCH = 1.7e9
+
+    def time(self):
+        return self.EPOCH + _WORLD.sim.time
+
+    def monotonic(self):
+        return _WORLD.sim.time
+
+    def sleep(self, seconds):
+        pass
+
+
+class SimGPS:
+    """GPS with a fix every 'period' seconds, each fix off by gaussian noise"""
+    def __init__(self, world, noise, period=1.0):
+        self.world = world
+        self.noise = noise
+        self.period = period
+        self.latitude = self.longitude = None
+        self.track_angle_deg = 0
+        self._last_fix = -math.inf
+
+    def update(self):
+        sim = self.world.sim
+        if sim.time - self._last_fix < self.period:
+            return
+        self._last_fix = sim.time
+        dx, dy = self.world.rng.normal(0, self.noise, 2)
+        fix = sim.frame.to_waypoint((sim.x[0] + dx, sim.y[0] + dy))
+        self.latitude, self.longitude = fix.lat, fix.lon
+        self.track_angle_deg = float(sim.heading[0])
+
+
+class SimWindvane:
+    """Reads the wind angle relative to the bow like windvane.windVane"""
+    def __init__(self, world):
+        self.world = world
+        no_go = float(c.config["MAIN"]["no_go_angle"])
+        self.noGoMin, self.noGoMax = 360 - no_go, no_go
+
+    @property
+    def position(self):
+        return int(self.world.sim.relative_wind()[0])
+
+    @property
+    def angle(self):
+        return float(self.world.sim.relative_wind()[0])
+
+
+class SimCamera:
+    """
+    Detects the scenario's buoys that are in range of the boat
+        - survey() sees all around the bow, capture() only within the lens FoV of where focus() pointed it
+        - Detected positions get worse with distance, a small rate of false positives is scattered around the boat
+    """
+    FOV = 62.2
+
+    def __init__(self, world, detect_range=float(c.config["SEARCH"]["max_detection_distance"]), hit_rate=0.8, false_positives=0.05):
+        self.world = world
+        self.detect_range = detect_range
+        self.hit_rate = hit_rate
+        self.false_positives = false_positives
+        self.bearing = None
+        self.saver = None  # flightRecorder.FrameSaver when the run is recorded
+
+    def _frame(self, half_fov):
+        world, sim = self.world, self.world.sim
+        boat = (sim.x[0], sim.y[0])
+        center = sim.heading[0] if self.bearing is None else self.bearing
+        detections = []
+        for buoy in world.targets:
+            distance = geo.distance(boat, buoy)
+            bearing = geo.vector_to_bearing(geo.sub(buoy, boat))
+            if distance > self.detect_range or abs(wrap180(bearing - center)) > half_fov:
+                continue
+            if world.rng.random() < self.hit_rate:
+                error = world.gps.noise + 0.1 * distance
+                position = geo.add(buoy, tuple(world.rng.normal(0, error, 2)))
+                detections.append(types.SimpleNamespace(gps=sim.frame.to_waypoint(position), conf=float(world.rng.uniform(0.6, 0.95))))
+        if world.rng.random() < self.false_positives:
+            position = geo.add(boat, tuple(world.rng.uniform(-self.detect_range, self.detect_range, 2)))
+            detections.append(types.SimpleNamespace(gps=sim.frame.to_waypoint(position), conf=float(world.rng.uniform(0.5, 0.7))))
+        frame = types.SimpleNamespace(detections=detections, gps=sim.waypoint(), heading=center, time=SimClock().time())
+        if self.saver is not None:
+            self.saver.save(frame)
+        return frame
+
+    def survey(self, num_images=3, servo_range=180, **kwargs):
+        self.bearing = None
+        return [self._frame(servo_range / 2 + self.FOV / 2)]
+
+    def capture(self, **kwargs):
+        return self._frame(self.FOV / 2)
+
+    def focus(self, detection):
+        waypoint = getattr(detection, "gps", detection)
+        boat = (self.world.sim.x[0], self.world.sim.y[0])
+        self.bearing = geo.vector_to_bearing(geo.sub(self.world.sim.frame.to_enu(waypoint), boat))
+
+
+def _sim_gps():
+    return _WORLD.gps
+
+
+def _sim_windvane():
+    return _WORLD.windvane
+
+
+def _sim_camera():
+    return _WORLD.camera
+
+
+def install_sensors(gps=_sim_gps, windvane=_sim_windvane, camera=_sim_camera, **modules):
+    """Makes the hardware modules event code imports resolve to the simulated sensors (call only in a worker process)
+    Args:
+        - gps, windvane, camera (callable): what gps(), windVane() and Camera() return, the simulated sensors by default
+        - modules: more module name -> {attribute: value} to replace (replay.py also swaps compass, drivers...)
+    """
+    if "sailbot" not in sys.modules and importlib.util.find_spec("sailbot") is None:
+        # endurance and search import sailbot.X like the ROS package, point that at this directory
+        package = types.ModuleType("sailbot")
+        package.__path__ = [os.path.dirname(os.path.abspath(__file__))]
+        sys.modules["sailbot"] = package
+
+    replacements = {"GPS": {"gps": gps}, "windvane": {"windVane": windvane}, "camera": {"Camera": camera}}
+    replacements.update(modules)
+    for name, attributes in replacements.items():
+        module = types.ModuleType(name)
+        module.__dict__.update(attributes)
+        sys.modules[name] = module
+        sys.modules[f"sailbot.{name}"] = module
+
+
+def load_event(event, clock=None, camera=_sim_camera):
+    """Imports an event class and points its module's camera and clock at the simulation (or replay.py's log)
+        - the gps and windvane are passed to the event when it is created, like boatMain does
+    Returns:
+        - (event class, the EventFinished its module raises)
+    """
+    module_name, class_name, _ = EVENTS[event]
+    module = importlib.import_module(module_name)
+    module.time = SimClock() if clock is None else clock
+    if hasattr(module, "Camera"):
+        module.Camera = camera
+    return getattr(module, class_name), module.EventFinished
+
+
+# ---------------------------------- LAYOUTS & SCORING ----------------------------------
+
+class World:
+    """
+    The simulated boat, sensors and buoy layout of one scenario, positions are meters east/north of ORIGIN
+
+    Attributes:
+        - event_info (list[Waypoint]): what the event is started with
+        - targets (list[(float, float)]): buoys the camera can see
+    """
+    def __init__(self, scenario):
+        self.scenario = scenario
+        self.rng = np.random.default_rng(scenario.seed)
+        config = SimConfig(wind_speed=scenario.wind_speed, wind_direction=scenario.wind_direction, current=scenario.current,
+                           gust_std=scenario.gust_std, shift_std=scenario.shift_std)
+        self.sim = Simulation(1, origin=ORIGIN, config=config, seed=scenario.seed)
+        self.gps = SimGPS(self, scenario.gps_noise)
+        self.windvane = SimWindvane(self)
+        self.camera = SimCamera(self)
+        self.targets = []
+
+        start, heading, self.event_info, self.scorer = getattr(self, f"_layout_{scenario.event}")()
+        self.sim.x[0], self.sim.y[0] = start
+        self.sim.heading[0] = heading % 360
+
+    def _waypoints(self, points):
+        return [self.sim.frame.to_waypoint(point) for point in points]
+
+    def _layout_PN(self):
+        # the course runs downwind from a 10m start line to two buoys 8-15m apart, 40-70m away
+        course = self.scenario.wind_direction + 180 + self.rng.uniform(-30, 30)
+        down, across = geo.bearing_to_vector(course), geo.bearing_to_vector(course + 90)
+        length, spread = self.rng.uniform(40, 70), self.rng.uniform(8, 15) / 2
+        start_left, start_right = geo.scale(across, -5), geo.scale(across, 5)
+        end = geo.scale(down, length)
+        buoy1, buoy2 = geo.add(end, geo.scale(across, -spread)), geo.add(end, geo.scale(across, spread))
+        scorer = PrecisionNavigationScore(start_left, start_right, buoy1, buoy2)
+        return geo.scale(down, -5), course, self._waypoints([start_left, start_right, buoy1, buoy2]), scorer
+
+    def _layout_SK(self):
+        # 40m box with its front edge upwind, the boat starts just behind it
+        front = self.scenario.wind_direction + self.rng.uniform(-20, 20)
+        up, right = geo.bearing_to_vector(front), geo.bearing_to_vector(front + 90)
+        corners = [geo.add(geo.scale(up, dy), geo.scale(right, dx)) for dx, dy in ((-20, 20), (20, 20), (-20, -20), (20, -20))]
+        start = geo.scale(up, -30 + self.rng.uniform(-5, 5))
+        return start, front, self._waypoints(corners), StationKeepingScore(corners)
+
+    def _layout_ED(self):
+        # a 1NM rectangle at a random orientation, the boat starts at the first buoy
+        rotation = self.rng.uniform(0, 360)
+        width = self.rng.uniform(300, 600)
+        height = 1852 / 2 - width
+        buoys = [geo.rotate(point, rotation) for point in ((0, 0), (width, 0), (width, height), (0, height))]
+        start = geo.add(buoys[0], geo.rotate((-15, -15), rotation))
+        return start, self.rng.uniform(0, 360), self._waypoints(buoys), EnduranceScore(buoys)
+
+    def _layout_SE(self):
+        # buoy anywhere within 100m of the reference point, the boat starts 150m away
+        radius = 100
+        buoy = geo.polar(radius * math.sqrt(self.rng.uniform()), self.rng.uniform(0, 360))
+        start = geo.polar(150, self.rng.uniform(0, 360))
+        self.targets = [buoy]
+        return start, self.rng.uniform(0, 360), [self.sim.frame.to_waypoint((0, 0)), radius], SearchScore(buoy, radius)
+
+
+class PrecisionNavigationScore:
+    """2 points per buoy rounded, then 6 for finishing between the start buoys or 4 for crossing the line outside them"""
+    def __init__(self, start_left, start_right, buoy1, buoy2):
+        self.start_left, self.start_right = start_left, start_right
+        self.buoys = (buoy1, buoy2)
+        self.start = geo.midpoint(start_left, start_right)
+        self.course = geo.sub(geo.midpoint(buoy1, buoy2), self.start)
+        self.progress = 0.0  # furthest the boat has been down the course, as a fraction of its length
+        self.swept = [0.0, 0.0]
+        self.bearings = None
+        self.finish = 0
+        self.lap_time = None
+
+    def update(self, previous, boat, now, dt):
+        bearings = [geo.vector_to_bearing(geo.sub(boat, buoy)) for buoy in self.buoys]
+        if self.bearings is not None:
+            for i in range(2):
+                self.swept[i] += float(wrap180(bearings[i] - self.bearings[i]))
+        self.bearings = bearings
+        self.progress = max(self.progress, geo.dot(geo.sub(boat, self.start), self.course) / geo.dot(self.course, self.course))
+
+        # finishing is crossing the start line heading back after sailing at least halfway down the course
+        if self.finish or self.progress < 0.5 or geo.dot(geo.sub(boat, previous), self.course) >= 0:
+            return
+        crossing = geo.line_intersection(previous, geo.sub(boat, previous), self.start_left, self.start_right)
+        if crossing is not None and 0 <= crossing[1] <= 1:
+            along = geo.dot(geo.sub(crossing[0], self.start_left), geo.sub(self.start_right, self.start_left))
+            between = 0 <= along <= geo.dot(geo.sub(self.start_right, self.start_left), geo.sub(self.start_right, self.start_left))
+            self.finish = 6 if between else 4
+            self.lap_time = now
+
+    @property
+    def rounded(self):
+        return sum(abs(swept) >= 180 for swept in self.swept)
+
+    def result(self):
+        return {"score": 2 * self.rounded + self.finish, "lap_time": self.lap_time}
+
+
+class StationKeepingScore:
+    """2 points per minute in the box during the first 5 minutes, minus 2 per minute in it after 5 1/2"""
+    def __init__(self, corners):
+        b1, b2, b3, b4 = corners
+        self.edges = [geo.Gate.through(a, b, towards=geo.scale(geo.midpoint(a, b), 2)) for a, b in ((b1, b2), (b3, b4), (b1, b3), (b2, b4))]
+        self.time_in_box = 0.0
+        self.late_time = 0.0
+
+    def update(self, previous, boat, now, dt):
+        if any(edge.passed(boat) for edge in self.edges):
+            return
+        if now <= 300:
+            self.time_in_box += dt
+        elif now > 330:
+            self.late_time += dt
+
+    def result(self):
+        score = 2 * self.time_in_box / 60 - 2 * self.late_time / 60
+        return {"score": min(max(score, 0), 10), "time_in_box": self.time_in_box}
+
+
+class EnduranceScore:
+    """1 point per lap (the buoys in order, passing within 'radius' meters), plus 1 per hour sailed once a lap is done"""
+    def __init__(self, buoys, radius=15):
+        self.buoys = buoys
+        self.radius = radius
+        self.next_buoy = 1
+        self.laps = 0
+        self.lap_time = None
+        self.sailed = 0.0
+
+    def update(self, previous, boat, now, dt):
+        self.sailed = now
+        if geo.distance(boat, self.buoys[self.next_buoy]) > self.radius:
+            return
+        if self.next_buoy == 0:
+            self.laps += 1
+            if self.lap_time is None:
+                self.lap_time = now
+        self.next_buoy = (self.next_buoy + 1) % len(self.buoys)
+
+    def result(self):
+        hours = min(int(self.sailed // 3600), 6) if self.laps else 0
+        return {"score": min(self.laps + hours, 10), "lap_time": self.lap_time}
+
+
+class SearchScore:
+    """12 points for touching the buoy, 9 for passing within 1m, 6 for sailing a search pattern in the area"""
+    def __init__(self, buoy, radius, touch=0.5, pattern_distance=100):
+        self.buoy = buoy
+        self.radius = radius
+        self.touch = touch
+        self.pattern_distance = pattern_distance
+        self.closest = math.inf
+        self.searched = 0.0
+
+    def update(self, previous, boat, now, dt):
+        self.closest = min(self.closest, geo.distance(boat, self.buoy))
+        if geo.norm(boat) <= self.radius:
+            self.searched += geo.distance(previous, boat)
+
+    def result(self):
+        if self.closest <= self.touch:
+            score = 12
+        elif self.closest <= 1:
+            score = 9
+        else:
+            score = 6 if self.searched >= self.pattern_distance else 0
+        return {"score": score}
+
+
+# ---------------------------------- RUNNER ----------------------------------
+
+def _init_worker():
+    logging.disable(logging.INFO)  # events log every tick
+    install_sensors()
+
+
+def run_scenario(scenario, recorder=None):
+    """Runs one scenario to completion in this process (install_sensors() must have been called)
+    Args:
+        - recorder (flightRecorder.FlightRecorder): save a sample every control period, the event info and the
+          camera frames like the boat does, so the run can be replayed (replay.py)
+    Returns:
+        - ScenarioResult
+    """
+    global _WORLD
+    world = _WORLD = World(scenario)
+    sim = world.sim
+    result = ScenarioResult(event=scenario.event, seed=scenario.seed, outcome="timeout")
+
+    try:
+        event_class, event_finished = load_event(scenario.event)
+    except Exception as e:
+        result.outcome, result.error = f"import {type(e).__name__}", str(e)
+        return result
+
+    world.gps.update()
+    try:
+        event = event_class(world.event_info, gps=world.gps, windvane=world.windvane)
+    except Exception as e:
+        result.outcome, result.error = f"init {type(e).__name__}", str(e)
+        return result
+
+    if recorder is not None:
+        recorder.note("mode", event=scenario.event,
+                      event_info=[[float(w.lat), float(w.lon)] for w in world.event_info])
+        world.camera.saver = FrameSaver(os.path.join(recorder.directory, "frames"))
+
+    def sail_for(target, seconds):
+        """Returns the first (rudder, sail) command"""
+        command = None
+        for _ in range(max(1, round(seconds / sim.config.dt))):
+            if target is None:
+                # boatMain lets the sail out and leaves the rudder when the event returns None
+                rudder, sail = 0, 90
+            else:
+                rudder, sail = steer_to(sim, target[0], target[1], polar=sim.polar)
+            if command is None:
+                command = (float(np.asarray(rudder).flat[0]), float(np.asarray(sail).flat[0]))
+            previous = (float(sim.x[0]), float(sim.y[0]))
+            sim.step(rudder, sail)
+            boat = (float(sim.x[0]), float(sim.y[0]))
+            result.distance_sailed += geo.distance(previous, boat)
+            world.scorer.update(previous, boat, sim.time, sim.config.dt)
+        return command
+
+    control_period = 1 / float(c.config["MAIN"]["control_rate"])
+    target = None
+    while sim.time < scenario.duration:
+        world.gps.update()
+        try:
+            waypoint = event.next_gps()
+        except event_finished:
+            result.outcome = "finished"
+            if recorder is not None:
+                # boatMain switches to RC on the tick the event finishes
+                recorder.record(**_sample(world, None, None))
+            # the event decides it is done from a noisy fix, keep the last course until RC would take over
+            sail_for(target, FINISH_COAST)
+            break
+        except Exception as e:
+            result.outcome, result.error = f"next_gps {type(e).__name__}", str(e)
+            break
+        target = None if waypoint is None else sim.frame.to_enu(waypoint)
+        # sensors are read before sailing on, as boatMain's controlTick sees them
+        sample = _sample(world, event, waypoint) if recorder is not None else None
+        command = sail_for(target, control_period)
+        if recorder is not None:
+            recorder.record(**sample, rudder_cmd=command[0], sail_cmd=command[1], rudder=command[0], sail=command[1])
+
+    result.sim_time = sim.time
+    if recorder is not None:
+        recorder.flush()
+        world.camera.saver.flush()
+    for key, value in world.scorer.result().items():
+        setattr(result, key, value)
+    return result
+
+
+def _sample(world, event, waypoint):
+    """The flight recorder fields boatMain.recordSample() would save this tick (without the commands)"""
+    sim, gps = world.sim, world.gps
+    return dict(time=SimClock().time(), lat=gps.latitude, lon=gps.longitude,
+                target_lat=None if waypoint is None else waypoint.lat, target_lon=None if waypoint is None else waypoint.lon,
+                gps_speed=float(sim.speed[0]), gps_track=gps.track_angle_deg, heading=float(sim.heading[0]),
+                wind_angle=float(sim.relative_wind()[0]), manual=event is None,
+                event_state=event.state_code() if event is not None else -1)
+
+
+def run(scenarios, workers=None, chunksize=4):
+    """Runs scenarios across a process pool
+    Returns:
+        - list[ScenarioResult] in the same order as scenarios
+    """
+    with multiprocessing.get_context("spawn").Pool(workers, initializer=_init_worker) as pool:
+        return pool.map(run_scenario, scenarios, chunksize=chunksize)
+
+
+def summarize(results):
+    """Score distribution, time in box, lap times and failure modes per event"""
+    summary = {}
+    for event in dict.fromkeys(result.event for result in results):
+        runs = [result for result in results if result.event == event]
+        scores = np.array([result.score for result in runs])
+        laps = [result.lap_time for result in runs if result.lap_time is not None]
+        in_box = [result.time_in_box for result in runs if result.time_in_box is not None]
+        summary[event] = {
+            "runs": len(runs),
+            "score_mean": float(scores.mean()),
+            "score_std": float(scores.std()),
+            "score_p10_p50_p90": [float(p) for p in np.percentile(scores, [10, 50, 90])],
+            "time_in_box_mean": float(np.mean(in_box)) if in_box else None,
+            "lap_time_median": float(np.median(laps)) if laps else None,
+            "lap_completion": len(laps) / len(runs),
+            "outcomes": dict(Counter(result.outcome for result in runs).most_common()),
+            "errors": dict(Counter(result.error for result in runs if result.error).most_common(3)),
+        }
+    return summary
+
+
+def print_summary(summary):
+    for event, stats in summary.items():
+        p10, p50, p90 = stats["score_p10_p50_p90"]
+        print(f"{event} ({EVENTS[event][1]}), {stats['runs']} runs")
+        print(f"    score: mean {stats['score_mean']:.2f} +- {stats['score_std']:.2f}, p10 {p10:.1f}, median {p50:.1f}, p90 {p90:.1f}")
+        if stats["time_in_box_mean"] is not None:
+            print(f"    time in box: mean {stats['time_in_box_mean']:.0f}s of 300s")
+        if stats["lap_time_median"] is not None:
+            print(f"    lap time: median {stats['lap_time_median']:.0f}s, completed {stats['lap_completion']:.0%}")
+        print(f"    outcomes: {', '.join(f'{outcome} x{count}' for outcome, count in stats['outcomes'].items())}")
+        for error, count in stats["errors"].items():
+            print(f"        x{count}: {error}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Monte Carlo scoring of the event planners on the simulator")
+    parser.add_argument("--events", nargs="+", choices=list(EVENTS), default=list(EVENTS))
+    parser.add_argument("--runs", type=int, default=100, help="scenarios per event")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None, help="processes, defaults to every core")
+    parser.add_argument("--json", help="also write every result and the summary to this file")
+    parser.add_argument("--record", metavar="DIRECTORY", help="run the first scenario here and record it for replay.py")
+    args = parser.parse_args()
+
+    if args.record:
+        install_sensors()
+        recorder = FlightRecorder(args.record)
+        result = run_scenario(make_scenarios(args.events[0], 1, args.seed)[0], recorder)
+        recorder.close()
+        print(f"Recorded {recorder.records} samples to {args.record}: {result.outcome} after {result.sim_time:.0f}s")
+        sys.exit(0)
+
+    scenarios = [scenario for event in args.events for scenario in make_scenarios(event, args.runs, args.seed)]
+    start = time.perf_counter()
+    results = run(scenarios, args.workers)
+    elapsed = time.perf_counter() - start
+
+    summary = summarize(results)
+    print_summary(summary)
+    print(f"{len(results)} scenarios in {elapsed:.1f}s ({sum(result.sim_time for result in results) / elapsed:.0f}x real time)")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"summary": summary, "results": [asdict(result) for result in results]}, f, indent=2)
@@ -1,13 +1,13 @@
 import logging
 import math
 import time
-import matplotlib.pyplot as plt
 
 
 import sailbot.constants as c
-from sailbot.eventUtils import Event, EventFinished, Waypoint, distance_between, has_reached_waypoint
+from sailbot.eventUtils import Event, EventFinished, Waypoint, distance_between, distances_between, waypoints_to_array, has_reached_waypoint
+from sailbot.boatMath import haversine_array
 from camera import Camera
-from GPS import gps
+from heatmap import Heatmap
 # from sailbot.transceiver import arduino
 
 """
@@ -64,14 +64,15 @@ class Search(Event):
             - Either 'SEARCHING', 'TRACKING', or 'RAMMING' the buoy
     """
 
-    def __init__(self, event_info=[Waypoint(0, 0), 100]):
+    def __init__(self, event_info=[Waypoint(0, 0), 100], gps=None, windvane=None):
         """
         Args:
             event_info (list[Waypoint(center_lat, center_long), radius]): center and radius of search circle
+            gps, windvane: the boat's sensors, see eventUtils.Event
         """
         if len(event_info) != REQUIRED_ARGS:
             raise TypeError(f"Expected {REQUIRED_ARGS} arguments, got {len(event_info)}")
-        super().__init__(event_info)
+        super().__init__(event_info, gps=gps, windvane=windvane)
         logging.info("Search moment")
 
         # EVENT INFO
@@ -88,9 +89,11 @@ class Search(Event):
         self.state = "SEARCHING"
 
         # Used to pool together nearby detections for higher accuracy
-        self.heatmap = Heatmap(chunk_radius=float(c.config["SEARCH"]["heatmap_chunk_radius"]))
+        self.heatmap = Heatmap(chunk_radius=float(c.config["SEARCH"]["heatmap_chunk_radius"]),
+                               half_life=float(c.config["SEARCH"]["heatmap_half_life"]),
+                               evict_below=float(c.config["SEARCH"]["heatmap_evict_confidence"]))
         self.best_chunk = None
-        self.divert_confidence_threshold = float(c.config["SEARCH"]["pooled_heatmap_confidence_threshold"])
+        self.divert_confidence_threshold = float(c.config["SEARCH"]["heatmap_pooled_confidence_threshold"])
 
         # Buffers for buoys that are near the edge of the search radius to account for gps estimation error
         self.search_bounds = self.search_radius + float(c.config["SEARCH"]["search_radius_tolerance"])
@@ -105,8 +108,19 @@ class Search(Event):
 
         # SENSORS
         self.camera = Camera()
-        self.gps = gps()
-        # self.transceiver = arduino(c.config['MAIN']['ardu_port']) TODO: unbug
+        self.transceiver = None  # arduino(c.config['MAIN']['ardu_port']) TODO: unbug
+
+    def position(self):
+        """The boat's latest fix as a Waypoint"""
+        return Waypoint(self.gps.latitude, self.gps.longitude)
+
+    def notify(self, message):
+        if self.transceiver is not None:
+            self.transceiver.send(message)
+
+    def state_code(self):
+        """0 searching, 1 tracking, 2 ramming"""
+        return ("SEARCHING", "TRACKING", "RAMMING").index(self.state)
 
     def next_gps(self):
         """
@@ -119,8 +133,9 @@ class Search(Event):
 
         # Either no buoys found yet or boat is gathering more confidence before diverting course
         if not self.event_started:
-            if has_reached_waypoint(self.search_center, distance=self.search_radius):
+            if has_reached_waypoint(self.gps, self.search_center, distance=self.search_radius):
                 logging.info("Search event started!")
+                self.event_started = True
                 self.start_time = time.time()
                 self.waypoint_queue.pop(0)
                 self.state = "SEARCHING"
@@ -133,39 +148,37 @@ class Search(Event):
 
             # Error check detections & add to heatmap
             detections = 0
-            for frame in imgs:
-                for detection in frame.detections:
-                    distance_from_center = distance_between(self.search_center, detection.gps)
-
-                    if distance_from_center > self.search_bounds:
-                        logging.info(f"SEARCHING: Dropped buoy at: {detection.gps}, {distance_from_center}m from center")
-                        continue
+            found = [detection for frame in imgs for detection in frame.detections]
+            for detection, distance_from_center in zip(found, distances_between(self.search_center, [detection.gps for detection in found])):
+                if distance_from_center > self.search_bounds:
+                    logging.info(f"SEARCHING: Dropped buoy at: {detection.gps}, {distance_from_center}m from center")
+                    continue
 
-                    logging.info(f"SEARCHING: Buoy ({detection.conf}%) found at: {detection.gps}")
-                    self.heatmap.append(detection)
-                    detections += 1
+                logging.info(f"SEARCHING: Buoy ({detection.conf}%) found at: {detection.gps}")
+                self.heatmap.append(detection)
+                detections += 1
 
             if detections == 0:
                 # No detections, continue along preset search path
                 logging.info("SEARCHING: No buoys spotted! Continuing along search path")
-                if has_reached_waypoint(self.waypoint_queue[0], distance=2):
+                if has_reached_waypoint(self.gps, self.waypoint_queue[0], distance=2):
                     self.waypoint_queue.pop(0)
                 return self.waypoint_queue[0]
             else:
                 # Detection! Check if boat is confident enough to move to the buoy
                 self.best_chunk = self.heatmap.get_highest_confidence_chunk()
 
-                if self.best_chunk.sum_confidence > self.divert_confidence_threshold:
+                if self.heatmap.confidence(self.best_chunk) > self.divert_confidence_threshold:
                     logging.info(f"""SEARCHING: This bitch definitely a buoy! 
                             Bookmarking position and moving towards buoy at {self.best_chunk.average_gps}.""")
                     self.state = "TRACKING"
-                    self.waypoint_queue.insert(0, self.gps)
+                    self.waypoint_queue.insert(0, self.position())
                     self.waypoint_queue.insert(0, self.best_chunk.average_gps)
                     return self.waypoint_queue[0]
 
         # A buoy is found and boat is heading towards it
         elif self.state == "TRACKING":
-            distance_to_buoy = distance_between(self.gps, self.waypoint_queue[0])
+            distance_to_buoy = distance_between(self.position(), self.waypoint_queue[0])
 
             if distance_to_buoy < self.ramming_distance:
                 # Boat is near the buoy, TIME TO RAM THAT SHIT
@@ -196,9 +209,8 @@ class Search(Event):
                 else:
                     self.missed_consecutive_detections = 0
 
-                    for detection in frame.detections:
-                        distance_from_center = distance_between(self.search_center, detection.gps)
-
+                    distances = distances_between(self.search_center, [detection.gps for detection in frame.detections])
+                    for detection, distance_from_center in zip(frame.detections, distances):
                         if distance_from_center > self.search_bounds:
                             logging.info(f"TRACKING: Dropped buoy at: {detection.gps}, {distance_from_center}m from center")
                             continue
@@ -213,17 +225,17 @@ class Search(Event):
         # Boat is very close to the buoy
         elif self.state == "RAMMING":
             # TODO: GPS is only so accurate. Use accelerometer instead!
-            distance_to_buoy = distance_between(self.gps, self.waypoint_queue[0])
+            distance_to_buoy = distance_between(self.position(), self.waypoint_queue[0])
 
             if distance_to_buoy < self.collision_sensitivity:
                 logging.info(f"Sailbot touched the buoy! Search event finished!")
-                self.transceiver.send("Sailbot touched the buoy!")
+                self.notify("Sailbot touched the buoy!")
                 raise EventFinished
 
         # Times up... fuck it and assume that we touched the buoy
         if time.time() - self.start_time > self.event_duration:
             logging.info(f"Sailbot totally touched the buoy... Search event finished!")
-            self.transceiver.send("Sailbot touched the buoy!")
+            self.notify("Sailbot touched the buoy!")
             raise EventFinished
 
     def create_search_pattern(self, num_points=None):
@@ -241,7 +253,7 @@ class Search(Event):
         # TODO: Use windvane to determine rotation
 
         if num_points is None:
-            max_detection_distance = c.config["SEARCH"]["max_detection_distance"]
+            max_detection_distance = float(c.config["SEARCH"]["max_detection_distance"])
             num_points = (2 * self.search_radius) / max_detection_distance
 
         if num_points < 2:
@@ -251,93 +263,18 @@ class Search(Event):
 
         d_lat = self.gps.latitude - self.search_center.lat
         d_lon = self.gps.longitude - self.search_center.lon
-        ang = math.atan(d_lon / d_lat)
-        ang *= 180 / math.pi
-
-        if (d_lat < 0): ang += 180
+        ang = math.atan2(d_lon, d_lat) * 180 / math.pi
 
         tar_angs = [ang, ang + 72, ang - 72, ang - (72 * 3), ang - (72 * 2)]
         for i in range(0, 5):
-            pattern.append(
-                Waypoint(lat=self.search_center.lat + self.search_radius * math.cos(tar_angs[i] * (math.pi / 180)),
-                         lon=self.search_center.lon + self.search_radius * math.sin(tar_angs[i] * (math.pi / 180)))
-            )
-
-        total_distance = 0
-        for i in range(len(pattern) - 1):
-            total_distance += distance_between(pattern[i], pattern[i+1])
+            # search_radius is in meters
+            point = Waypoint(self.search_center.lat, self.search_center.lon)
+            point.add_meters(self.search_radius * math.sin(tar_angs[i] * (math.pi / 180)),
+                             self.search_radius * math.cos(tar_angs[i] * (math.pi / 180)))
+            pattern.append(point)
+
+        points = waypoints_to_array(pattern)
+        total_distance = haversine_array(points[:-1], points[1:]).sum()
         logging.info(f"Created {num_points}-point search path. Total distance to cover is {total_distance}m")
 
         return pattern
-
-
-class Heatmap:
-    """Datastructure which splits the search radius into X-meter circular 'chunks'
-        - Each detection has its confidence pooled with all others inside the same chunk
-            - Decrease chunk radius if two separate buoys are being grouped as one
-            - Increase chunk radius if the same buoy is creating multiple chunks (caused by GPS estimation error)
-        - NOTE: Chunks can overlap which may cause problems (if so, then extend code to use tri/square/hex chunks instead of circles)
-
-        Attributes:
-            - chunks (list[HeatmapChunk])
-            - chunk_radius (float)
-    """
-
-    def __init__(self, chunk_radius):
-        self.chunks = []
-        self.chunk_radius = chunk_radius
-
-    def __contains__(self, detection):
-        """
-        Checks if a detection is inside any of the heatmap's chunks' boundary
-            - Invoke using the 'in' keyword ex. 'if detection in heatmap'
-        """
-        for chunk in self.chunks:
-            if detection in chunk:
-                return True
-        return False
-
-    def append(self, detection):
-        for chunk in self.chunks:
-            if detection in chunk:
-                chunk.append(detection)
-        else:
-            self.chunks.append(HeatmapChunk(radius=self.chunk_radius,
-                                            detection=detection))
-
-    def get_highest_confidence_chunk(self):
-        return max(self.chunks, key=lambda heatmap_chunk: heatmap_chunk.sum_confidence)
-
-
-class HeatmapChunk:
-    """
-    A circular boundary which combines nearby detections for better accuracy
-        - Detections within the chunk's radius are assumed to be from the same buoy and averaged
-
-    Attributes:
-        - radius (float): the radial size of the chunk
-        - average_gps (Waypoint): the average point between all detections within a chunk
-        - detection_count (int): the number of detections within a chunk
-        - sum_confidence (float): the combined total of all detections within the chunk
-    """
-
-    def __init__(self, radius, detection):
-        self.radius = radius
-        self.average_gps = detection.gps
-        self.detection_count = 1
-        self.sum_confidence = detection.conf
-
-        self._sum_lat = detection.gps.latitude
-        self._sum_lon = detection.gps.longitude
-
-    def __contains__(self, detection):
-        return distance_between(self.average_gps, detection.gps) <= self.radius
-
-    def append(self, detection):
-        self.detection_count += 1
-
-        self._sum_lat += detection.gps.latitude
-        self._sum_lon += detection.gps.longitude
-        self.average_gps = Waypoint(self._sum_lat / self.detection_count, self._sum_lon / self.detection_count)
-
-        self.sum_confidence += detection.conf
@@ -0,0 +1,207 @@
+"""
+Typed settings from config.ini, parsed and validated once instead of on every use
+    - Settings holds the values read on the control path (rudder/sail limits, dead zones, thresholds) already
+      converted to numbers, each field names its config.ini section and key and the range it has to be in
+    - Every field is checked when the file is loaded: a missing key, a value that isn't a number or one out of range
+      raises SettingsError listing all of them, so a typo fails at startup instead of in the middle of an event
+    - reload() re-reads config.ini if it changed on disk and swaps in a new Settings object, watch() does that from a
+      background thread. A file with bad values is logged and ignored, the previous settings stay in use
+    - on_change(callback) runs callback(old, new) after every successful reload
+    - constants.config is still the raw parser for values read once at startup, it is refreshed on reload too
+
+Usage:
+    import settings
+    margin = settings.current().angle_margin
+"""
+import configparser
+import logging
+import os
+import threading
+from dataclasses import dataclass, field, fields
+
+try:
+    import constants as c
+except ImportError:
+    import sailbot.constants as c
+
+
+class SettingsError(ValueError):
+    pass
+
+
+def _setting(section, key, low=None, high=None):
+    return field(metadata={"section": section, "key": key, "low": low, "high": high})
+
+
+@dataclass(slots=True, frozen=True)
+class Settings:
+    """
+    Attributes:
+        - no_go_angle (float): degrees either side of the wind the boat can't sail
+        - rudder_angle_min, rudder_angle_max (float): rudder range in degrees
+        - sail_angle_min, sail_angle_max (float): sail range in degrees
+        - rudder_dead_zone (float): degrees around the centre of the RC rudder stick that count as centred
+        - angle_margin (float): degrees from a target heading counted as facing it
+        - reached_gps_threshold (float): meters from a goToGPS target counted as reached
+        - reached_waypoint_distance (float): meters from an event waypoint counted as reached
+        - sail_deadband, rudder_deadband, max_command_rate, keepalive_interval (float): actuator command filtering
+        - odrive_sail_rotations, odrive_rudder_rotations (float): motor rotations over the full sail/rudder range
+        - wind_speed (float): true wind speed assumed by the polar in m/s
+        - tack_margin (float): VMG advantage needed to switch tack
+    """
+    no_go_angle: float = _setting("MAIN", "no_go_angle", 0, 180)
+    rudder_angle_min: float = _setting("CONSTANTS", "rudder_angle_min", -90, 0)
+    rudder_angle_max: float = _setting("CONSTANTS", "rudder_angle_max", 0, 90)
+    sail_angle_min: float = _setting("CONSTANTS", "sail_angle_min", 0, 90)
+    sail_angle_max: float = _setting("CONSTANTS", "sail_angle_max", 0, 90)
+    rudder_dead_zone: float = _setting("CONSTANTS", "controllerRudderDeadZoneDegs", 0, 90)
+    angle_margin: float = _setting("CONSTANTS", "angle_margin_of_error", 0, 180)
+    reached_gps_threshold: float = _setting("CONSTANTS", "reachedGPSThreshhold", 0)
+    reached_waypoint_distance: float = _setting("CONSTANTS", "reached_waypoint_distance", 0)
+    sail_deadband: float = _setting("ACTUATORS", "sail_deadband", 0)
+    rudder_deadband: float = _setting("ACTUATORS", "rudder_deadband", 0)
+    max_command_rate: float = _setting("ACTUATORS", "max_command_rate", 0)
+    keepalive_interval: float = _setting("ACTUATORS", "keepalive_interval", 0)
+    odrive_sail_rotations: float = _setting("ODRIVE", "odriveSailRotations", 0)
+    odrive_rudder_rotations: float = _setting("ODRIVE", "odriveRudderRotations", 0)
+    wind_speed: float = _setting("POLAR", "wind_speed", 0)
+    tack_margin: float = _setting("POLAR", "tack_margin", 0, 1)
+
+    @property
+    def rudder_mid_point(self):
+        """Centre of the RC rudder range, RC commands are 0-90 instead of -45-45"""
+        return (self.rudder_angle_max - self.rudder_angle_min) / 2
+
+    @classmethod
+    def from_config(cls, config):
+        """Reads and checks every field
+        Args:
+            - config (configparser.ConfigParser)
+        Raises:
+            - SettingsError listing every missing or invalid value
+        """
+        values, errors = {}, []
+        for setting in fields(cls):
+            section, key = setting.metadata["section"], setting.metadata["key"]
+            low, high = setting.metadata["low"], setting.metadata["high"]
+            raw = config.get(section, key, fallback=None)
+            if raw is None:
+                errors.append(f"[{section}] {key} is missing")
+                continue
+            try:
+                value = setting.type(raw.split("#")[0].strip())
+            except ValueError:
+                errors.append(f"[{section}] {key} = {raw!r} is not a {setting.type.__name__}")
+                continue
+            if (low is not None and value < low) or (high is not None and value > high):
+                errors.append(f"[{section}] {key} = {value} is outside {low} to {high}")
+                continue
+            values[setting.name] = value
+
+        if not errors:
+            if values["rudder_angle_min"] >= values["rudder_angle_max"]:
+                errors.append("[CONSTANTS] rudder_angle_min has to be below rudder_angle_max")
+            if values["sail_angle_min"] >= values["sail_angle_max"]:
+                errors.append("[CONSTANTS] sail_angle_min has to be below sail_angle_max")
+        if errors:
+            raise SettingsError("Invalid config.ini: " + "; ".join(errors))
+        return cls(**values)
+
+
+class SettingsFile:
+    """
+    A config file and the Settings loaded from it
+
+    Attributes:
+        - path (str)
+        - current (Settings): replaced as a whole on reload, so a reader never sees half old and half new values
+        - config (configparser.ConfigParser): updated in place with the reloaded file
+
+    Functions:
+        - reload() - re-reads the file if it changed, returns True if new settings were loaded
+        - watch() / stop() - reload from a background thread
+        - on_change() - register callback(old, new)
+    """
+    def __init__(self, path, config=None):
+        self.path = path
+        self.config = configparser.ConfigParser() if config is None else config
+        self._callbacks = []
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._mtime = os.stat(path).st_mtime_ns
+        self.current = self._load()
+
+    def _load(self):
+        parser = configparser.ConfigParser()
+        parser.read(self.path)
+        loaded = Settings.from_config(parser)
+        self.config.read_dict(parser)
+        return loaded
+
+    def on_change(self, callback):
+        self._callbacks.append(callback)
+
+    def reload(self):
+        with self._lock:
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except OSError as e:
+                logging.error(f"Keeping previous settings: {e}")
+                return False
+            if mtime == self._mtime:
+                return False
+            # a broken file is only reported once, until it is saved again
+            self._mtime = mtime
+            try:
+                loaded = self._load()
+            except (configparser.Error, SettingsError) as e:
+                logging.error(f"Keeping previous settings: {e}")
+                return False
+            old, self.current = self.current, loaded
+
+        if old != loaded:
+            changed = [f"{s.name}={getattr(loaded, s.name)}" for s in fields(Settings)
+                       if getattr(old, s.name) != getattr(loaded, s.name)]
+            logging.info(f"Reloaded {self.path}: {', '.join(changed)}")
+            for callback in self._callbacks:
+                try:
+                    callback(old, loaded)
+                except Exception as e:
+                    logging.error(f"Settings change callback {callback} failed: {e}")
+        return True
+
+    def watch(self, interval=1.0):
+        """Checks the file every 'interval' seconds on a daemon thread, does nothing if interval is 0"""
+        if interval <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch_loop, args=(interval,), name="SettingsWatch", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    def _watch_loop(self, interval):
+        while not self._stop.wait(interval):
+            self.reload()
+
+
+# loaded on import so bad values stop the boat from starting
+default = SettingsFile(c.prefix + "config.ini", c.config)
+
+
+def current():
+    """The Settings in use, look this up each time instead of keeping it so reloads take effect"""
+    return default.current
+
+
+def on_change(callback):
+    default.on_change(callback)
+
+
+def watch(interval=float(c.config["MAIN"]["settings_reload_interval"])):
+    default.watch(interval)
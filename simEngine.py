@@ -0,0 +1,227 @@
+"""
+Headless boat simulation that runs many boats at once as numpy arrays, much faster than real time
+    - Fixed timestep integrator, no drawing and no sleeping (boatSim.py draws a single boat with pygame on top of it)
+    - Boat speed comes from a polar: speed(true wind angle, true wind speed), trimmed by how close the sail is to optimal
+      (polar.csv unless another one is given)
+    - Wind (direction it blows FROM, speed, random gusts/shifts) and current can be set per boat
+    - Positions are meters east/north of an origin Waypoint (geodesy.LocalFrame), lat/lon is available for event code
+    - Angles follow the boat: headings are compass degrees, rudder and sail are the values sent to the drivers
+        - rudder (-45 to 45): positive turns the boat counterclockwise (same as boatMain.turnToAngle and boatSim)
+        - sail (0 to 90): trim angle, the best trim is about half of the wind angle
+
+Run `python3 simEngine.py` to benchmark how many boat steps per second this machine can simulate
+"""
+import math
+from dataclasses import dataclass
+
+import numpy as np
+
+try:
+    import constants as c
+    from eventUtils import Waypoint
+    from geodesy import LocalFrame, METERS_PER_DEGREE
+    from polar import Polar
+except ImportError:
+    import sailbot.constants as c
+    from sailbot.eventUtils import Waypoint
+    from sailbot.geodesy import LocalFrame, METERS_PER_DEGREE
+    from sailbot.polar import Polar
+
+def wrap180(angle):
+    """Wraps degrees into (-180, 180]"""
+    return 180 - (180 - np.asarray(angle)) % 360
+
+
+@dataclass(slots=True)
+class SimConfig:
+    """
+    Physical constants of the simulated boat and environment, defaults come from [SIMULATION] in config.ini
+
+    Attributes:
+        - dt (float): seconds per step
+        - wind_speed (float): true wind speed in m/s
+        - wind_direction (float): compass direction the wind blows FROM
+        - gust_std (float): standard deviation of the wind speed random walk in m/s per sqrt(second)
+        - shift_std (float): standard deviation of the wind direction random walk in degrees per sqrt(second)
+        - current (tuple): water current (east, north) in m/s
+        - speed_time_constant (float): seconds for the boat to reach ~63% of a new target speed
+        - turn_rate (float): degrees/second of turn per m/s of boat speed at full (45 degree) rudder
+        - min_steerage (float): speed (m/s) the rudder acts as if the boat always has, so a stopped boat can still turn slowly
+        - sail_tolerance (float): degrees of mistrim at which the sail stops producing drive
+    """
+    dt: float = float(c.config["SIMULATION"]["dt"])
+    wind_speed: float = float(c.config["SIMULATION"]["wind_speed"])
+    wind_direction: float = float(c.config["SIMULATION"]["wind_direction"])
+    gust_std: float = float(c.config["SIMULATION"]["gust_std"])
+    shift_std: float = float(c.config["SIMULATION"]["shift_std"])
+    current: tuple = (float(c.config["SIMULATION"]["current_east"]), float(c.config["SIMULATION"]["current_north"]))
+    speed_time_constant: float = 3.0
+    turn_rate: float = 15.0
+    min_steerage: float = 0.3
+    sail_tolerance: float = 30.0
+
+
+class Simulation:
+    """
+    A fleet of independent boats stepped together, every attribute is a numpy array with one value per boat
+
+    Attributes:
+        - x, y (np.ndarray): meters east/north of the origin
+        - heading (np.ndarray): compass heading
+        - speed (np.ndarray): speed through the water in m/s
+        - rudder, sail (np.ndarray): the current control inputs
+        - wind_speed, wind_direction (np.ndarray): the true wind at each boat
+        - current (np.ndarray): N x 2 water current (east, north) in m/s
+        - time (float): simulated seconds since the start
+        - frame (geodesy.LocalFrame): converts positions to lat/lon
+
+    Functions:
+        - step() - advance every boat by one timestep
+        - run() - step with a controller for a number of simulated seconds
+        - relative_wind() - wind angle relative to the bow, like windvane.angle
+        - latitude / longitude - positions as GPS coordinates
+    """
+
+    def __init__(self, count=1, origin=Waypoint(0, 0), config=None, polar=None, heading=0.0, seed=None):
+        """
+        Args:
+            - count (int): number of boats
+            - origin (Waypoint): the lat/lon of x = y = 0
+            - config (SimConfig): physical constants, defaults to config.ini
+            - polar (callable): speed(true wind angle, true wind speed) in m/s, takes numpy arrays, defaults to
+              polar.Polar.load()
+            - heading (float or np.ndarray): starting heading of every boat
+            - seed (int): seed for the wind random walk
+        """
+        self.count = count
+        self.config = SimConfig() if config is None else config
+        self.polar = Polar.load() if polar is None else polar
+        self.frame = LocalFrame(origin)
+        self.rng = np.random.default_rng(seed)
+        self.time = 0.0
+
+        self.x = np.zeros(count)
+        self.y = np.zeros(count)
+        self.heading = np.broadcast_to(np.asarray(heading, dtype=float), (count,)).copy()
+        self.speed = np.zeros(count)
+        self.rudder = np.zeros(count)
+        self.sail = np.zeros(count)
+
+        self.wind_speed = np.full(count, self.config.wind_speed)
+        self.wind_direction = np.full(count, self.config.wind_direction)
+        self.current = np.tile(np.asarray(self.config.current, dtype=float), (count, 1))
+
+    # ---------------------------------- STATE ----------------------------------
+
+    @property
+    def latitude(self):
+        return self.frame.origin.lat + self.y / METERS_PER_DEGREE
+
+    @property
+    def longitude(self):
+        return self.frame.origin.lon + self.x / (METERS_PER_DEGREE * math.cos(math.radians(self.frame.origin.lat)))
+
+    def set_position(self, waypoints):
+        """Moves boats to Waypoints (a single one for every boat, or one per boat)"""
+        if isinstance(waypoints, Waypoint):
+            waypoints = [waypoints] * self.count
+        points = np.array([self.frame.to_enu(waypoint) for waypoint in waypoints])
+        self.x[:], self.y[:] = points[:, 0], points[:, 1]
+
+    def waypoint(self, i=0):
+        return self.frame.to_waypoint((self.x[i], self.y[i]))
+
+    def relative_wind(self):
+        """Angle of the wind relative to the bow (0-360), what the windvane reads"""
+        return (self.wind_direction - self.heading) % 360
+
+    def true_wind_angle(self):
+        """Angle between the bow and the wind (0-180), 0 is head to wind"""
+        return np.abs(wrap180(self.wind_direction - self.heading))
+
+    @staticmethod
+    def optimal_sail(true_wind_angle):
+        """The sail trim that gives the most drive at a wind angle (same rule as boatSim)"""
+        return np.clip(true_wind_angle / 2, 3, 90)
+
+    # ---------------------------------- PHYSICS ----------------------------------
+
+    def step(self, rudder=None, sail=None):
+        """Advances every boat by one timestep
+        Args:
+            - rudder, sail (float or np.ndarray): new control inputs, None keeps the current ones
+        """
+        cfg = self.config
+        dt = cfg.dt
+        if rudder is not None:
+            self.rudder[:] = np.clip(rudder, -45, 45)
+        if sail is not None:
+            self.sail[:] = np.clip(sail, 0, 90)
+
+        if cfg.gust_std:
+            self.wind_speed += self.rng.normal(0, cfg.gust_std * math.sqrt(dt), self.count)
+            np.maximum(self.wind_speed, 0, out=self.wind_speed)
+        if cfg.shift_std:
+            self.wind_direction += self.rng.normal(0, cfg.shift_std * math.sqrt(dt), self.count)
+
+        # Drive: polar speed for this wind angle, reduced the further the sail is from its best trim
+        twa = self.true_wind_angle()
+        trim = np.maximum(1 - np.abs(self.sail - self.optimal_sail(twa)) / cfg.sail_tolerance, 0)
+        target_speed = self.polar(twa, self.wind_speed) * trim
+        self.speed += (target_speed - self.speed) * (1 - math.exp(-dt / cfg.speed_time_constant))
+
+        # Steering: turn rate grows with speed through the water
+        steerage = np.maximum(self.speed, cfg.min_steerage)
+        self.heading = (self.heading - cfg.turn_rate * steerage * (self.rudder / 45) * dt) % 360
+
+        heading = np.radians(self.heading)
+        self.x += (self.speed * np.sin(heading) + self.current[:, 0]) * dt
+        self.y += (self.speed * np.cos(heading) + self.current[:, 1]) * dt
+        self.time += dt
+
+    def run(self, controller, duration):
+        """Steps the fleet for 'duration' simulated seconds
+        Args:
+            - controller (callable): controller(sim) -> (rudder, sail), called before every step
+        """
+        for _ in range(int(round(duration / self.config.dt))):
+            rudder, sail = controller(self)
+            self.step(rudder, sail)
+
+
+def steer_to(sim, target_x, target_y, no_go=45, gain=3.0, polar=None):
+    """
+    Simple vectorized autopilot for testing: points every boat at its target, sailing the edge of the no-go zone
+    when the target is upwind (no tacking logic), with the sail at its best trim
+    Args:
+        - polar (polar.Polar): steer the best VMG heading and sail trim from this polar instead, like boatMain.goToGPS
+    Returns:
+        - (rudder, sail) arrays for Simulation.step()
+    """
+    bearing = np.degrees(np.arctan2(target_x - sim.x, target_y - sim.y))
+    if polar is not None:
+        course, _ = polar.vmg_heading(bearing, sim.wind_direction, sim.wind_speed, heading=sim.heading)
+        sail = polar.sail_angle(sim.true_wind_angle())
+    else:
+        # keep the course at least 'no_go' degrees off the wind
+        off_wind = wrap180(bearing - sim.wind_direction)
+        course = np.where(np.abs(off_wind) < no_go, sim.wind_direction + np.where(off_wind >= 0, no_go, -no_go), bearing)
+        sail = sim.optimal_sail(sim.true_wind_angle())
+
+    error = wrap180(course - sim.heading)
+    rudder = np.clip(-gain * error, -45, 45)
+    return rudder, sail
+
+
+if __name__ == "__main__":
+    import time
+
+    for boats in (1, 1000, 10000):
+        sim = Simulation(boats, config=SimConfig(dt=0.1, gust_std=0.2, shift_std=2.0), heading=np.linspace(0, 360, boats), seed=0)
+        target_x, target_y = np.full(boats, 200.0), np.full(boats, 100.0)
+        steps = 600  # one simulated minute
+        start = time.perf_counter()
+        sim.run(lambda s: steer_to(s, target_x, target_y), duration=steps * sim.config.dt)
+        elapsed = time.perf_counter() - start
+        print(f"{boats:>6} boats: {steps * boats / elapsed / 1e6:6.2f}M boat-steps/s, "
+              f"{sim.time / elapsed:10.0f}x real time, mean distance to target {np.hypot(target_x - sim.x, target_y - sim.y).mean():.0f}m")
@@ -0,0 +1,234 @@
+"""
+Extended Kalman filter fusing GPS, compass, accelerometer and the commanded rudder into one boat state
+    - State: position (meters east/north of the first fix), speed, heading and turn rate, with a covariance
+    - Between measurements the state is predicted forward with a simple boat model:
+        - the boat moves along its heading, the forward accelerometer changes its speed
+        - the turn rate settles towards what the commanded rudder gives at the current speed
+          (positive rudder turns counterclockwise, like boatMain.turnToAngle)
+    - So controllers can ask for the state at any time (20-50 Hz) instead of waiting for the next 1 Hz GPS fix
+    - Measurements with an older stamp than the state are applied at the current time (at most one control period late)
+    - estimatorNode.py runs this as a ROS node
+"""
+import math
+from dataclasses import dataclass
+
+import numpy as np
+
+try:
+    import constants as c
+    from eventUtils import Waypoint
+    from geodesy import LocalFrame
+except ImportError:
+    import sailbot.constants as c
+    from sailbot.eventUtils import Waypoint
+    from sailbot.geodesy import LocalFrame
+
+# state vector indices
+X, Y, SPEED, HEADING, TURN = range(5)
+
+
+def wrap_pi(angle):
+    return (angle + math.pi) % (2 * math.pi) - math.pi
+
+
+@dataclass(slots=True)
+class BoatState:
+    """
+    The estimate at one instant
+
+    Attributes:
+        - stamp (float): time of the estimate in seconds
+        - latitude, longitude (float)
+        - x, y (float): meters east/north of the estimator's origin
+        - speed (float): m/s along the heading
+        - heading (float): compass degrees
+        - turn_rate (float): degrees/second, positive is clockwise like the compass
+        - covariance (np.ndarray): 5x5 covariance of (x, y, speed, heading rad, turn rate rad/s)
+    """
+    stamp: float
+    latitude: float
+    longitude: float
+    x: float
+    y: float
+    speed: float
+    heading: float
+    turn_rate: float
+    covariance: np.ndarray
+
+    @property
+    def position_std(self):
+        """1 sigma position error in meters (worst direction)"""
+        return math.sqrt(max(np.linalg.eigvalsh(self.covariance[:2, :2])))
+
+    @property
+    def heading_std(self):
+        return math.degrees(math.sqrt(self.covariance[HEADING, HEADING]))
+
+
+class BoatEKF:
+    """
+    Attributes:
+        - x (np.ndarray): state (x, y, speed, heading rad, turn rate rad/s)
+        - P (np.ndarray): state covariance
+        - time (float): stamp of the state, None until the first GPS fix
+        - frame (geodesy.LocalFrame): anchored at the first GPS fix
+        - rudder (float): last commanded rudder angle
+        - acceleration (float): last forward acceleration in m/s^2
+
+    Functions:
+        - predict() - moves the state forward to a time
+        - update_gps() / update_gps_velocity() / update_compass() - fuse a measurement
+        - state() - the BoatState predicted to a time
+    """
+
+    def __init__(self, gps_std=float(c.config["ESTIMATOR"]["gps_std"]),
+                 gps_speed_std=float(c.config["ESTIMATOR"]["gps_speed_std"]),
+                 compass_std=float(c.config["ESTIMATOR"]["compass_std"]),
+                 accel_std=float(c.config["ESTIMATOR"]["accel_std"]),
+                 turn_std=float(c.config["ESTIMATOR"]["turn_std"]),
+                 rudder_turn_rate=float(c.config["ESTIMATOR"]["rudder_turn_rate"]),
+                 rudder_time_constant=float(c.config["ESTIMATOR"]["rudder_time_constant"])):
+        """
+        Args:
+            - gps_std (float): meters, used when a fix doesn't come with its own accuracy
+            - gps_speed_std (float): m/s error of the GPS ground velocity
+            - compass_std (float): degrees
+            - accel_std (float): m/s^2 of unmodelled acceleration (process noise on speed)
+            - turn_std (float): degrees/s^2 of unmodelled turn acceleration (process noise on turn rate)
+            - rudder_turn_rate (float): degrees/second of turn per m/s of speed at full (45 degree) rudder
+            - rudder_time_constant (float): seconds for the turn rate to follow the rudder
+        """
+        self.gps_std = gps_std
+        self.gps_speed_std = gps_speed_std
+        self.compass_var = math.radians(compass_std) ** 2
+        self.accel_var = accel_std ** 2
+        self.turn_var = math.radians(turn_std) ** 2
+        self.rudder_gain = math.radians(rudder_turn_rate) / 45
+        self.rudder_time_constant = rudder_time_constant
+
+        self.x = np.zeros(5)
+        self.P = np.diag([1e4, 1e4, 4.0, math.pi ** 2, 0.25])
+        self.time = None
+        self.frame = None
+        self.rudder = 0.0
+        self.acceleration = 0.0
+        self._heading_known = False
+
+    @property
+    def initialized(self):
+        return self.time is not None
+
+    # ---------------------------------- MODEL ----------------------------------
+
+    def predict(self, t):
+        """Moves the state forward to time t, does nothing if t isn't newer than the state"""
+        if self.time is None or t <= self.time:
+            return
+        dt = t - self.time
+        self.time = t
+        x, y, v, psi, r = self.x
+        sin, cos = math.sin(psi), math.cos(psi)
+        alpha = 1 - math.exp(-dt / self.rudder_time_constant)
+        rudder = -self.rudder_gain * self.rudder
+
+        self.x = np.array([x + v * sin * dt,
+                           y + v * cos * dt,
+                           v + self.acceleration * dt,
+                           wrap_pi(psi + r * dt),
+                           r + (rudder * v - r) * alpha])
+
+        F = np.eye(5)
+        F[X, SPEED], F[X, HEADING] = sin * dt, v * cos * dt
+        F[Y, SPEED], F[Y, HEADING] = cos * dt, -v * sin * dt
+        F[HEADING, TURN] = dt
+        F[TURN, SPEED], F[TURN, TURN] = rudder * alpha, 1 - alpha
+        Q = np.diag([0.01 * dt, 0.01 * dt, self.accel_var * dt, 1e-4 * dt, self.turn_var * dt])
+        self.P = F @ self.P @ F.T + Q
+
+    def _update(self, z, h, H, R, angle=None):
+        """Standard EKF update, 'angle' is the index of a measurement whose innovation wraps at +-pi"""
+        innovation = z - h
+        if angle is not None:
+            innovation[angle] = wrap_pi(innovation[angle])
+        S = H @ self.P @ H.T + R
+        K = self.P @ H.T @ np.linalg.inv(S)
+        self.x = self.x + K @ innovation
+        self.x[HEADING] = wrap_pi(self.x[HEADING])
+        # Joseph form keeps P symmetric and positive
+        I_KH = np.eye(5) - K @ H
+        self.P = I_KH @ self.P @ I_KH.T + K @ R @ K.T
+        return innovation
+
+    # ---------------------------------- MEASUREMENTS ----------------------------------
+
+    def update_gps(self, lat, lon, t, std=None):
+        """Fuses a GPS fix, the first fix sets the origin and starts the filter
+        Args:
+            - std (float): 1 sigma accuracy in meters of this fix, defaults to gps_std
+        """
+        if lat is None or lon is None:
+            return
+        if self.frame is None:
+            self.frame = LocalFrame(Waypoint(lat, lon))
+            self.time = t
+        self.predict(t)
+        variance = (self.gps_std if std is None else std) ** 2
+        H = np.zeros((2, 5))
+        H[0, X] = H[1, Y] = 1
+        self._update(np.array(self.frame.latlon_to_enu(lat, lon)), self.x[:2], H, np.eye(2) * variance)
+
+    def update_gps_velocity(self, speed, track, t):
+        """Fuses the GPS ground speed and track (compass degrees)"""
+        if speed is None or track is None or not self.initialized:
+            return
+        self.predict(t)
+        track = math.radians(track)
+        z = np.array([speed * math.sin(track), speed * math.cos(track)])
+        v, psi = self.x[SPEED], self.x[HEADING]
+        h = np.array([v * math.sin(psi), v * math.cos(psi)])
+        H = np.zeros((2, 5))
+        H[0, SPEED], H[0, HEADING] = math.sin(psi), v * math.cos(psi)
+        H[1, SPEED], H[1, HEADING] = math.cos(psi), -v * math.sin(psi)
+        self._update(z, h, H, np.eye(2) * self.gps_speed_std ** 2)
+
+    def update_compass(self, heading, t):
+        """Fuses a compass heading in degrees"""
+        if heading is None:
+            return
+        heading = wrap_pi(math.radians(heading))
+        if not self._heading_known:
+            # start from the first reading instead of letting a +-180 degree prior swing the filter
+            self._heading_known = True
+            self.x[HEADING] = heading
+            self.P[HEADING, HEADING] = self.compass_var
+            return
+        if not self.initialized:
+            return
+        self.predict(t)
+        H = np.zeros((1, 5))
+        H[0, HEADING] = 1
+        self._update(np.array([heading]), self.x[HEADING:HEADING + 1], H, np.array([[self.compass_var]]), angle=0)
+
+    def set_rudder(self, angle):
+        self.rudder = float(angle)
+
+    def set_acceleration(self, forward):
+        """Forward acceleration in m/s^2 from the accelerometer, None if it isn't available"""
+        self.acceleration = 0.0 if forward is None else float(forward)
+
+    # ---------------------------------- OUTPUT ----------------------------------
+
+    def state(self, t=None):
+        """
+        Returns:
+            - BoatState predicted to time t (the latest measurement time if None), None before the first GPS fix
+        """
+        if not self.initialized:
+            return None
+        if t is not None:
+            self.predict(t)
+        waypoint = self.frame.to_waypoint(self.x[:2])
+        return BoatState(stamp=self.time, latitude=waypoint.lat, longitude=waypoint.lon,
+                         x=float(self.x[X]), y=float(self.x[Y]), speed=float(self.x[SPEED]),
+                         heading=math.degrees(self.x[HEADING]) % 360, turn_rate=math.degrees(self.x[TURN]),
+                         covariance=self.P.copy())
@@ -70,6 +70,13 @@
 // Singleton instance of the radio driver
 RH_RF95 rf95(RFM95_CS, RFM95_INT);
 
+// Binary telemetry frames from the Pi (see telemetryFrame.py) are forwarded over the radio whole
+#define FRAME_SYNC1 0xA5
+#define FRAME_SYNC2 0x5A
+#define FRAME_HEADER_LEN 5  // sync(2) version(1) type(1) payload length(1)
+#define FRAME_CRC_LEN 2
+#define FRAME_MAX_LEN 64
+
 int rudderVal = 0;
 int sailVal = 0;
 
@@ -87,6 +94,7 @@ void setup()
   while (!Serial) {
     delay(1);
   }
+  Serial.setTimeout(20); // max wait for the rest of a telemetry frame
  
   delay(100);
  
@@ -129,10 +137,15 @@ void loop()
   delay(10); // Wait 1 second between transmits, could also 'sleep' here!
   //Serial.println("Transmitting..."); // Send a message to rf95_server  
   
+  if (Serial.available() && Serial.peek() == FRAME_SYNC1){
+    forwardFrame();
+  }
+
   char radiopacket[20] = "";
   bool msg = false;  
   int availableBytes = Serial.available();
-  for(int i=0; i<availableBytes && i<20; i++)
+  // stop at the start of a telemetry frame so it gets forwarded whole on the next loop
+  for(int i=0; i<availableBytes && i<20 && Serial.peek() != FRAME_SYNC1; i++)
   {
      radiopacket[i] = Serial.read();
      msg = true;
@@ -221,10 +234,27 @@ void returnData(){
   Serial.print("R "); Serial.print(readRudderVal);
   Serial.print(" S "); Serial.print(readSailVal);
   Serial.print(" RO "); Serial.print(readRudderOffsetVal);
-  Serial.print(" SO "); Serial.print(readSailOffsetVal);
+  Serial.print(" SO "); Serial.println(readSailOffsetVal); // newline lets the Pi's reader thread return without waiting for a timeout
 
   // Serial.print("R "); Serial.print(rudderVal);
   // Serial.print(" S "); Serial.println(sailVal);
   Serial.flush();
   
 }
+
+void forwardFrame(){
+  uint8_t frame[FRAME_MAX_LEN];
+  // the header says how many more bytes belong to the frame
+  if (Serial.readBytes(frame, FRAME_HEADER_LEN) != FRAME_HEADER_LEN || frame[1] != FRAME_SYNC2){
+    return; // not a frame, drop it
+  }
+  int frameLen = FRAME_HEADER_LEN + frame[4] + FRAME_CRC_LEN;
+  if (frameLen > FRAME_MAX_LEN){
+    return;
+  }
+  if (Serial.readBytes(frame + FRAME_HEADER_LEN, frameLen - FRAME_HEADER_LEN) != frameLen - FRAME_HEADER_LEN){
+    return; // incomplete frame
+  }
+  rf95.send(frame, frameLen);
+  rf95.waitPacketSent();
+}
@@ -74,6 +74,10 @@
 // Singleton instance of the radio driver
 RH_RF95 rf95(RFM95_CS, RFM95_INT);
 
+// Start of a binary telemetry frame sent by the boat (see telemetryFrame.py)
+#define FRAME_SYNC1 0xA5
+#define FRAME_SYNC2 0x5A
+
 LiquidCrystal_I2C lcd(0x27,16,2);
 int rudder_val = 0;
 int read_rudder_val = 999;
@@ -217,7 +221,10 @@ void loop()
    {
       //Serial.print("Got reply: ");
       //Serial.println((char*)buf);
-      if (buf[0] == 'R'){  
+      if (len >= 2 && buf[0] == FRAME_SYNC1 && buf[1] == FRAME_SYNC2){
+        Serial.write(buf, len); // binary telemetry frame, the GUI decodes it with telemetryFrame.py
+      }
+      else if (buf[0] == 'R'){  
         read_rudder_val = (buf[1] - 48)*10 + (buf[2] - 48);
         update_lcd_rudder();
       }
@@ -0,0 +1,194 @@
+"""
+Compact binary telemetry frames sent from the boat to the shore GUI over the LoRa transceivers
+
+Frame layout (little endian):
+    - 2 bytes   sync word 0xA5 0x5A
+    - 1 byte    protocol version
+    - 1 byte    frame type
+    - 1 byte    payload length N
+    - N bytes   payload
+    - 2 bytes   CRC-16/CCITT-FALSE of everything between the sync word and the CRC
+
+DATA payload (20 bytes), missing values (None, NaN) are sent as the field's sentinel, values outside a field's range
+are clamped to it:
+    - lat, lon      int32   degrees * 1e7           (sentinel -2^31)
+    - rudder, sail  int16   degrees * 10            (sentinel -2^15)
+    - heading       uint16  degrees * 10            (sentinel 0xFFFF)
+    - wind_speed    uint16  m/s * 100               (sentinel 0xFFFF)
+    - wind_dir      uint16  degrees * 10            (sentinel 0xFFFF)
+    - battery       uint16  volts * 1000            (sentinel 0xFFFF)
+
+The Arduino sketches in telemetry/Transciever only look at the sync word and length to forward whole frames.
+NOTE: keep this file free of boat-only imports, the GUI imports it too
+"""
+import math
+import struct
+from dataclasses import dataclass
+
+SYNC = b"\xA5\x5A"
+VERSION = 1
+TYPE_DATA = 0x01
+
+_HEADER = struct.Struct("<2sBBB")
+_CRC = struct.Struct("<H")
+_DATA = struct.Struct("<iihhHHHH")
+MAX_PAYLOAD = 200   # RH_RF95_MAX_MESSAGE_LEN is 251 bytes
+# Expected payload length of each frame type, a header that doesn't match is treated as noise
+PAYLOAD_SIZES = {TYPE_DATA: _DATA.size}
+
+# (scale, sentinel) for each DATA field in payload order
+_DATA_FIELDS = (("lat", 1e7, -2 ** 31),
+                ("lon", 1e7, -2 ** 31),
+                ("rudder", 10, -2 ** 15),
+                ("sail", 10, -2 ** 15),
+                ("heading", 10, 0xFFFF),
+                ("wind_speed", 100, 0xFFFF),
+                ("wind_dir", 10, 0xFFFF),
+                ("battery", 1000, 0xFFFF))
+# Range of each struct type, leaving out the value used as the sentinel
+_LIMITS = {"i": (-2 ** 31 + 1, 2 ** 31 - 1), "h": (-2 ** 15 + 1, 2 ** 15 - 1), "H": (0, 0xFFFE)}
+_DATA_LIMITS = tuple(_LIMITS[kind] for kind in _DATA.format.lstrip("<"))
+
+
+@dataclass(slots=True)
+class TelemetryData:
+    """
+    One telemetry sample from the boat, any value may be None if the boat doesn't have it
+    """
+
+    lat: float = None
+    lon: float = None
+    rudder: float = None
+    sail: float = None
+    heading: float = None
+    wind_speed: float = None
+    wind_dir: float = None
+    battery: float = None
+
+
+def _make_crc_table():
+    table = []
+    for byte in range(256):
+        crc = byte << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else (crc << 1)
+        table.append(crc & 0xFFFF)
+    return table
+
+
+_CRC_TABLE = _make_crc_table()
+
+
+def crc16(data):
+    """CRC-16/CCITT-FALSE (poly 0x1021, init 0xFFFF)"""
+    crc = 0xFFFF
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFF) ^ _CRC_TABLE[(crc >> 8) ^ byte]
+    return crc
+
+
+def encode_frame(frame_type, payload):
+    if len(payload) > MAX_PAYLOAD:
+        raise ValueError(f"Telemetry payload is {len(payload)} bytes, max is {MAX_PAYLOAD}")
+    body = _HEADER.pack(SYNC, VERSION, frame_type, len(payload)) + payload
+    return body + _CRC.pack(crc16(body[len(SYNC):]))
+
+
+def encode_data(data):
+    """Packs a TelemetryData into a DATA frame
+    Returns:
+        - (bytes) the complete frame ready to be sent to the transceiver
+    """
+    values = []
+    for (name, scale, sentinel), (low, high) in zip(_DATA_FIELDS, _DATA_LIMITS):
+        value = getattr(data, name)
+        if value is None or not math.isfinite(value):
+            values.append(sentinel)
+        else:
+            values.append(min(max(round(value * scale), low), high))
+    return encode_frame(TYPE_DATA, _DATA.pack(*values))
+
+
+def decode_data(payload):
+    values = _DATA.unpack(payload)
+    data = TelemetryData()
+    for (name, scale, sentinel), value in zip(_DATA_FIELDS, values):
+        setattr(data, name, None if value == sentinel else value / scale)
+    return data
+
+
+class TelemetryStream:
+    """
+    Splits a serial byte stream into telemetry frames and plain text lines
+        - The shore transceiver forwards both binary frames and the boat's text messages (ex. 'cfg ...') on one port
+        - Bytes can be fed in any size chunks, incomplete frames/lines are kept until the rest arrives
+
+    Attributes:
+        - frames (int): valid frames decoded
+        - errors (int): frames dropped for a bad CRC, version, type or length
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._text = bytearray()
+        self.frames = 0
+        self.errors = 0
+
+    def feed(self, data):
+        """
+        Args:
+            - data (bytes): bytes read from the serial port
+        Returns:
+            - list of TelemetryData (for DATA frames) and str (for complete text lines) in the order they arrived
+        """
+        self._buffer += data
+        out = []
+
+        while self._buffer:
+            start = self._buffer.find(SYNC)
+            if start == -1:
+                # keep a trailing first sync byte in case the second one is in the next chunk
+                keep = 1 if self._buffer[-1] == SYNC[0] else 0
+                self._add_text(self._buffer[:len(self._buffer) - keep], out)
+                del self._buffer[:len(self._buffer) - keep]
+                break
+
+            if start > 0:
+                self._add_text(self._buffer[:start], out)
+                del self._buffer[:start]
+
+            if len(self._buffer) < _HEADER.size:
+                break
+            _, version, frame_type, length = _HEADER.unpack_from(self._buffer)
+            if version != VERSION or PAYLOAD_SIZES.get(frame_type) != length:
+                self._drop_sync()
+                continue
+
+            frame_len = _HEADER.size + length + _CRC.size
+            if len(self._buffer) < frame_len:
+                break
+
+            (crc,) = _CRC.unpack_from(self._buffer, frame_len - _CRC.size)
+            if crc != crc16(self._buffer[len(SYNC):frame_len - _CRC.size]):
+                self._drop_sync()
+                continue
+
+            payload = bytes(self._buffer[_HEADER.size:frame_len - _CRC.size])
+            del self._buffer[:frame_len]
+            out.append(decode_data(payload))
+            self.frames += 1
+
+        return out
+
+    def _drop_sync(self):
+        self.errors += 1
+        del self._buffer[:1]
+
+    def _add_text(self, data, out):
+        self._text += data
+        *lines, rest = self._text.split(b"\n")
+        for line in lines:
+            line = line.decode(errors="ignore").strip()
+            if line:
+                out.append(line)
+        self._text = bytearray(rest)
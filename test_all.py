@@ -11,14 +11,35 @@ import pytest
 import warnings
 import cv2
 import numpy as np
-from time import time
+from time import time, sleep
 import keyboard
 import logging
+import json
+import queue
 
 import constants as c
 import camera
+import cameraStream
+from commandFilter import CommandFilter
+import telemetryFrame
+from heatmap import Heatmap
+import geodesy as geo
+import boatMath
 import objectDetection
+import simEngine
+import scenarioRunner
+import stateEstimator
+import nmeaReader
+import headingControl
+import controlLoop
+from polar import Polar
+import settings
+import boatLogging
+import flightRecorder
+import replay
+from windFilter import CircularMean, WindSnapshot
 from eventUtils import Waypoint, distance_between
+from types import SimpleNamespace
 
 DEVICE = c.config["MAIN"]["device"]
 
@@ -148,13 +169,13 @@ def test_img_detect(img="CV/test_buoy.jpg"):
         img (str): file path of selected image
     """
     # Basic model function can be tested by running `yolo predict model=CV/buoy_weights.pt source=0`
-    object_detection = objectDetection.ObjectDetection()
+    object_detection = objectDetection.ObjectDetection(backend="ultralytics")
 
-    object_detection.model.predict(source=img,
-                                   show=True,
-                                   conf=float(c.config["OBJECTDETECTION"]["conf_thresh"]),
-                                   save=False,
-                                   line_thickness=1)
+    object_detection.backend.model.predict(source=img,
+                                           show=True,
+                                           conf=float(c.config["OBJECTDETECTION"]["conf_thresh"]),
+                                           save=False,
+                                           line_thickness=1)
 
 
 #@pytest.mark.skipif(DEVICE != "pi", reason="only works on raspberry pi")
@@ -182,6 +203,397 @@ def test_survey():
         cv2.imshow("test_survey()", frame.img)
 
 
+def test_camera_stream():
+    stream = cameraStream.CameraStream(cameraStream.FakeSource(64, 48, fps=200), buffer_size=4).start()
+    try:
+        first_time, first = stream.read()
+        second_time, second = stream.read(after=first_time)
+        assert first.shape == (48, 64, 3)
+        assert second_time > first_time
+        assert stream.latest()[0] >= second_time
+    finally:
+        stream.stop()
+    assert stream.frames_captured >= 2
+    assert stream.errors == 0
+
+    class SlowSource:
+        """Hands back a frame that was already waiting when read() was called, 50ms later"""
+        def open(self):
+            self.count = 0
+
+        def read(self):
+            sleep(0.05)
+            self.count += 1
+            return np.full((2, 2, 3), self.count, dtype=np.uint8)
+
+        def close(self):
+            pass
+
+    stream = cameraStream.CameraStream(SlowSource(), buffer_size=4).start()
+    try:
+        sleep(0.01)  # in the middle of the first read
+        after = time()
+        stamp, img = stream.read(after=after)
+        # the first frame was being read before 'after', only the second one is newer
+        assert stamp > after and img[0, 0, 0] == 2
+    finally:
+        stream.stop()
+
+
+class FakeBackend:
+    """Stands in for a detection model: one low and one high confidence box per image, the x of both is the
+    image's first pixel value so results can be matched to images"""
+    def __init__(self, delay=0.0, error=None):
+        self.delay = delay
+        self.error = error
+        self.batches = []
+
+    def detect_batch(self, images, conf):
+        self.batches.append(len(images))
+        sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return [[objectDetection.Detection(image[0, 0, 0], 0, 5, 5, 0.5), objectDetection.Detection(image[0, 0, 0], 0, 5, 5, 0.9)]
+                for image in images]
+
+
+def test_analyze_batch(monkeypatch):
+    backend = FakeBackend()
+    monkeypatch.setattr(objectDetection, "load_model", lambda weights=None, **kwargs: backend)
+    detector = objectDetection.ObjectDetection()
+    images = [np.full((4, 4, 3), i, dtype=np.uint8) for i in range(5)]
+
+    results = detector.analyze_batch(images, batch_size=2)
+    assert backend.batches == [2, 2, 1] and detector.inference_count == 5
+    assert [detections[0].x for detections in results] == [0, 1, 2, 3, 4]
+    assert all([detection.conf for detection in detections] == [0.9, 0.5] for detections in results)
+
+
+def test_survey_detector(monkeypatch):
+    monkeypatch.setattr(objectDetection, "load_model", lambda weights=None, **kwargs: backend)
+
+    # every submitted frame gets its detections, in as few passes as frames queued up
+    backend = FakeBackend(delay=0.01)
+    timing = camera.SurveyTiming()
+    detector = camera.SurveyDetector(objectDetection.ObjectDetection(), timing)
+    frames = [SimpleNamespace(img=np.full((4, 4, 3), i, dtype=np.uint8), detections=[]) for i in range(4)]
+    for frame in frames:
+        detector.submit(frame)
+    detector.join()
+    assert [frame.detections[0].x for frame in frames] == [0, 1, 2, 3]
+    assert sum(backend.batches) == 4 and len(timing.detect) == len(backend.batches)
+
+    # a model error comes out of join()
+    backend = FakeBackend(error=ValueError("bad model"))
+    detector = camera.SurveyDetector(objectDetection.ObjectDetection(), camera.SurveyTiming())
+    detector.submit(frames[0])
+    with pytest.raises(ValueError, match="bad model"):
+        detector.join()
+
+    # a stuck model doesn't hang the survey
+    backend = FakeBackend(delay=1.0)
+    detector = camera.SurveyDetector(objectDetection.ObjectDetection(), camera.SurveyTiming())
+    detector.submit(frames[0])
+    detector.submit(frames[1])
+    with pytest.raises(RuntimeError, match="didn't finish"):
+        detector.join(timeout=0.05)
+    start = time()
+    detector.stop(timeout=0.05)
+    assert time() - start < 0.5
+
+
+def test_onnx_postprocess():
+    # the model isn't loaded, only the pre/post processing around it is checked
+    backend = objectDetection.OnnxBackend.__new__(objectDetection.OnnxBackend)
+    backend.input_w = backend.input_h = 640
+    backend.nms_iou = 0.7
+
+    # a portrait 320x480 image is scaled by 4/3 and centered with grey bars left and right
+    padded, scale, left, top = backend._letterbox(np.zeros((480, 320, 3), dtype=np.uint8))
+    assert padded.shape == (640, 640, 3) and abs(scale - 4 / 3) < 1e-9 and (left, top) == (106, 0)
+    assert (padded[:, :left] == 114).all() and (padded[:, left:left + 427] == 0).all() and (padded[:, left + 427:] == 114).all()
+
+    def candidate(x, y, w, h, *scores):
+        """A box in image pixels as the model outputs it: letterboxed cx, cy, w, h then class scores"""
+        return [x * scale + left, y * scale + top, w * scale, h * scale, *scores]
+
+    output = np.array([candidate(100, 200, 40, 60, 0.9, 0.1),
+                       candidate(102, 201, 40, 60, 0.1, 0.8),   # overlaps the first, suppressed
+                       candidate(250, 400, 20, 20, 0.6, 0.0),
+                       candidate(50, 50, 10, 10, 0.1, 0.2)],     # below the confidence threshold
+                      dtype=np.float32).T
+    detections = backend._postprocess(output, 0.25, scale, left, top)
+    boxes = sorted((detection.x, detection.y, detection.w, detection.h, detection.conf) for detection in detections)
+    assert boxes == [(100, 200, 40, 60, 0.9), (250, 400, 20, 20, 0.6)]
+    assert backend._postprocess(output, 0.95, scale, left, top) == []
+
+
+def test_onnx_symbolic_input(monkeypatch):
+    # models exported with dynamic axes name the batch, height and width instead of giving their size
+    class FakeSession:
+        def __init__(self, weights, sess_options=None, providers=None):
+            pass
+
+        def get_inputs(self):
+            return [SimpleNamespace(name="images", shape=["batch", 3, "height", "width"])]
+
+    ort = SimpleNamespace(SessionOptions=SimpleNamespace, InferenceSession=FakeSession,
+                          GraphOptimizationLevel=SimpleNamespace(ORT_ENABLE_ALL=99))
+    monkeypatch.setitem(sys.modules, "onnxruntime", ort)
+
+    backend = objectDetection.OnnxBackend("model.onnx", input_size=320)
+    assert (backend.input_h, backend.input_w, backend.batch_size) == (320, 320, None)
+    padded, scale, left, top = backend._letterbox(np.zeros((160, 320, 3), dtype=np.uint8))
+    assert padded.shape == (320, 320, 3) and scale == 1 and (left, top) == (0, 80)
+
+
+def detection(dx, dy, conf=0.8, center=Waypoint(33.0, -117.0)):
+    """A detection 'dx' meters east and 'dy' meters north of center"""
+    gps = Waypoint(center.lat, center.lon)
+    gps.add_meters(dx, dy)
+    return SimpleNamespace(gps=gps, conf=conf)
+
+
+def test_heatmap():
+    heatmap = Heatmap(chunk_radius=3)
+    first = heatmap.append(detection(0, 0))
+    assert heatmap.append(detection(1, 1)) is first
+    assert heatmap.append(detection(-2, 0.5)) is first
+    far = heatmap.append(detection(50, -20, conf=0.7))
+    assert far is not first
+    assert len(heatmap) == 2
+    assert first.detection_count == 3
+    assert detection(0, 2.5) in heatmap
+    assert detection(10, 10) not in heatmap
+    assert heatmap.get_highest_confidence_chunk() is first
+
+
+def test_heatmap_decay():
+    now = [0.0]
+    heatmap = Heatmap(chunk_radius=3, half_life=10, evict_below=0.2, clock=lambda: now[0])
+    old = heatmap.append(detection(0, 0, conf=0.9))
+    heatmap.append(detection(1, 0, conf=0.9))
+    now[0] = 20
+    new = heatmap.append(detection(40, 40, conf=0.7))
+    # 1.8 pooled 20s (two half-lives) ago is now worth 0.45
+    assert abs(heatmap.confidence(old) - 0.45) < 1e-9
+    assert heatmap.get_highest_confidence_chunk() is new
+
+    now[0] = 35
+    assert heatmap.get_highest_confidence_chunk() is new
+    assert old not in heatmap.chunks
+    assert heatmap.evicted == 1
+
+
+def test_geodesy():
+    frame = geo.LocalFrame(Waypoint(33.0, -117.0))
+    point = Waypoint(33.0, -117.0)
+    point.add_meters(30, -40)
+
+    east, north = frame.to_enu(point)
+    assert abs(east - 30) < 0.01 and abs(north + 40) < 0.01
+    assert abs(geo.norm((east, north)) - distance_between(frame.origin, point)) < 0.05
+    back = frame.to_waypoint((east, north))
+    assert abs(back.lat - point.lat) < 1e-9 and abs(back.lon - point.lon) < 1e-9
+
+    assert geo.side_of_line((0, 1), (0, 0), (1, 0)) == 1
+    assert geo.signed_distance_to_line((2, -3), (0, 0), (1, 0)) == -3
+    assert abs(geo.vector_to_bearing(geo.bearing_to_vector(135)) - 135) < 1e-9
+
+    gate = geo.Gate.through((0, 0), (10, 0), towards=(5, -1))
+    assert not gate.passed((5, 2)) and gate.passed((5, -2))
+
+
+def test_vectorized_geodesy():
+    points1 = np.array([[33.0, -117.0], [33.01, -117.02], [-10.0, 150.0]])
+    points2 = np.array([[33.001, -117.0], [33.0, -117.0], [-10.5, 150.3]])
+
+    distances = boatMath.haversine_array(points1, points2)
+    bearings = boatMath.bearing_array(points1, points2)
+    for i in range(len(points1)):
+        args = (*points1[i].tolist(), *points2[i].tolist())
+        assert abs(distances[i] - boatMath.haversine(*args)) < 1e-6
+        assert abs(bearings[i] - boatMath.initial_bearing(*args)) < 1e-9
+
+    # going back along the bearing lands on the start point
+    destinations = boatMath.destination_array(points1, bearings, distances)
+    assert np.allclose(destinations, points2, atol=1e-9)
+    assert abs(boatMath.haversine(33.0, -117.0, 33.001, -117.0) - 111.19) < 0.01
+
+
+
+def test_sim_engine():
+    config = simEngine.SimConfig(dt=0.1, wind_speed=5, wind_direction=0, gust_std=0, shift_std=0, current=(0, 0))
+    # 4 boats heading north (into the wind), east, south and west with the sail trimmed
+    sim = simEngine.Simulation(4, config=config, heading=np.array([0, 90, 180, 270]))
+    sim.run(lambda s: (0, s.optimal_sail(s.true_wind_angle())), duration=30)
+
+    assert sim.speed[0] < 0.01  # in irons
+    assert sim.speed[1] > 2 and abs(sim.speed[1] - sim.speed[3]) < 1e-9
+    assert sim.x[1] > 50 and sim.x[3] < -50 and sim.y[2] < -40
+    assert np.allclose(sim.heading, [0, 90, 180, 270])
+
+    # positive rudder turns counterclockwise
+    sim.step(rudder=45)
+    assert 85 < sim.heading[1] < 90
+
+
+def test_scenario_scoring():
+    # precision navigation: circle both buoys then come back through the start line
+    score = scenarioRunner.PrecisionNavigationScore((-5, 0), (5, 0), (-5, -50), (5, -50))
+    track = [(0, 0), (0, -40)]
+    for buoy in ((-5, -50), (5, -50)):
+        track += [geo.add(buoy, geo.polar(4, angle)) for angle in range(0, 361, 20)]
+    track += [(0, -10), (1, 5)]
+    for t, (previous, boat) in enumerate(zip(track, track[1:])):
+        score.update(previous, boat, t, 1)
+    assert score.result() == {"score": 10, "lap_time": len(track) - 2}
+
+    # station keeping: 4 minutes in the box then leave
+    score = scenarioRunner.StationKeepingScore([(-20, 20), (20, 20), (-20, -20), (20, -20)])
+    for t in range(400):
+        boat = (0, 0) if t < 240 else (0, 30)
+        score.update(boat, boat, t, 1)
+    assert score.result() == {"score": 8, "time_in_box": 240}
+
+
+def test_scenario_events():
+    modules = dict(sys.modules)  # install_sensors() replaces the sensor modules
+    try:
+        # one seed of every event runs to the end without the event code raising
+        scenarioRunner.install_sensors()
+        for event in scenarioRunner.EVENTS:
+            scenario = scenarioRunner.make_scenarios(event, 1, seed=2)[0]
+            scenario.duration = min(scenario.duration, 900)
+            result = scenarioRunner.run_scenario(scenario)
+            assert result.outcome in ("finished", "timeout"), (event, result.outcome, result.error)
+    finally:
+        sys.modules.clear()
+        sys.modules.update(modules)
+
+
+def test_state_estimator():
+    rng = np.random.default_rng(0)
+    config = simEngine.SimConfig(dt=0.05, wind_speed=5, wind_direction=0, gust_std=0, shift_std=0, current=(0, 0))
+    sim = simEngine.Simulation(1, config=config, heading=90)
+    ekf = stateEstimator.BoatEKF(gps_std=3, compass_std=5)
+
+    gps_errors, ekf_errors = [], []
+    for i in range(2400):
+        rudder = 5 * np.sin(sim.time / 10)
+        sim.step(rudder, sim.optimal_sail(sim.true_wind_angle()))
+        ekf.set_rudder(rudder)
+        if i % 20 == 0:
+            # 1 Hz GPS
+            noise = rng.normal(0, 3, 2)
+            fix = sim.frame.to_waypoint((sim.x[0] + noise[0], sim.y[0] + noise[1]))
+            ekf.update_gps(fix.lat, fix.lon, sim.time)
+            ekf.update_gps_velocity(sim.speed[0] + rng.normal(0, 0.3), sim.heading[0], sim.time)
+            if sim.time > 20:
+                gps_errors.append(np.hypot(*noise))
+        ekf.update_compass((sim.heading[0] + rng.normal(0, 5)) % 360, sim.time)
+
+        state = ekf.state(sim.time)
+        if sim.time > 20:
+            x, y = sim.frame.latlon_to_enu(state.latitude, state.longitude)
+            ekf_errors.append(np.hypot(x - sim.x[0], y - sim.y[0]))
+
+    assert np.mean(ekf_errors) < np.mean(gps_errors) / 2
+    assert abs(simEngine.wrap180(state.heading - sim.heading[0])) < 5
+    assert abs(state.speed - sim.speed[0]) < 0.5
+    assert state.position_std < 3
+
+
+def test_nmea_stream():
+    fixes = []
+    stream = nmeaReader.NMEAStream(rate=10, on_fix=fixes.append, serial_port=SimpleNamespace())
+    sentence = lambda body: nmeaReader.nmea_command(body).decode()
+
+    stream.feed(sentence("GPGGA,123519.00,4807.038,N,01131.000,W,1,08,0.9,545.4,M,46.9,M,,"))
+    stream.feed(sentence("GPGSV,1,1,00"))
+    assert fixes == []  # waits for the RMC of the same epoch
+    stream.feed(sentence("GPRMC,123519.00,A,4807.038,N,01131.000,W,022.4,084.4,230324,003.1,W"))
+    stream.feed("$GPGGA,123519.10,4807.038,N,01131.000,W,1,08,0.9,545.4,M,46.9,M,,*00")  # bad checksum
+    stream.feed(sentence("GPGGA,123519.20,4807.040,N,01131.000,W,1,09,0.8,545.4,M,46.9,M,,"))
+    stream.feed(sentence("GPRMC,123519.20,A,4807.040,N,01131.000,W,022.4,084.4,230324,003.1,W"))
+    stream.feed(sentence("GPRMC,123519.10,A,4807.038,N,01131.000,W,022.4,084.4,230324,003.1,W"))  # late
+
+    assert len(fixes) == 2
+    fix = fixes[0]
+    assert abs(fix.latitude - 48.1173) < 1e-9 and abs(fix.longitude + 11.516667) < 1e-6
+    assert fix.satellites == 8 and fix.hdop == 0.9 and fix.speed_knots == 22.4 and fix.track_angle_deg == 84.4
+    assert fix.time == 1711197319.0  # 2024-03-23 12:35:19 UTC
+    assert (stream.dropped, stream.late, stream.missed) == (1, 1, 1)
+
+
+def test_transceiver_reader(monkeypatch):
+    transceiver = pytest.importorskip("transceiver")  # pyserial and smbus2
+    assert transceiver.arduino.splitMessage("R 40 S 70 RO 0 SO 0") == ["R 40", "S 70"]
+    assert transceiver.arduino.splitMessage("mode 2 32.1 -117.2") == ["mode 2 32.1 -117.2"]
+
+    class FakeSerial:
+        """Fails the first two reads like a loose cable, then answers every poll"""
+        def __init__(self, *args, **kwargs):
+            self.timeout, self.reads, self.reopened = None, 0, 0
+
+        def write(self, data):
+            pass
+
+        def readline(self):
+            self.reads += 1
+            if self.reads <= 2:
+                raise OSError("device reports readiness to read but returned no data")
+            sleep(0.001)
+            return b"R 40 S 70 RO 0 SO 0\r\n"
+
+        def close(self):
+            pass
+
+        def open(self):
+            self.reopened += 1
+
+    monkeypatch.setattr(transceiver.serial, "Serial", FakeSerial)
+    monkeypatch.setattr(transceiver.smbus, "SMBus", lambda bus: None)
+    ardu = transceiver.arduino("/dev/null")
+
+    # a full queue keeps the newest messages and counts the ones it lost
+    size = ardu._queue.maxlen
+    for i in range(size + 3):
+        ardu._enqueue(f"S {i}")
+    assert ardu.dropped == 3
+    assert ardu.readMessages() == [f"S {i}" for i in range(3, size + 3)] and ardu.readMessages() == []
+
+    # the reader survives the failed reads, reopens the port and carries on
+    ardu.startReader(pollRate=1000)
+    try:
+        deadline = time() + 2
+        while ardu.ser1.reads < 5 and time() < deadline:
+            sleep(0.01)
+    finally:
+        ardu.stopReader()
+    assert ardu.errors == 2 and ardu.ser1.reopened == 2
+    assert ardu.readMessages()[:2] == ["R 40", "S 70"]
+
+
+def test_wind_filter():
+    # readings either side of north average to north, not south
+    mean = CircularMean(window=4)
+    for angle in (350, 10, 355, 5):
+        angle, steadiness = mean.add(angle)
+    assert min(angle, 360 - angle) < 1e-6 and steadiness > 0.98
+
+    # a vane swinging all over is unsteady, the window only keeps the latest readings
+    for angle in (0, 90, 180, 270):
+        _, steadiness = mean.add(angle)
+    assert steadiness < 1e-6
+    for _ in range(4):
+        angle, steadiness = mean.add(120)
+    assert abs(angle - 120) < 1e-6 and abs(steadiness - 1) < 1e-9
+
+    snapshot = WindSnapshot(angle=359.7, raw_angle=0.5, speed_proxy=1.0, time=0.0, samples=1)
+    assert snapshot.position == 359
+
+
 # ---------------------------------- CONTROLS ----------------------------------
 
 @pytest.mark.skipif(DEVICE != "pi", reason="only works on raspberry pi")
@@ -201,6 +613,210 @@ def test_sail():
     boat.adjustSail(45)
     assert 44 < boat.currentRudder < 46
 
+def test_command_filter():
+    """Repeated actuator commands are coalesced by deadband, rate limit and keepalive"""
+    cmd_filter = CommandFilter(deadband=1, max_rate=5, keepalive=2)
+
+    assert cmd_filter.should_send(10, now=0), "First command should always be sent"
+    assert not cmd_filter.should_send(10.5, now=0.1), "Change within deadband should be dropped"
+    assert not cmd_filter.should_send(12, now=0.1), "Change faster than max_rate should be held back"
+    assert cmd_filter.should_send(12, now=0.25), "Held back change should be sent once rate limit expires"
+    assert not cmd_filter.should_send(12, now=1)
+    assert cmd_filter.should_send(12, now=2.3), "Unchanged command should be resent after keepalive"
+    assert cmd_filter.should_send(12, force=True, now=2.31)
+
+def test_loop_stats(monkeypatch, caplog):
+    clock = SimpleNamespace(now=0.0)
+    monkeypatch.setattr(controlLoop, "time", SimpleNamespace(monotonic=lambda: clock.now))
+    stats = controlLoop.LoopStats(period=0.1, report_interval=1)
+
+    # (start, time spent in the tick): one tick starts 20ms late and one overruns the 100ms period
+    with caplog.at_level(logging.INFO):
+        for start, work in ((0.0, 0.01), (0.1, 0.02), (0.22, 0.15), (0.4, 0.01)):
+            clock.now = start
+            stats.start()
+            clock.now = start + work
+            stats.stop()
+        assert stats.ticks == 4 and stats.overruns == 1 and stats.period == 0.1
+        assert abs(stats.max_jitter - 0.08) < 1e-9 and abs(stats.max_exec - 0.15) < 1e-9
+        assert abs(stats.mean_exec - 0.0475) < 1e-9
+        assert sum("overran" in record.message for record in caplog.records) == 1
+        assert not any("ticks" in record.message for record in caplog.records)
+
+        # a summary once report_interval has passed
+        clock.now = 1.0
+        stats.start()
+        clock.now = 1.01
+        stats.stop()
+    assert any("5 ticks, 1 overruns" in record.message for record in caplog.records)
+
+
+def test_heading_controller():
+    assert headingControl.heading_error(1, 359) == 2 and headingControl.heading_error(359, 1) == -2
+
+    config = simEngine.SimConfig(dt=0.1, wind_speed=5, wind_direction=0, gust_std=0, shift_std=0, current=(0, 0))
+    for start, target in ((90, 150), (350, 80), (80, 350)):
+        sim = simEngine.Simulation(1, config=config, heading=start)
+        sim.run(lambda s: (0, s.optimal_sail(s.true_wind_angle())), duration=20)
+        controller = headingControl.HeadingController(kp=2, ki=0.1, kd=1.5, slew_rate=120, reference_speed=1.5)
+        for i in range(400):
+            rudder = controller.update(start if i < 5 else target, sim.heading[0], sim.time, speed=sim.speed[0])
+            assert abs(rudder) <= 45
+            sim.step(rudder, sim.optimal_sail(sim.true_wind_angle()))
+
+        assert abs(headingControl.heading_error(target, sim.heading[0])) < 3
+        step = controller.last_step
+        assert step is not None and step.settling_time is not None and step.overshoot < 10
+
+def test_polar():
+    polar = Polar([0, 45, 90, 180], [4, 8], [[0, 0], [2, 4], [3, 6], [2, 4]], sail=[3, 20, 45, 90])
+    assert abs(polar(90, 4) - 3) < 1e-9 and abs(polar(-90, 8) - 6) < 1e-9  # port and starboard are the same
+    assert abs(polar(67.5, 6) - 3.75) < 1e-9 and abs(polar(90, 2) - 1.5) < 1e-9 and polar(90, 20) == polar(90, 8)
+    assert abs(polar.sail_angle(270) - 45) < 1e-9
+
+    # upwind the best VMG is a beat on the current tack, downwind it is straight at the target
+    heading, vmg = polar.vmg_heading(0, 0, 8, heading=30)
+    assert 45 <= heading < 90 and 0 < vmg < 4
+    assert polar.vmg_heading(0, 0, 8, heading=330)[0] == 360 - heading
+    assert polar.vmg_heading(90, 0, 8)[0] == 90
+    headings, _ = polar.vmg_heading(np.array([0, 90, 180]), 0, 8)
+    assert headings.shape == (3,) and headings[1] == 90
+
+    # fitting samples logged around each table angle gets the polar back
+    rng = np.random.default_rng(0)
+    twa, tws = rng.choice([45, 90, 180], 5000) + rng.normal(0, 1, 5000), rng.choice([4, 8], 5000)
+    fitted = Polar.fit(twa, tws, polar(twa, tws) * rng.uniform(0.8, 1, 5000), sail=polar.sail_angle(twa),
+                       angles=[0, 45, 90, 180], speeds=[4, 8], percentile=99)
+    assert np.allclose(fitted.table, polar.table, atol=0.15) and np.allclose(fitted.sail[1:], polar.sail[1:], atol=1)
+
+
+def test_settings(tmp_path):
+    path = tmp_path / "config.ini"
+    original = open("config.ini").read()
+
+    def write(text, mtime):
+        path.write_text(text)
+        os.utime(path, ns=(mtime, mtime))
+
+    write(original.replace("angle_margin_of_error", "angle_margin_of_eror").replace("no_go_angle = 45", "no_go_angle = x"), 1)
+    with pytest.raises(settings.SettingsError, match="no_go_angle .* not a float.*angle_margin_of_error is missing"):
+        settings.SettingsFile(str(path))
+
+    write(original, 2)
+    config = settings.SettingsFile(str(path))
+    assert config.current.angle_margin == 5 and config.current.rudder_mid_point == 45
+    changes = []
+    config.on_change(lambda old, new: changes.append((old.angle_margin, new.angle_margin)))
+    assert not config.reload()
+
+    write(original.replace("angle_margin_of_error = 5", "angle_margin_of_error = 8"), 3)
+    assert config.reload() and changes == [(5, 8)] and config.config["CONSTANTS"]["angle_margin_of_error"] == "8"
+
+    # a bad edit keeps the previous settings
+    write(original.replace("rudder_angle_max = 45", "rudder_angle_max = -50"), 4)
+    assert not config.reload() and config.current.rudder_angle_max == 45 and len(changes) == 1
+
+def test_logging(tmp_path):
+    logger = logging.getLogger("test_logging")
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    handler = boatLogging.DroppingQueueHandler(queue.Queue(2))
+    handler.addFilter(boatLogging.ModuleLevelFilter(logging.DEBUG, boatLogging.parse_levels("test_all: warning")))
+    ring = boatLogging.RingBuffer(capacity=3)
+    logger.addHandler(handler)
+    logger.addHandler(ring)
+
+    for i in range(5):
+        logger.info("tick %d", i)
+    logger.warning("late")
+    logger.error("full")
+    # info from this module is filtered, the queue keeps 2 records and counts the rest
+    assert handler.queue.qsize() == 2 and handler.dropped == 0
+    logger.error("dropped")
+    assert handler.dropped == 1
+    assert handler.queue.get_nowait().msg == "late"
+
+    ring.dump(tmp_path / "crash.jsonl")
+    entries = [json.loads(line) for line in open(tmp_path / "crash.jsonl")]
+    assert [entry["message"] for entry in entries] == ["late", "full", "dropped"]
+    assert entries[0]["level"] == "WARNING" and entries[0]["module"] == "test_all"
+
+# -------------------------------- TELEMETRY --------------------------------
+
+def test_telemetry_frame():
+    """Binary telemetry frames survive being split across reads and mixed with text messages"""
+    data = telemetryFrame.TelemetryData(lat=40.4433123, lon=-79.958, rudder=-12.3, sail=45, heading=359.9)
+    frame = telemetryFrame.encode_data(data)
+    assert len(frame) < len("DATA: -79.958,40.4433123,-12.3,45,359.9,N/a,N/a,N/a")
+
+    corrupted = bytearray(frame)
+    corrupted[8] ^= 0xFF
+    serial_bytes = b"cfg a : 1\n" + frame + bytes(corrupted) + b"hello\n" + frame
+
+    stream = telemetryFrame.TelemetryStream()
+    received = []
+    for i in range(0, len(serial_bytes), 3):
+        received += stream.feed(serial_bytes[i:i + 3])
+
+    frames = [msg for msg in received if isinstance(msg, telemetryFrame.TelemetryData)]
+    assert received[0] == "cfg a : 1"
+    assert len(frames) == 2 and stream.errors >= 1
+    assert abs(frames[0].lat - data.lat) < 1e-7 and frames[0].wind_speed is None
+
+    # a NaN reading is sent as missing and values that don't fit are clamped instead of failing to pack
+    data = telemetryFrame.TelemetryData(lat=float("nan"), lon=float("inf"), rudder=1e6, sail=-1e6, heading=-5,
+                                        wind_speed=1e9, wind_dir=359.9)
+    frame = telemetryFrame.TelemetryStream().feed(telemetryFrame.encode_data(data))[0]
+    assert frame.lat is None and frame.lon is None
+    assert frame.rudder == 3276.7 and frame.sail == -3276.7 and frame.heading == 0
+    assert frame.wind_speed == 655.34 and frame.wind_dir == 359.9
+
+
+def test_flight_recorder(tmp_path):
+    size = flightRecorder.RECORD.itemsize
+    # ~10 batches per file, keep ~2 files
+    recorder = flightRecorder.FlightRecorder(str(tmp_path), file_size_mb=(flightRecorder.HEADER_SIZE + 100 * size) / 1e6,
+                                             budget_mb=2.5 * (flightRecorder.HEADER_SIZE + 100 * size) / 1e6, batch_records=10)
+    for i in range(500):
+        recorder.record(time=1000.0 + i, lat=42.0, lon=-71.0, heading=i % 360, wind_angle=None, mode=2, event_state=i // 100)
+    recorder.note("mode", event="PN", event_info=[[42.0, -71.0]])
+    recorder.close()
+    assert [note["event"] for note in flightRecorder.read_notes(str(tmp_path))] == ["PN"]
+
+    files = flightRecorder.flight_files(str(tmp_path))
+    assert len(files) == 2 and recorder.dropped == 0
+    with open(files[-1], "ab") as f:
+        f.write(b"\0" * (size // 2))  # a record cut off by a power loss
+    data = flightRecorder.load(str(tmp_path))
+    assert len(data) == 200 and data["time"][0] == 1300 and np.all(np.diff(data["time"]) == 1)
+    assert np.isnan(data["wind_angle"]).all() and data["event_state"][-1] == 4 and data["mode"][0] == 2
+    assert len(flightRecorder.load(str(tmp_path), start=1450)) == 50
+
+
+def test_replay(tmp_path):
+    modules = dict(sys.modules)  # install_sensors() replaces the sensor modules
+    try:
+        # record a simulated precision navigation run, replaying it unchanged reproduces every decision
+        scenarioRunner.install_sensors()
+        recorder = flightRecorder.FlightRecorder(str(tmp_path), batch_records=100)
+        result = scenarioRunner.run_scenario(scenarioRunner.make_scenarios("PN", 1, seed=1)[0], recorder)
+        recorder.close()
+        assert result.outcome == "finished"
+
+        recording = replay.Recording.load(str(tmp_path))
+        event, event_info = recording.event_note()
+        replay.install(recording)
+        replayed, mismatches = replay.replay_event(recording, event, event_info)
+        assert event == "PN" and replayed == len(recording.samples) and mismatches == []
+
+        # moving the course by ~10m changes the waypoints
+        moved = [Waypoint(waypoint.lat + 1e-4, waypoint.lon) for waypoint in event_info]
+        _, mismatches = replay.replay_event(recording, event, moved)
+        assert any(mismatch.field == "waypoint" for mismatch in mismatches)
+    finally:
+        sys.modules.clear()
+        sys.modules.update(modules)
+
 # -------------------------------- MANUAL TESTS --------------------------------
 
 
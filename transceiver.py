@@ -10,8 +10,12 @@ except:
 import sys
 import smbus2 as smbus#,smbus2
 import time
+import logging
+from collections import deque
+from threading import Thread, Lock
 
 I2C_SLAVE_ADDRESS = 0x10
+MAX_RETRY_DELAY = 1.0   # seconds, longest the reader waits before retrying a failed port
 
 def ConvertStringsToBytes(src):
   converted = []
@@ -20,15 +24,111 @@ def ConvertStringsToBytes(src):
   return converted
 
 class arduino:
+    """
+    Attributes:
+        - dropped (int): messages thrown away because the reader's queue was full
+        - errors (int): failed polls or reads, the reader logs them, reopens the port and keeps going
+
+    Functions:
+        - startReader() - starts a background thread which polls the transceiver and queues its messages
+        - readMessages() - non-blocking, returns every message queued by the reader since the last call
+        - readData() - blocking, asks the transceiver for its data and waits for the reply
+    """
 
     def __init__(self, port_num):
         # connect to device on 'port_num'
         self.ser1 = serial.Serial(port_num, c.config['MAIN']['baudrate'], timeout = .5) 
         self.I2Cbus = smbus.SMBus(1)
 
+        self._writeLock = Lock()
+        self._queue = deque(maxlen=int(c.config['MAIN']['transceiver_queue_size']))
+        self._reader = None
+        self._readerRunning = False
+        self.dropped = 0
+        self.errors = 0
+
     def send(self, data):
         #print(data)
-        self.ser1.write(str(data).encode())
+        with self._writeLock:
+            self.ser1.write(str(data).encode())
+
+    def sendBytes(self, data):
+        # send raw bytes, ex. a binary telemetry frame from telemetryFrame.py
+        with self._writeLock:
+            self.ser1.write(data)
+
+    def startReader(self, pollRate=float(c.config['MAIN']['transceiver_poll_rate'])):
+        """Starts a thread which asks the transceiver for data 'pollRate' times a second and queues everything it sends back"""
+        if self._reader is not None:
+            return
+        self.pollInterval = 1 / pollRate
+        self.ser1.timeout = self.pollInterval
+        self._readerRunning = True
+        self._reader = Thread(target=self._readerLoop, daemon=True)
+        self._reader.start()
+
+    def stopReader(self):
+        self._readerRunning = False
+        if self._reader is not None:
+            self._reader.join(timeout=1)
+            self._reader = None
+
+    def readMessages(self):
+        """
+        Returns every message received since the last call without waiting on the serial port
+            - RC data is split into 'R {val}' and 'S {val}' messages like readData()
+        """
+        msgs = []
+        while self._queue:
+            msgs.append(self._queue.popleft())
+        return msgs
+
+    def _readerLoop(self):
+        nextPoll = 0
+        failures = 0    # in a row, for the back off
+        while self._readerRunning:
+            try:
+                now = time.monotonic()
+                if now >= nextPoll:
+                    self.send("?") # transceiver is programmed to respond to '?' with its data
+                    nextPoll = now + self.pollInterval
+                line = self.ser1.readline().decode(errors="ignore").strip()
+                failures = 0
+            except Exception as e:
+                # ex. the USB cable was knocked loose: RC and mode commands only arrive while this thread runs
+                self.errors += 1
+                failures += 1
+                if self.errors % 100 == 1:
+                    logging.error("transceiver read failed (%d so far): %s", self.errors, e)
+                time.sleep(min(self.pollInterval * 2 ** failures, MAX_RETRY_DELAY))
+                self._reopen()
+                continue
+
+            if line:
+                for msg in self.splitMessage(line):
+                    self._enqueue(msg)
+
+    def _reopen(self):
+        try:
+            with self._writeLock:
+                self.ser1.close()
+                self.ser1.open()
+        except Exception as e:
+            logging.debug("transceiver port not back yet: %s", e)
+
+    def _enqueue(self, msg):
+        if len(self._queue) == self._queue.maxlen:
+            self.dropped += 1
+        self._queue.append(msg)
+
+    @staticmethod
+    def splitMessage(line):
+        """Splits the transceiver's 'R {rudder} S {sail} RO {x} SO {y}' reply into rudder and sail messages,
+        anything else (ex. commands relayed from the GUI) is passed through unchanged"""
+        splits = line.split(" ")
+        if len(splits) >= 4 and splits[0] == "R" and splits[2] == "S":
+            return [F"{splits[0]} {splits[1]}", F"{splits[2]} {splits[3]}"]
+        return [line]
 
     def readData(self):
         # get data from transceiver
@@ -68,6 +168,9 @@ if __name__ == "__main__":
     
     time.sleep(1)
     print("start2")
+    ardu.startReader()
     while True:
-        print(ardu.readData())
+        for msg in ardu.readMessages():
+            print(msg)
+        time.sleep(.1)
 
@@ -0,0 +1,64 @@
+"""
+Filtering of windvane readings, kept apart from windvane.py so it runs (and is tested) without the hardware
+    - Angles are averaged as unit vectors (circular mean): readings either side of 0/360 average to ~0, not 180
+    - The mean resultant length of the window is kept as a wind speed proxy: 1 when every reading agrees (a breeze
+      holds the vane steady), towards 0 when the vane wanders (light air). It is relative, not m/s
+    - WindSnapshot is immutable, the sampler swaps in a new one after every reading so a reader gets one consistent
+      set of values from a single attribute load without locking
+"""
+import math
+from collections import deque
+from dataclasses import dataclass
+
+
+@dataclass(slots=True, frozen=True)
+class WindSnapshot:
+    """
+    One windvane sample and the filtered values after it
+
+    Attributes:
+        - angle (float): filtered wind angle relative to the bow, 0-360
+        - raw_angle (float): the latest unfiltered reading
+        - speed_proxy (float): steadiness of the vane over the filter window, 0-1
+        - time (float): time.monotonic() of the reading
+        - samples (int): readings taken since the sampler started
+    """
+    angle: float
+    raw_angle: float
+    speed_proxy: float
+    time: float
+    samples: int
+
+    @property
+    def position(self):
+        """Whole degrees, like the old windVane.position"""
+        return int(self.angle) % 360
+
+
+class CircularMean:
+    """
+    Circular mean over the last 'window' angles
+
+    Functions:
+        - add() - add a reading, returns (mean angle, mean resultant length)
+        - reset() - forget the window, ex. after the encoder is re-zeroed
+    """
+
+    def __init__(self, window=10):
+        self.window = max(1, int(window))
+        self.reset()
+
+    def reset(self):
+        self._vectors = deque(maxlen=self.window)
+
+    def add(self, angle):
+        radians = math.radians(angle)
+        self._vectors.append((math.sin(radians), math.cos(radians)))
+        # summed again each time (the window is short) so rounding can't build up like a running sum
+        east = math.fsum(vector[0] for vector in self._vectors) / len(self._vectors)
+        north = math.fsum(vector[1] for vector in self._vectors) / len(self._vectors)
+        length = math.hypot(east, north)
+        if length < 1e-9:
+            # readings cancel out, no direction to report
+            return angle % 360, 0.0
+        return math.degrees(math.atan2(east, north)) % 360, min(length, 1.0)
@@ -1,17 +1,28 @@
 """
 reads value from I2C rotery encoder sensor
+    - A background thread reads the encoder at [WINDVANE] sample_rate, or whenever the seesaw's interrupt pin
+      (interrupt_pin) signals that the encoder moved, and swaps in a new WindSnapshot (windFilter.py)
+    - Readings are smoothed with a circular mean over the last filter_window seconds worth of samples (at sample_rate),
+      the window's steadiness is kept as a wind speed proxy
+    - The hall effect sensor re-zeros the encoder from a GPIO edge callback instead of being polled on every read
+    - angle/position only load the latest snapshot: no lock and no I2C traffic in the control loop
 """
+import logging
+import time
 from time import sleep
-from threading import Thread, Lock
-from queue import Queue
+from threading import Thread, Event
 import board
 from RPi import GPIO
 from adafruit_seesaw import seesaw, rotaryio, digitalio
 
 try:
     import sailbot.constants as c
+    import sailbot.settings as settings
+    from sailbot.windFilter import CircularMean, WindSnapshot
 except:
     import constants as c
+    import settings
+    from windFilter import CircularMean, WindSnapshot
 from utils import singleton
 
 
@@ -19,12 +30,26 @@ from utils import singleton
 class windVane():
     """
     Attributes:
-        angle (float): the angle of the wind (pointing towards the wind)
+        angle (float): the angle of the wind (pointing towards the wind), filtered
             - angle is relative to boat's heading, not angle to north?
+        position (int): angle in whole degrees
+        snapshot (WindSnapshot): the latest sample, use it when more than one value has to come from the same sample
         noGoMin (int): the lower range where the boat can't sail (irons)
         noGoMax (int): the upper range where the boat can't sail (irons)
+        errors (int): encoder reads that failed, the sampler logs them and keeps going
     """
-    def __init__(self):
+    def __init__(self, sampleRate=None, filterWindow=None, interruptPin=None):
+        """
+        Args:
+            - sampleRate, filterWindow, interruptPin: [WINDVANE] sample_rate, filter_window and interrupt_pin by default,
+              read when the windvane is created so a reloaded config.ini is used
+        """
+        if sampleRate is None:
+            sampleRate = float(c.config['WINDVANE']['sample_rate'])
+        if filterWindow is None:
+            filterWindow = float(c.config['WINDVANE']['filter_window'])
+        if interruptPin is None:
+            interruptPin = c.config['WINDVANE']['interrupt_pin']
 
         self.stepsPerRev = 256
 
@@ -32,26 +57,31 @@ class windVane():
         self.clk = 17
         self.dt = 18
         self.hef = 23
-        
-    
-        #self.q = Queue(0)
-        
+
         self.saw = seesaw.Seesaw (board.I2C(), 0x36)
         self.encoder = rotaryio.IncrementalEncoder(self.saw)
-        self.lock = Lock()
         GPIO.setmode(GPIO.BCM)
-        #GPIO.setup(self.clk, GPIO.IN, pull_up_down = GPIO.PUD_DOWN)
-        #GPIO.setup(self.dt, GPIO.IN, pull_up_down = GPIO.PUD_DOWN)
         GPIO.setup(self.hef, GPIO.IN, pull_up_down=GPIO.PUD_UP)
         self.offset = 0
-        self.counter = 0
-        #self.clkLastState = GPIO.input(self.clk)
-        #pump_thread = Thread(target=self.run)
-        #pump_thread.start()
-        
-        #pump_thread2 = Thread(target=self.flush_queue)
-        #pump_thread2.start()
-        
+        self.errors = 0
+        self._rezero = GPIO.input(self.hef) == False
+        # the magnet passing the hall effect sensor marks the zero position
+        GPIO.add_event_detect(self.hef, GPIO.FALLING, callback=self._hefCallback, bouncetime=20)
+
+        self.sampleInterval = 1 / sampleRate
+        self.filter = CircularMean(filterWindow * sampleRate)
+        self._wake = Event()
+        if interruptPin.strip():
+            # the seesaw pulls its interrupt pin low when the encoder moves
+            self.saw.enable_encoder_interrupt()
+            GPIO.setup(int(interruptPin), GPIO.IN, pull_up_down=GPIO.PUD_UP)
+            GPIO.add_event_detect(int(interruptPin), GPIO.FALLING, callback=lambda pin: self._wake.set())
+
+        self.snapshot = None
+        self._sample()  # so there is a reading before anyone asks
+        self._running = True
+        self._sampler = Thread(target=self._sampleLoop, name="windvane", daemon=True)
+        self._sampler.start()
 
     def map(self, x, min1, max1, min2, max2):
         # converts value x, which ranges from min1-max1, to a corresponding value ranging from min2-max2
@@ -62,73 +92,66 @@ class windVane():
 
     @property
     def angle(self):
-        counter = self.position
-        while (counter < 0):
-            counter += self.stepsPerRev
+        return self.snapshot.angle
 
-        counter = counter % self.stepsPerRev
-        return self.map(counter, 0, self.stepsPerRev-1, 0, 359)
-  
     @property
     def position(self):
-        self.lock.acquire()
-        self.checkHef()
-        val =  int( ((self.encoder.position * (360/self.stepsPerRev)) - self.offset)%360 )
-        self.lock.release()
-        return val
+        return self.snapshot.position
 
     @property
     def noGoMin(self):
-        return 360 - int(c.config['CONSTANTS']['noGoAngle'])/2
+        return 360 - settings.current().no_go_angle
 
     @property
     def noGoMax(self):
-        return int(c.config['CONSTANTS']['noGoAngle'])/2
-    """    
-    def flush_queue(self):
-        while True:
-            self.counter += self.q.get()
-    """
-    def run(self):
-        while True:
-            self.lock.acquire()
-            val = self.checkHef()
-            self.lock.release()
-            if not val:
-                sleep(.1)
-
-    def checkHef(self):
-        hefState = GPIO.input(self.hef)
-        if hefState == False:             
-            self.offset = int( (self.encoder.position * 1.8)%360)
-            return False
-        return True
+        return settings.current().no_go_angle
+
+    def stop(self):
+        self._running = False
+        self._wake.set()
+        self._sampler.join(timeout=1)
+
+    def _hefCallback(self, pin):
+        # runs on the GPIO library's thread, the encoder is only read by the sampler
+        self._rezero = True
+        self._wake.set()
+
+    def _sample(self):
+        steps = self.encoder.position
+        if self._rezero:
+            self._rezero = False
+            self.offset = steps
+            self.filter.reset()
+        rawAngle = ((steps - self.offset) * (360 / self.stepsPerRev)) % 360
+        angle, steadiness = self.filter.add(rawAngle)
+        previous = self.snapshot
+        # one assignment, readers see either the old snapshot or the new one
+        self.snapshot = WindSnapshot(angle, rawAngle, steadiness, time.monotonic(),
+                                     1 if previous is None else previous.samples + 1)
+
+    def _sampleLoop(self):
+        lastSample = time.monotonic()
+        while self._running:
+            # an encoder interrupt or the hall effect sensor samples straight away
+            self._wake.wait(max(0.0, lastSample + self.sampleInterval - time.monotonic()))
+            self._wake.clear()
+            lastSample = time.monotonic()
+            try:
+                self._sample()
+            except Exception as e:
+                # I2C errors, but also anything else from the seesaw library: the thread has to keep sampling.
+                # The last snapshot is kept, its time shows how old it is
+                self.errors += 1
+                if self.errors % 100 == 1:
+                    logging.warning("windvane read failed (%d so far): %s", self.errors, e)
+
 
-    """
-    def update(self):
-        
-        clkState = GPIO.input(self.clk)
-        dtState = GPIO.input(self.dt)
-        hefState = GPIO.input(self.hef)
-        if clkState != self.clkLastState:
-
-            if dtState != clkState:
-
-                self.q.put_nowait(1)
-                
-            else:
-                self.q.put_nowait(-1)
-
-            self.clkLastState = clkState
-        if hefState == False:
-            self.counter = 0
-       """     
 def main():
     wv = windVane()
     while True:
         sleep(.1)
-        print(F"Angle {wv.position}")
+        snapshot = wv.snapshot
+        print(F"Angle {snapshot.angle:.1f} raw {snapshot.raw_angle:.1f} steadiness {snapshot.speed_proxy:.2f}")
 
 if __name__ == '__main__':
     main()
-    